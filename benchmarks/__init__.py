@@ -0,0 +1,3 @@
+"""
+Luminest 性能基准测试脚本
+"""
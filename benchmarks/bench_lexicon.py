@@ -0,0 +1,99 @@
+"""
+危机词库预筛（DangerLexicon）单条消息耗时基准测试
+
+对一组典型的用户消息（多数不含危机词，少数命中或带否定）逐条执行预筛，报告每条消息的平均/P50/P99 耗时（微秒），
+并与逐词 `in` 查找的朴素实现对比。预筛在每条用户消息进入聊天服务之前同步执行，耗时应在微秒级。
+
+词库较小时逐词 `in`（C 实现的子串查找）更快；随词库增大，朴素实现的耗时线性增长，
+自动机的耗时只取决于消息长度。--sizes 用随机生成的词把词库扩充到指定大小，对比两者的变化。
+
+用法:
+    python -m benchmarks.bench_lexicon
+    python -m benchmarks.bench_lexicon --messages 200000 --lexicon data/danger_lexicon.json
+    python -m benchmarks.bench_lexicon --sizes 500,2000,10000
+"""
+import argparse
+import random
+import time
+from src.services.dangerLexicon import DangerLexicon, load_lexicon
+
+SAMPLES = [
+    "你好，今天天气怎么样？",
+    "最近工作压力有点大，晚上总是睡不好，白天也没什么精神。",
+    "我想和你聊聊我和室友之间的一些矛盾，不知道该怎么处理比较好。",
+    "周末去爬山了，风景很好，心情也放松了不少。",
+    "感觉做什么都提不起兴趣，也不想和别人说话，是不是我出了什么问题？",
+    "考试又没考好，爸妈肯定会骂我的，好烦啊。",
+    "我真的撑不下去了，每天都很痛苦，有时候会想到自杀。",
+    "放心吧，我不会自杀的，只是想找人说说话。",
+    "我已经写好遗书了，觉得活着没意思。",
+    "推荐几本适合睡前读的书吧，最好轻松一点的。",
+]
+
+
+def bench(fn, messages, repeat):
+    timings = []
+    for _ in range(repeat):
+        for message in messages:
+            start = time.perf_counter()
+            fn(message)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    n = len(timings)
+    return {
+        "avg_us": sum(timings) / n * 1e6,
+        "p50_us": timings[n // 2] * 1e6,
+        "p99_us": timings[min(n - 1, int(n * 0.99))] * 1e6,
+        "msgs_per_s": n / sum(timings),
+    }
+
+
+def naive_scan(terms):
+    items = list(terms.items())
+
+    def scan(text):
+        return [t for t, _ in items if t in text]
+    return scan
+
+
+def synthetic_terms(base, size, seed=0):
+    """在 base 的基础上补充随机的 2~4 字词（取自常用汉字区），直到词库达到 size 个词"""
+    rng = random.Random(seed)
+    terms = dict(base)
+    while len(terms) < size:
+        word = "".join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(rng.randint(2, 4)))
+        terms.setdefault(word, 0.3)
+    return terms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="危机词库预筛耗时基准测试")
+    parser.add_argument("--messages", type=int, default=100000, help="测试的消息总条数")
+    parser.add_argument("--lexicon", default=None, help="词库 JSON 文件，默认使用内置词库")
+    parser.add_argument("--sizes", default="500,2000", help="额外测试的扩充词库大小，逗号分隔，留空跳过")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    lexicon = load_lexicon(args.lexicon) if args.lexicon else DangerLexicon()
+    build_ms = (time.perf_counter() - start) * 1000
+    repeat = max(1, args.messages // len(SAMPLES))
+    print(f"词库 {len(lexicon.terms)} 个词，构建自动机 {build_ms:.2f} ms；测试 {repeat * len(SAMPLES)} 条消息，"
+          f"平均长度 {sum(map(len, SAMPLES)) / len(SAMPLES):.0f} 字")
+    for message in SAMPLES:
+        result = lexicon.scan(message)
+        hits = ",".join(("!" if m["negated"] else "") + m["term"] for m in result["matches"])
+        print(f"  {result['score']:.2f}  [{hits}]  {message}")
+
+    print(f"{'词库大小':<10}{'实现':<16}{'平均(us)':>10}{'P50(us)':>10}{'P99(us)':>10}{'条/秒':>12}")
+    lexicons = [lexicon]
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        lexicons.append(DangerLexicon(synthetic_terms(lexicon.terms, size), lexicon.negations))
+    for lex in lexicons:
+        for name, fn in (("aho-corasick", lex.scan), ("naive-in", naive_scan(lex.terms))):
+            r = bench(fn, SAMPLES, repeat)
+            print(f"{len(lex.terms):<14}{name:<16}{r['avg_us']:>10.2f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}"
+                  f"{r['msgs_per_s']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
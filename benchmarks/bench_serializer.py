@@ -0,0 +1,94 @@
+"""
+序列化编解码吞吐基准测试
+
+使用与实际存储一致的聊天记录和表情记录，对比标准库 json、orjson 与 msgpack
+的编码/解码吞吐（未安装的库会被跳过）。
+
+用法:
+    python -m benchmarks.bench_serializer
+    python -m benchmarks.bench_serializer --records 50000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+def make_chat(i: int) -> dict:
+    return {
+        "type": "chat",
+        "user_id": "",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "message": "最近总是睡不好，感觉做什么都提不起兴趣，也不想和别人说话。" * (1 + i % 3),
+        "timestamp": (datetime(2026, 1, 1) + timedelta(seconds=i)).isoformat(),
+    }
+
+
+def make_emotion(i: int) -> dict:
+    probs = [0.006803387941060105, 1.7e-15, 0.8277448964500609, 1.466e-09, 0.012025431291219536, 1.04e-07, 0.1534261785671802]
+    return {
+        "type": "emotion",
+        "user_id": "",
+        "trigger_message": "fear",
+        "timestamp": (datetime(2026, 1, 1) + timedelta(seconds=2 * i)).isoformat(),
+        "data": {"dominant_emotion": "fear", "emotions": dict(zip(EMOTIONS, probs))},
+        "note": "",
+    }
+
+
+def codecs():
+    """返回 {名称: (encode, decode)}"""
+    result = {
+        "json": (
+            lambda r: json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            json.loads,
+        ),
+    }
+    try:
+        import orjson
+        result["orjson"] = (orjson.dumps, orjson.loads)
+    except ImportError:
+        pass
+    try:
+        import msgpack
+        result["msgpack"] = (
+            lambda r: msgpack.packb(r, use_bin_type=True),
+            lambda b: msgpack.unpackb(b, raw=False),
+        )
+    except ImportError:
+        pass
+    return result
+
+
+def bench(encode, decode, records):
+    start = time.perf_counter()
+    blobs = [encode(r) for r in records]
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for b in blobs:
+        decode(b)
+    decode_s = time.perf_counter() - start
+    size = sum(len(b) for b in blobs) / len(blobs)
+    return len(records) / encode_s, len(records) / decode_s, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="序列化编解码吞吐基准测试")
+    parser.add_argument("--records", type=int, default=20_000, help="每类记录条数")
+    args = parser.parse_args()
+
+    datasets = {
+        "chat": [make_chat(i) for i in range(args.records)],
+        "emotion": [make_emotion(i) for i in range(args.records)],
+    }
+    print(f"{'dataset':<8} {'codec':<8} {'encode/s':>12} {'decode/s':>12} {'bytes/rec':>10}")
+    for dataset, records in datasets.items():
+        for name, (encode, decode) in codecs().items():
+            enc, dec, size = bench(encode, decode, records)
+            print(f"{dataset:<8} {name:<8} {enc:>12,.0f} {dec:>12,.0f} {size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
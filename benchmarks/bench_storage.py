@@ -0,0 +1,87 @@
+"""
+DataService 写入延迟基准测试
+
+对比旧版 JSON 数组存储与 JSONL 追加写存储在不同历史规模下单次 save_emotion 的耗时。
+
+用法:
+    python -m benchmarks.bench_storage
+    python -m benchmarks.bench_storage --sizes 1000 100000 --writes 20
+
+默认启用写后缓冲（Config.writeBehindEnabled），此时测得的是请求线程上的入队耗时；
+设置环境变量 WRITE_BEHIND=0 可测量同步落盘耗时。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from src.services.dataService import DataService
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+def make_emotion(i: int) -> dict:
+    ts = (datetime(2026, 1, 1) + timedelta(seconds=2 * i)).isoformat()
+    probs = {e: 1.0 / len(EMOTIONS) for e in EMOTIONS}
+    return {
+        "type": "emotion",
+        "user_id": "",
+        "trigger_message": "sad",
+        "timestamp": ts,
+        "data": {"dominant_emotion": "sad", "emotions": probs},
+        "note": "",
+    }
+
+
+def prepopulate(backend: str, data_dir: str, size: int) -> None:
+    """直接按各后端的文件格式写入 size 条历史记录"""
+    if backend == "json":
+        with open(os.path.join(data_dir, "emotions.json"), "w", encoding="utf-8") as f:
+            json.dump([make_emotion(i) for i in range(size)], f, ensure_ascii=False, indent=4)
+    else:
+        with open(os.path.join(data_dir, "emotions.jsonl"), "w", encoding="utf-8") as f:
+            for i in range(size):
+                f.write(json.dumps(make_emotion(i), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def bench(backend: str, size: int, writes: int) -> float:
+    """返回单次写入的中位耗时（毫秒）"""
+    data_dir = tempfile.mkdtemp(prefix=f"lum_bench_{backend}_")
+    try:
+        prepopulate(backend, data_dir, size)
+        service = DataService(data_dir=data_dir, backend=backend)
+        samples = []
+        for i in range(writes):
+            record = make_emotion(size + i)
+            start = time.perf_counter()
+            service.save_emotion({
+                "dominant_emotion": record["data"]["dominant_emotion"],
+                "emotions": record["data"]["emotions"],
+                "timestamp": record["timestamp"],
+            })
+            samples.append((time.perf_counter() - start) * 1000)
+        service.emotions_store.close()
+        return statistics.median(samples)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataService 写入延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--writes", type=int, default=10, help="每种规模下计时的写入次数")
+    parser.add_argument("--backends", nargs="+", default=["json", "jsonl"])
+    args = parser.parse_args()
+
+    print(f"{'records':>10} " + " ".join(f"{b + ' ms':>12}" for b in args.backends))
+    for size in args.sizes:
+        row = [bench(b, size, args.writes) for b in args.backends]
+        print(f"{size:>10} " + " ".join(f"{v:>12.3f}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
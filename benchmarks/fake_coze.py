@@ -0,0 +1,159 @@
+"""
+本地模拟 Coze OpenAPI，用于测试会话复用（COZE_REUSE_CONVERSATION）
+
+实现 CozeChatService 用到的两个接口：
+    POST /v1/conversation/create   创建服务端会话，保存初始消息
+    POST /v3/chat                  SSE 流式回复，按 conversation_id 累积消息
+
+每个请求打印请求体字节数与 additional_messages 条数，便于对比复用会话前后的上传量。
+用户消息中含有 "[dangerous]" 时，回复为 {"type": "dangerous", "message": ...} 形式的 JSON。
+会话只保存在内存中，重启模拟服务等同于服务端会话全部失效（用于验证本地重建）。
+
+用法:
+    python -m benchmarks.fake_coze --port 8765
+    COZE_BASE_URL=http://127.0.0.1:8765 COZE_API_TOKEN=fake COZE_REUSE_CONVERSATION=1 python runCli.py
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_conversations = {}
+_lock = threading.Lock()
+
+
+def _new_id() -> str:
+    return str(uuid.uuid4().int)[:19]
+
+
+class FakeCozeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, code: int, msg: str) -> None:
+        # Coze 以 HTTP 200 + 非零 code 表示业务错误
+        self._send_json(200, {"code": code, "msg": msg})
+
+    def do_POST(self):
+        raw = self._read_body()
+        body = json.loads(raw or b"{}")
+        path = self.path.split("?", 1)[0]
+        if path == "/v1/conversation/create":
+            self._create_conversation(raw, body)
+        elif path == "/v3/chat":
+            # 未指定会话时异步客户端会带上空的 conversation_id 参数
+            self._chat(raw, body, self._query("conversation_id") or None)
+        else:
+            self._send_error(4000, f"unknown path {path}")
+
+    def _query(self, name: str):
+        if "?" not in self.path:
+            return None
+        for pair in self.path.split("?", 1)[1].split("&"):
+            key, _, value = pair.partition("=")
+            if key == name:
+                return value
+        return None
+
+    def _create_conversation(self, raw: bytes, body: dict) -> None:
+        conversation_id = _new_id()
+        messages = body.get("messages") or []
+        with _lock:
+            _conversations[conversation_id] = list(messages)
+        print(f"[create] conversation={conversation_id} bytes={len(raw)} messages={len(messages)}")
+        self._send_json(200, {
+            "code": 0,
+            "msg": "",
+            "data": {
+                "id": conversation_id,
+                "created_at": int(time.time()),
+                "meta_data": {},
+                "last_section_id": conversation_id,
+            },
+        })
+
+    def _chat(self, raw: bytes, body: dict, conversation_id) -> None:
+        additional = body.get("additional_messages") or []
+        print(f"[chat] conversation={conversation_id} bytes={len(raw)} additional_messages={len(additional)}")
+        with _lock:
+            if conversation_id is not None and conversation_id not in _conversations:
+                history = None
+            else:
+                history = _conversations.setdefault(conversation_id, []) if conversation_id else []
+                history.extend(additional)
+        if history is None:
+            self._send_error(4200, f"conversation {conversation_id} not found")
+            return
+
+        chat_id = _new_id()
+        conversation_id = conversation_id or _new_id()
+        last = additional[-1].get("content", "") if additional else ""
+        reply = f"收到（上下文共 {len(history)} 条）：{last}"
+        if "[dangerous]" in last:
+            # 模拟智能体把回复标注为危险，用于测试危机信号流程
+            reply = json.dumps({"type": "dangerous", "message": reply}, ensure_ascii=False)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for char in reply:
+            self._send_event("conversation.message.delta", {
+                "id": chat_id, "conversation_id": conversation_id, "chat_id": chat_id,
+                "bot_id": body.get("bot_id", ""), "role": "assistant", "type": "answer",
+                "content": char, "content_type": "text",
+            })
+        self._send_event("conversation.chat.completed", {
+            "id": chat_id, "conversation_id": conversation_id, "bot_id": body.get("bot_id", ""),
+            "status": "completed",
+        })
+        self._send_event("done", "[DONE]")
+        with _lock:
+            if conversation_id in _conversations:
+                _conversations[conversation_id].append({"role": "assistant", "content": reply})
+        self.close_connection = True
+
+    def _send_event(self, event: str, data) -> None:
+        payload = f"event:{event}\ndata:{json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(payload.encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCozeServer(ThreadingHTTPServer):
+    # 并发压测时默认的监听队列 (5) 太小
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Coze OpenAPI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = FakeCozeServer((args.host, args.port), FakeCozeHandler)
+    print(f"模拟 Coze 服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Luminest ASGI 启动脚本（流式对话在协程中执行，适合大量并发的流式聊天）
+"""
+import uvicorn
+from src.asgi import create_asgi_app
+from src.services.model_manager import ensure_models
+
+
+if __name__ == "__main__":
+    # 预下载模型
+    ensure_models()
+    # 启动应用
+    app = create_asgi_app()
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=5000,
+        ssl_certfile=app.webapp.cert_file,
+        ssl_keyfile=app.webapp.key_file,
+    )
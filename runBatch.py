@@ -0,0 +1,8 @@
+"""
+Luminest 离线批量危机评分入口
+"""
+import sys
+from src.batchScoring import main
+
+if __name__ == "__main__":
+    sys.exit(main())
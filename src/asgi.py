@@ -0,0 +1,268 @@
+"""
+Luminest ASGI 入口
+
+/api/stream_chat 在事件循环中以协程流式输出（AsyncCoze），一个进程可以同时保持
+大量流式对话而不受线程数限制；其余路由仍由 Flask 处理，每个请求在独立的线程池线程中执行（ThreadedWsgi），
+打开的 SSE 连接（/api/signals/stream 等）只占用自己的线程，不会阻塞其他请求。
+
+用法:
+    python runAsgi.py
+    uvicorn src.asgi:create_asgi_app --factory --port 5000
+"""
+import asyncio
+import functools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from tempfile import SpooledTemporaryFile
+from asgiref.wsgi import WsgiToAsgiInstance
+from werkzeug.http import dump_cookie
+from src.config import Config
+from src.webapp import create_app
+from src.services.streamingReplyParser import StreamingReplyParser
+from src.services import serializer
+
+
+async def _inThread(fn, *args):
+    """在默认线程池中执行阻塞调用（磁盘读写等），不占用事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+class ThreadedWsgi:
+    """在线程池中执行 WSGI 应用的 ASGI 适配器
+
+    asgiref 的 WsgiToAsgi 把所有请求放到同一个线程中执行（thread_sensitive），一个长时间打开的流式响应
+    会阻塞其余全部请求；这里每个请求各占线程池中的一个线程。客户端断开后，流式响应在产出下一个片段时结束并关闭，
+    释放线程（SSE 接口空闲时会定期发送心跳，线程最迟在一个心跳间隔后释放）。
+    """
+
+    def __init__(self, wsgiApp, maxWorkers: int = 64):
+        self.wsgiApp = wsgiApp
+        self.executor = ThreadPoolExecutor(max_workers=max(1, maxWorkers), thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.wsgiApp, self.executor)(scope, receive, send)
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """单个请求：沿用 asgiref 的 environ 构建与 start_response，换成在指定线程池中执行"""
+
+    def __init__(self, wsgiApp, executor):
+        super().__init__(wsgiApp)
+        self.executor = executor
+        self.disconnected = threading.Event()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError('WSGI wrapper received a non-HTTP scope')
+        self.scope = scope
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            self.sync_send = lambda message: asyncio.run_coroutine_threadsafe(send(message), loop).result()
+            watcher = asyncio.ensure_future(self._watchDisconnect(receive))
+            try:
+                await loop.run_in_executor(self.executor, self._run, body)
+            finally:
+                watcher.cancel()
+
+    async def _watchDisconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+                return
+
+    def _run(self, body):
+        """在工作线程中执行 WSGI 应用并逐块发送响应"""
+        environ = self.build_environ(self.scope, body)
+        response = self.wsgi_application(environ, self.start_response)
+        try:
+            for output in response:
+                if self.disconnected.is_set():
+                    return
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if output:
+                    self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({'type': 'http.response.body'})
+        finally:
+            # 关闭响应（流式生成器在此执行其 finally，如取消信号订阅）
+            if hasattr(response, 'close'):
+                response.close()
+
+
+class AsgiApp:
+    """把原生协程路由与 Flask 应用组合为一个 ASGI 应用"""
+
+    def __init__(self, webapp):
+        self.webapp = webapp
+        self.wsgi = ThreadedWsgi(webapp.app, Config().asgiWsgiThreads)
+        flaskApp = webapp.app
+        self._sessionSerializer = flaskApp.session_interface.get_signing_serializer(flaskApp)
+        self._sessionCookieName = flaskApp.config.get('SESSION_COOKIE_NAME', 'session')
+        self._sessionLifetime = int(flaskApp.permanent_session_lifetime.total_seconds())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == '/api/stream_chat' and scope['method'] == 'POST':
+            await self.streamChat(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 写后缓冲等的落盘由 atexit 完成
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def streamChat(self, scope, receive, send):
+        """/api/stream_chat 的协程实现，请求与响应格式同 WebApp.streamChatApi"""
+        body = await self._readBody(receive)
+        try:
+            data = serializer.loads(body) if body else None
+        except Exception:
+            data = None
+        userMessage = data.get('message') if isinstance(data, dict) else None
+        if not userMessage:
+            await self._sendJson(send, {'response': "请输入有效的信息。"})
+            return
+        userId, cookie = self._currentUserId(scope, data)
+        # 词库预筛、信号与聊天记录的读写都在线程池中执行，一次慢速磁盘访问不会拖住其他流式对话
+        provisional = await _inThread(self.webapp._screenMessage, userId, userMessage)
+
+        headers = [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]
+        if cookie:
+            headers.append((b'set-cookie', cookie.encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watchDisconnect(receive, disconnected))
+        stream = self.webapp.chatService.processStreamMessageAsync(userMessage, userId)
+        dangerous_handled = False
+        try:
+            parser = StreamingReplyParser()
+            async for chunk in stream:
+                if disconnected.is_set():
+                    # 客户端已断开，不再继续消耗上游输出
+                    break
+                try:
+                    text, dangerous = self.webapp._chunkText(chunk)
+                    out_text = parser.feed(text)
+                    if (dangerous or parser.dangerous) and not dangerous_handled:
+                        # 只记录信号并提交后台分析任务，不阻塞事件循环
+                        await _inThread(self.webapp._recordDangerousChat, userId, userMessage, provisional)
+                        dangerous_handled = True
+                    if out_text:
+                        await self._sendEvent(send, {'chunk': out_text})
+                except Exception as e:
+                    print(f"Error processing chunk: {str(e)}")
+                    continue
+            out_text = parser.finish()
+            if out_text:
+                await self._sendEvent(send, {'chunk': out_text})
+        except Exception as e:
+            print(f"Error in stream chat API: {str(e)}")
+            await self._sendEvent(send, {'error': self.webapp._friendlyStreamError(e)})
+        finally:
+            await stream.aclose()
+            watcher.cancel()
+            await _inThread(self.webapp._settleProvisional, provisional, dangerous_handled)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    def _currentUserId(self, scope, body):
+        """解析当前请求的用户ID，规则同 WebApp._currentUserId
+
+        返回 (用户ID, 需要写回的 Set-Cookie 值或 None)。会话 Cookie 与 Flask 使用同一签名密钥，两边可以互认。
+        """
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        userId = headers.get('x-user-id')
+        if not userId and isinstance(body, dict) and isinstance(body.get('user_id'), str):
+            userId = body['user_id']
+        if not userId:
+            userId = self._sessionUserId(headers.get('cookie'))
+        cookie = None
+        if not userId:
+            userId = uuid.uuid4().hex
+            value = self._sessionSerializer.dumps({'user_id': userId, '_permanent': True})
+            cookie = dump_cookie(
+                self._sessionCookieName, value, max_age=self._sessionLifetime, path='/', httponly=True,
+                secure=scope.get('scheme') == 'https',
+            )
+        return userId.strip()[:128], cookie
+
+    def _sessionUserId(self, cookieHeader):
+        if not cookieHeader or self._sessionSerializer is None:
+            return None
+        morsel = SimpleCookie(cookieHeader).get(self._sessionCookieName)
+        if morsel is None:
+            return None
+        try:
+            data = self._sessionSerializer.loads(morsel.value, max_age=self._sessionLifetime)
+        except Exception:
+            return None
+        userId = data.get('user_id') if isinstance(data, dict) else None
+        return userId if isinstance(userId, str) else None
+
+    @staticmethod
+    async def _readBody(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _watchDisconnect(receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    @staticmethod
+    async def _sendEvent(send, data):
+        payload = f"data: {serializer.dumps(data)}\n\n".encode('utf-8')
+        await send({'type': 'http.response.body', 'body': payload, 'more_body': True})
+
+    @staticmethod
+    async def _sendJson(send, data):
+        payload = serializer.dumps(data).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+def create_asgi_app():
+    """创建 ASGI 应用（同时加载聊天历史、信号与用户喜好，对应 WebApp.run 中的启动步骤）"""
+    webapp = create_app()
+    webapp._loadHistory()
+    return AsgiApp(webapp)
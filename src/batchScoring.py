@@ -0,0 +1,410 @@
+"""
+Luminest 离线批量危机评分
+
+阈值或提示词调整后，对 data/ 下全部用户的历史聊天与表情记录重新评分：
+按时间顺序流式读取记录，按 (用户, 时间窗口) 分组，用进程池并行评分，结果逐行追加到 JSONL 结果文件。
+
+- 记录由 DataService.iter_chats / iter_emotions 流式读取并按时间归并，内存中只保留尚未结束的窗口；
+  默认包括数据保留轮转到 data/segments/ 与 data/archive/ 中的记录（已归档的表情为按分钟降采样的摘要），
+  --active-only 只评分活动文件中的记录
+- 同时在途的分组数不超过 2 × workers，读取速度自动与评分速度匹配，不会把全部分组堆在内存里
+- 评分器可替换：deepseek 调用模型（与综合评估页面同一提示词）；lexicon 只用本地危机词库，不访问网络，
+  用于测试；也可以写 模块路径:工厂函数 使用自定义评分器
+- 每完成一批分组写一次检查点（已完成的分组与结果文件长度），中断后用相同参数重新运行即从检查点继续，
+  检查点之后写入的半截结果会被截掉重算；评分失败的分组不记为完成，下次运行时重试
+- 运行中定期打印进度与吞吐量，结束时打印汇总
+
+结果文件每行一个分组：
+    {"group", "user_id", "window_start", "window_end", "chats", "emotions", "score", "interpretation",
+     "features", "result", "scorer", "elapsed_ms", "scored_at"}
+
+用法:
+    python runBatch.py --scorer lexicon
+    python runBatch.py --scorer deepseek --workers 4 --window 24 --output data/batch/crisis_scores.jsonl
+    python runBatch.py --scorer deepseek --user alice --since 2024-01-01 --restart
+"""
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import argparse
+import heapq
+import json
+import os
+import time
+from src.services.crisisScorers import Scorer, load_scorer
+
+_EPOCH = datetime(1970, 1, 1)
+# 工作进程内的评分器，由 _init_worker 创建
+_scorer: Optional[Scorer] = None
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value[:26]).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def iter_timeline(data_service, since: Optional[str] = None, until: Optional[str] = None,
+                  users: Optional[Iterable[str]] = None,
+                  include_rotated: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """按时间顺序归并聊天与表情记录，逐条产出 ('chat' | 'emotion', 记录)
+
+    include_rotated 为 True 时同时读取轮转出活动文件的分段与归档。
+    """
+    wanted = set(users) if users else None
+
+    def tagged(kind, records):
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            timestamp = record.get("timestamp") or ""
+            if (since and timestamp < since) or (until and timestamp >= until):
+                continue
+            if wanted is not None and record.get("user_id") not in wanted:
+                continue
+            yield timestamp, kind, record
+
+    merged = heapq.merge(
+        tagged("chat", data_service.iter_chats(include_rotated=include_rotated)),
+        tagged("emotion", data_service.iter_emotions(include_rotated=include_rotated)),
+        key=lambda item: item[0],
+    )
+    for _, kind, record in merged:
+        yield kind, record
+
+
+class WindowGrouper:
+    """把按时间排序的记录流切成 (用户, 时间窗口) 分组
+
+    窗口按 window 长度从 1970-01-01 起对齐；window 为 None 时每个用户的全部记录为一组。
+    记录流中的时间允许有一个窗口以内的乱序：只有落后当前记录超过一个窗口的分组才会结束并产出，
+    更晚到达的属于已结束窗口的记录计入 late，不再评分。
+    """
+
+    def __init__(self, window: Optional[timedelta]):
+        self.window = window
+        self.late = 0
+        self.invalid = 0
+        self._open: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+        self._closed_before: Optional[datetime] = None
+
+    def _window_start(self, moment: datetime) -> datetime:
+        return _EPOCH + ((moment - _EPOCH) // self.window) * self.window
+
+    def feed(self, kind: str, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """加入一条记录，返回因此结束的分组"""
+        moment = _parse_time(record.get("timestamp"))
+        if moment is None:
+            self.invalid += 1
+            return []
+        user_id = record.get("user_id") or ""
+        start = self._window_start(moment) if self.window is not None else _EPOCH
+        if self._closed_before is not None and start < self._closed_before:
+            self.late += 1
+            return []
+        group = self._open.get((user_id, start))
+        if group is None:
+            group = self._open[(user_id, start)] = self._new_group(user_id, start)
+        group["chats" if kind == "chat" else "emotions"].append(record)
+        if self.window is None:
+            return []
+        horizon = start - self.window
+        if self._closed_before is None or horizon > self._closed_before:
+            self._closed_before = horizon
+            return self._close(lambda key: key[1] < horizon)
+        return []
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """记录流结束，产出剩余的全部分组"""
+        return self._close(lambda key: True)
+
+    def _new_group(self, user_id: str, start: datetime) -> Dict[str, Any]:
+        whole = self.window is None
+        return {
+            "group": f"{user_id}|{'all' if whole else start.isoformat()}",
+            "user_id": user_id,
+            "window_start": None if whole else start.isoformat(),
+            "window_end": None if whole else (start + self.window).isoformat(),
+            "chats": [],
+            "emotions": [],
+        }
+
+    def _close(self, predicate) -> List[Dict[str, Any]]:
+        keys = sorted((key for key in self._open if predicate(key)), key=lambda key: (key[1], key[0]))
+        return [self._open.pop(key) for key in keys]
+
+
+def _init_worker(scorer_spec: str) -> None:
+    global _scorer
+    _scorer = load_scorer(scorer_spec)
+
+
+def _score_group(group: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中为一个分组评分，异常在这里捕获，作为 error 返回"""
+    start = time.perf_counter()
+    try:
+        result = _scorer(group["chats"], group["emotions"])
+        error = None
+    except Exception as e:
+        result, error = None, str(e) or type(e).__name__
+    return {"group": group["group"], "result": result, "error": error,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+class _InlineExecutor:
+    """workers 为 0 时在当前进程内依次评分（便于调试，或评分器无法在子进程中创建时使用）"""
+
+    def submit(self, fn, *args) -> Future:
+        future: Future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+
+class BatchScoringJob:
+    """一次批量评分：读取、分组、并行评分、写结果与检查点"""
+
+    def __init__(
+        self,
+        data_service,
+        scorer_spec: str,
+        output: str,
+        checkpoint: Optional[str] = None,
+        window_hours: float = 24,
+        workers: int = 4,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        users: Optional[List[str]] = None,
+        checkpoint_every: int = 20,
+        progress_interval: float = 5.0,
+        include_rotated: bool = True,
+    ):
+        self.data_service = data_service
+        self.scorer_spec = scorer_spec
+        self.output = output
+        self.checkpoint = checkpoint or output + ".checkpoint.json"
+        self.window = timedelta(hours=window_hours) if window_hours > 0 else None
+        self.workers = max(0, workers)
+        self.since = since
+        self.until = until
+        self.users = users or None
+        self.include_rotated = include_rotated
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.progress_interval = progress_interval
+        self.params = {
+            "scorer": scorer_spec,
+            "window_hours": window_hours,
+            "since": since,
+            "until": until,
+            "users": sorted(self.users) if self.users else None,
+            "data_dir": getattr(data_service, "data_dir", None),
+            "backend": getattr(data_service, "backend", None),
+            "include_rotated": include_rotated,
+        }
+        self.done: set = set()
+        self.stats = {"groups": 0, "skipped": 0, "failed": 0, "records": 0, "scored_records": 0}
+        self._results_bytes = 0
+        self._since_checkpoint = 0
+
+    # ---- 检查点 ----
+    def prepare(self, restart: bool = False) -> None:
+        """加载检查点并把结果文件截到检查点时的长度；restart 时丢弃旧的结果与检查点
+
+        检查点的参数与本次不同时抛出 ValueError，避免把不同口径的结果混在同一个文件里。
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        state = None
+        if not restart and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("params") != self.params:
+                raise ValueError(f"检查点 {self.checkpoint} 的参数与本次不同：{state.get('params')}，"
+                                 f"请使用相同参数继续，或加 --restart 重新开始")
+        if state is None:
+            # 没有检查点时结果文件中的内容无法确认完整，从头开始
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+            open(self.output, "w", encoding="utf-8").close()
+            return
+        self.done = set(state.get("done", []))
+        self._results_bytes = state.get("results_bytes", 0)
+        with open(self.output, "ab") as f:
+            if f.tell() > self._results_bytes:
+                f.truncate(self._results_bytes)
+        print(f"从检查点继续：已完成 {len(self.done)} 组")
+
+    def _write_checkpoint(self) -> None:
+        state = {
+            "params": self.params,
+            "results_bytes": self._results_bytes,
+            "done": sorted(self.done),
+            "stats": self.stats,
+            "updated_at": datetime.now().isoformat(),
+        }
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint)
+        self._since_checkpoint = 0
+
+    # ---- 运行 ----
+    def _groups(self, grouper: WindowGrouper) -> Iterator[Dict[str, Any]]:
+        for kind, record in iter_timeline(self.data_service, self.since, self.until, self.users, self.include_rotated):
+            self.stats["records"] += 1
+            yield from grouper.feed(kind, record)
+        yield from grouper.flush()
+
+    def run(self) -> Dict[str, Any]:
+        """执行评分，返回汇总统计"""
+        grouper = WindowGrouper(self.window)
+        if self.workers:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                           initargs=(self.scorer_spec,))
+        else:
+            _init_worker(self.scorer_spec)
+            executor = _InlineExecutor()
+        pending: Dict[Future, Dict[str, Any]] = {}
+        started = time.perf_counter()
+        try:
+            with open(self.output, "a", encoding="utf-8") as out:
+                try:
+                    self._run(out, executor, grouper, pending, started)
+                finally:
+                    # 中断时也记下已写入的结果，下次从这里继续
+                    self._write_checkpoint()
+        finally:
+            executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - started
+        self.stats.update({
+            "late": grouper.late,
+            "invalid": grouper.invalid,
+            "elapsed_s": round(elapsed, 3),
+            "groups_per_s": round(self.stats["groups"] / elapsed, 2) if elapsed else 0.0,
+            "records_per_s": round(self.stats["records"] / elapsed, 1) if elapsed else 0.0,
+        })
+        return self.stats
+
+    def _run(self, out, executor, grouper: WindowGrouper, pending: Dict[Future, Dict[str, Any]], started: float) -> None:
+        max_inflight = max(1, 2 * self.workers)
+        last_report = started
+        for group in self._groups(grouper):
+            if group["group"] in self.done:
+                self.stats["skipped"] += 1
+                continue
+            while len(pending) >= max_inflight:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._handle(out, pending.pop(future), future.result())
+            pending[executor.submit(_score_group, group)] = group
+            now = time.perf_counter()
+            if self.progress_interval and now - last_report >= self.progress_interval:
+                self._report(now - started, len(pending))
+                last_report = now
+        for future in wait(pending).done:
+            self._handle(out, pending.pop(future), future.result())
+
+    def _handle(self, out, group: Dict[str, Any], outcome: Dict[str, Any]) -> None:
+        if outcome["error"] is not None or not isinstance(outcome["result"], dict):
+            self.stats["failed"] += 1
+            print(f"分组 {group['group']} 评分失败: {outcome['error'] or '评分器未返回结果'}")
+            return
+        result = outcome["result"]
+        line = {
+            "group": group["group"],
+            "user_id": group["user_id"],
+            "window_start": group["window_start"],
+            "window_end": group["window_end"],
+            "chats": len(group["chats"]),
+            "emotions": len(group["emotions"]),
+            "score": result.get("score"),
+            "interpretation": result.get("interpretation"),
+            "features": result.get("features") or [],
+            "result": result,
+            "scorer": self.scorer_spec,
+            "elapsed_ms": outcome["elapsed_ms"],
+            "scored_at": datetime.now().isoformat(),
+        }
+        out.write(json.dumps(line, ensure_ascii=False) + "\n")
+        out.flush()
+        self._results_bytes = out.tell()
+        self.done.add(group["group"])
+        self.stats["groups"] += 1
+        self.stats["scored_records"] += line["chats"] + line["emotions"]
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._write_checkpoint()
+
+    def _report(self, elapsed: float, inflight: int) -> None:
+        s = self.stats
+        print(f"[{elapsed:7.1f}s] 已评分 {s['groups']} 组（跳过 {s['skipped']}，失败 {s['failed']}，进行中 {inflight}），"
+              f"已读取 {s['records']} 条记录；{s['groups'] / elapsed:.2f} 组/秒，{s['records'] / elapsed:.0f} 条/秒")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="离线批量危机评分")
+    parser.add_argument("--scorer", default="deepseek",
+                        help="评分器：deepseek、deepseek+validate、lexicon，或 模块路径:工厂函数")
+    parser.add_argument("--data-dir", default="data", help="数据目录")
+    parser.add_argument("--backend", default=None, help="存储后端，默认使用 STORAGE_BACKEND 配置")
+    parser.add_argument("--window", type=float, default=24, help="时间窗口长度（小时），0 表示每个用户的全部记录为一组")
+    parser.add_argument("--workers", type=int, default=4, help="评分进程数，0 表示在当前进程内依次评分")
+    parser.add_argument("--since", default=None, help="只评分该时间（含）之后的记录，ISO 格式")
+    parser.add_argument("--until", default=None, help="只评分该时间（不含）之前的记录，ISO 格式")
+    parser.add_argument("--user", action="append", default=None, help="只评分指定用户，可重复")
+    parser.add_argument("--output", default=os.path.join("data", "batch", "crisis_scores.jsonl"), help="结果文件")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件，默认为 结果文件.checkpoint.json")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="每完成多少组写一次检查点")
+    parser.add_argument("--progress", type=float, default=5.0, help="进度报告间隔（秒），0 表示不报告")
+    parser.add_argument("--restart", action="store_true", help="忽略已有检查点，从头开始")
+    parser.add_argument("--active-only", action="store_true",
+                        help="只评分活动文件中的记录，不读取 data/segments/ 与 data/archive/ 中轮转出的记录")
+    args = parser.parse_args(argv)
+
+    from src.services.dataService import DataService
+    from src.services.retentionService import rotated_files
+    rotated = rotated_files(args.data_dir, "chats") + rotated_files(args.data_dir, "emotions")
+    if rotated:
+        action = "跳过" if args.active_only else "读取"
+        print(f"{action}数据保留轮转出的分段/归档文件 {len(rotated)} 个")
+    try:
+        # 先在主进程创建一次评分器，参数错误时立即报错，而不是在每个工作进程里失败
+        load_scorer(args.scorer)
+    except Exception as e:
+        print(f"创建评分器失败: {e}")
+        return 1
+    job = BatchScoringJob(
+        DataService(args.data_dir, backend=args.backend),
+        args.scorer,
+        args.output,
+        checkpoint=args.checkpoint,
+        window_hours=args.window,
+        workers=args.workers,
+        since=args.since,
+        until=args.until,
+        users=args.user,
+        checkpoint_every=args.checkpoint_every,
+        progress_interval=args.progress,
+        include_rotated=not args.active_only,
+    )
+    try:
+        job.prepare(restart=args.restart)
+    except ValueError as e:
+        print(e)
+        return 1
+    try:
+        stats = job.run()
+    except KeyboardInterrupt:
+        print(f"已中断，已完成 {len(job.done)} 组，使用相同参数重新运行即可继续")
+        return 130
+    print(f"完成：评分 {stats['groups']} 组 / {stats['scored_records']} 条记录，跳过 {stats['skipped']} 组，"
+          f"失败 {stats['failed']} 组，迟到 {stats['late']} 条，时间无效 {stats['invalid']} 条；"
+          f"用时 {stats['elapsed_s']:.1f}s，{stats['groups_per_s']:.2f} 组/秒，{stats['records_per_s']:.0f} 条/秒")
+    print(f"结果: {job.output}")
+    return 0 if not stats["failed"] else 2
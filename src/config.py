@@ -2,6 +2,14 @@ from typing import Dict
 import os
 from dotenv import load_dotenv
 
+
+def _envFlag(name: str, default: bool) -> bool:
+    """读取布尔型环境变量"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
 class Config:
     """配置管理类"""
     _instance = None
@@ -25,4 +33,85 @@ class Config:
         
         # 聊天相关配置
         self.maxHistoryLength = 50
-        self.cozeCnBaseUrl = "https://www.coze.cn"
+        # Coze OpenAPI 地址（可指向本地模拟服务做测试）与智能体ID
+        self.cozeCnBaseUrl = os.getenv("COZE_BASE_URL", "https://api.coze.cn")
+        self.cozeBotId = os.getenv("COZE_BOT_ID", "7499749049093570598")
+        # 为每个会话复用 Coze 服务端会话：每轮只上传新消息，历史由服务端保存
+        self.cozeReuseConversation = _envFlag("COZE_REUSE_CONVERSATION", False)
+        # 上下文构建：窗口内消息的总字符预算，更早的消息折叠为不超过 contextSummaryChars 字的滚动摘要
+        self.contextCharBudget = int(os.getenv("CONTEXT_CHAR_BUDGET", "6000"))
+        self.contextSummaryChars = int(os.getenv("CONTEXT_SUMMARY_CHARS", "800"))
+        # 多会话管理：内存中最多保留的会话数、会话空闲淘汰秒数、每个会话保留的消息数
+        self.sessionMaxCount = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+        self.sessionIdleTimeout = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+        self.sessionMaxMessages = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+
+        # Web 会话：用于签名保存用户ID的会话 Cookie，未设置时自动生成并保存在 data/.flask_secret
+        self.flaskSecretKey = os.getenv("FLASK_SECRET_KEY")
+        # 同一用户相邻两帧危险表情间隔不超过该秒数时合并为一个发作片段信号，0 表示不合并
+        self.emotionEpisodeWindow = float(os.getenv("EMOTION_EPISODE_WINDOW", "60"))
+
+        # 危险信号实时推送（/api/signals/stream）：心跳间隔（秒）与断线重连补发缓冲条数
+        self.signalStreamHeartbeat = float(os.getenv("SIGNAL_STREAM_HEARTBEAT", "15"))
+        self.signalStreamBuffer = int(os.getenv("SIGNAL_STREAM_BUFFER", "500"))
+        # ASGI 方式运行时执行 Flask 路由的线程数；每个打开的 SSE 连接占用其中一个线程
+        self.asgiWsgiThreads = int(os.getenv("ASGI_WSGI_THREADS", "64"))
+
+        # 后台任务（危机分析等）：工作线程数、待执行任务上限；任务记录保存在 data/jobs.*
+        self.jobWorkers = int(os.getenv("JOB_WORKERS", "2"))
+        self.jobMaxPending = int(os.getenv("JOB_MAX_PENDING", "1000"))
+
+        # AI 分析调度：critical（实时危险分析）/ interactive（管理页面分析）/ batch（用户喜好）各自的并发上限，
+        # batch 调用等待超过 ANALYSIS_AGING 秒后提升为 interactive
+        self.analysisLimitCritical = int(os.getenv("ANALYSIS_LIMIT_CRITICAL", "4"))
+        self.analysisLimitInteractive = int(os.getenv("ANALYSIS_LIMIT_INTERACTIVE", "2"))
+        self.analysisLimitBatch = int(os.getenv("ANALYSIS_LIMIT_BATCH", "1"))
+        self.analysisAging = float(os.getenv("ANALYSIS_AGING", "30"))
+        # AI 分析编排：相互独立的分析调用并发执行；单个调用超时与一次分析的总时长预算（秒），线程池大小
+        self.analysisCallTimeout = float(os.getenv("ANALYSIS_CALL_TIMEOUT", "60"))
+        self.analysisBudget = float(os.getenv("ANALYSIS_BUDGET", "90"))
+        self.analysisWorkers = int(os.getenv("ANALYSIS_WORKERS", "8"))
+        # AI 分析结果缓存（危机指数、关键词、用户喜好、交叉验证）：按模型输入内容寻址，
+        # 内存中保留 ANALYSIS_CACHE_SIZE 条，条目有效期 ANALYSIS_CACHE_TTL 秒（0 为不过期），保存在 data/analysis_cache.*
+        self.analysisCacheEnabled = _envFlag("ANALYSIS_CACHE", True)
+        self.analysisCacheSize = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+        self.analysisCacheTtl = float(os.getenv("ANALYSIS_CACHE_TTL", "21600"))
+        # 增量危机指数：综合评估只把新增的聊天/表情记录与上次的结论、压缩摘要发给模型；
+        # 每次调用的新增对话字符数上限（积压记录分批处理）与摘要字符数上限，滚动状态保存在 data/crisis_state.*
+        self.crisisIncremental = _envFlag("CRISIS_INCREMENTAL", True)
+        self.crisisDeltaChars = int(os.getenv("CRISIS_DELTA_CHARS", "6000"))
+        self.crisisSummaryChars = int(os.getenv("CRISIS_SUMMARY_CHARS", "600"))
+        # 本地危机词库预筛：每条用户消息在调用上游服务之前先用词库打分，风险分（0~1）达到阈值时立即记录临时危险信号；
+        # 词库文件格式为 {"terms": {词: 权重}, "negations": [否定词]}，文件不存在时使用内置词库
+        self.dangerLexiconEnabled = _envFlag("DANGER_LEXICON", True)
+        self.dangerLexiconPath = os.getenv("DANGER_LEXICON_PATH", os.path.join("data", "danger_lexicon.json"))
+        self.dangerLexiconThreshold = float(os.getenv("DANGER_LEXICON_THRESHOLD", "0.6"))
+
+        # 命令行模式下记录使用的用户ID
+        self.cliUserId = os.getenv("CLI_USER_ID", "测试ID")
+
+        # 数据存储配置
+        # json: 旧版整文件 JSON 数组；jsonl: 追加写，每行一条记录（首次启动自动迁移旧文件）
+        # sqlite: data/luminest.db（WAL 模式，按 user_id/type + timestamp 建索引）
+        # msgpack: MessagePack 追加写（需要安装 msgpack）
+        self.storageBackend = os.getenv("STORAGE_BACKEND", "jsonl")
+        # 按用户分片：文件类后端的记录存放在 data/users/<用户ID>/ 下，data/users/index.json 为目录索引
+        self.storageSharding = _envFlag("STORAGE_SHARDING", False)
+
+        # 写后缓冲：记录先进入内存队列，由后台线程批量落盘
+        self.writeBehindEnabled = _envFlag("WRITE_BEHIND", True)
+        self.writeBehindBatchSize = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+        self.writeBehindFlushInterval = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))  # 秒
+        self.writeBehindFsyncInterval = float(os.getenv("WRITE_BEHIND_FSYNC_INTERVAL", "5"))  # 秒，0 表示每批都 fsync
+
+        # 表情识别结果额外写入列式二进制时间序列 data/emotions.frames（需要 numpy）
+        self.emotionSeriesEnabled = _envFlag("EMOTION_SERIES", True)
+
+        # 数据保留（仅 jsonl 后端，默认关闭）：活动文件按大小/年龄轮转为分段，旧分段后台压缩归档；
+        # 接口与会话加载只读取活动文件，轮转出去的记录不再出现在聊天历史、表情记录与统计中
+        self.retentionEnabled = _envFlag("RETENTION", False)
+        self.retentionMaxSegmentBytes = int(float(os.getenv("RETENTION_MAX_SEGMENT_MB", "32")) * 1024 * 1024)
+        self.retentionMaxSegmentAgeDays = float(os.getenv("RETENTION_MAX_SEGMENT_AGE_DAYS", "30"))
+        self.retentionCompactAfterDays = float(os.getenv("RETENTION_COMPACT_AFTER_DAYS", "90"))
+        self.retentionMinActiveDays = float(os.getenv("RETENTION_MIN_ACTIVE_DAYS", "7"))  # 近期记录始终留在活动文件中
+        self.retentionInterval = float(os.getenv("RETENTION_INTERVAL", "3600"))  # 秒
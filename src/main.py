@@ -7,6 +7,9 @@ from src.services.signalService import SignalService
 from src.services.analysisService import DeepseekAnalysisService
 from src.services.baiduAudioService import BaiduAudioService
 from src.services.deepfaceEmotionService import DeepfaceEmotionService
+from src.services.writeBehindStore import install_shutdown_handlers
+from src.services.retentionService import create_retention_service
+from src.config import Config
 import json
 import os
 
@@ -14,11 +17,16 @@ class LuminestCLI:
     """Luminest命令行界面类"""
     
     def __init__(self):
+        retention = create_retention_service()
+        if retention is not None:
+            retention.run_once()
         self.chat_service = CozeChatService()
         self.signal_service = SignalService()
         self.analysis_service = DeepseekAnalysisService()
         self.audio_service = BaiduAudioService()
         self.emotion_service = DeepfaceEmotionService()
+        # 命令行只服务本机一个用户，聊天、表情与信号记录都使用同一个用户ID
+        self.user_id = Config().cliUserId
         self.running = True
         
     def run(self):
@@ -45,21 +53,21 @@ class LuminestCLI:
         print("<<", text)
         
         # 分析情感
-        result = self.emotion_service.capture_and_analyze()
+        result = self.emotion_service.capture_and_analyze(user_id=self.user_id)
         depressed_data = self.emotion_service.is_depressed(result)
             # 仅当 depressed_data 为 dict 且非空时才调用 add_emotion_signal
         if isinstance(depressed_data, bool) and depressed_data:
-            self.signal_service.add_emotion_signal(result)
+            self.signal_service.add_emotion_signal(result, self.user_id)
         
         # 处理消息
-        result = json.loads(self.chat_service.processMessage(text))
+        result = json.loads(self.chat_service.processMessage(text, self.user_id))
         
         # 检查是否需要危险处理
         if result["type"] == "dangerous":
             print("检测到危险信息,开始危险处理")
-            history = self.chat_service.getChatHistory()
+            history = self.chat_service.getChatHistory(self.user_id)
             analysis = self.analysis_service.analyze_danger(history)
-            self.signal_service.add_dangerous_chat("测试ID", text, analysis)
+            self.signal_service.add_dangerous_chat(self.user_id, text, analysis)
             
         # 文字转语音并播放（使用临时文件避免文件锁）
         self.audio_service.text_to_speech(result["message"])
@@ -77,6 +85,7 @@ class LuminestCLI:
 
 def main():
     """主程序入口"""
+    install_shutdown_handlers()
     cli = LuminestCLI()
     cli.run()
     
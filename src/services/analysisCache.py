@@ -0,0 +1,265 @@
+from typing import List, Dict, Any, Optional, Callable, Iterable
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+from src.services.analysisService import BaseAnalysisService, CRISIS_UNSTRUCTURED
+from src.services.recordStore import BaseRecordStore, latest_versions
+
+# 提示词或结果格式变化时递增，使旧的缓存条目全部失效
+CACHE_VERSION = 1
+
+
+class AnalysisCache:
+    """按输入内容寻址的分析结果缓存
+
+    键为 (分析类型, 归一化后的模型输入) 的 SHA-256：输入不变则命中，输入变化自然得到新的键，不会返回过期结果。
+    内存中是容量为 max_entries 的 LRU，每个条目同时以 upsert 写入记录存储，重启后按过期时间重新加载；
+    被淘汰或失效的条目写入一条 evicted 标记，启动时压缩掉。
+
+    条目记录其输入涉及的记录类别（chat / emotion）和用户；有新记录写入时，涉及该用户该类记录的条目随之失效，
+    某类记录被清空或整体覆盖时，涉及该类记录的条目全部失效。
+    """
+
+    def __init__(self, store: Optional[BaseRecordStore] = None, max_entries: int = 256, ttl: float = 6 * 3600):
+        """
+        Args:
+            store: 持久化条目的记录存储，None 表示只缓存在内存中
+            max_entries: 内存中保留的条目数
+            ttl: 条目有效期（秒），0 表示不过期
+        """
+        self.store = store
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "evictions": 0, "expired": 0, "invalidated": 0}
+        self._load()
+
+    @staticmethod
+    def make_key(kind: str, *parts: Any) -> str:
+        """由分析类型与归一化输入计算缓存键"""
+        raw = json.dumps([CACHE_VERSION, kind, list(parts)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        """加载未过期的条目；同时把存储压缩为这些条目"""
+        if self.store is None:
+            return
+        try:
+            records = self.store.read_all()
+        except Exception as e:
+            print(f"加载分析缓存失败: {e}")
+            return
+        now = time.time()
+        live = [r for r in latest_versions(records) if not r.get("evicted") and not self._expired(r, now)]
+        live.sort(key=lambda r: r.get("last_used", 0))
+        live = live[-self.max_entries:]
+        if len(live) < len(records):
+            try:
+                self.store.replace(sorted(live, key=lambda r: r.get("timestamp", "")))
+            except Exception as e:
+                print(f"压缩分析缓存失败: {e}")
+        for record in live:
+            self._entries[record["id"]] = record
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        expires = entry.get("expires_at")
+        return expires is not None and now >= expires
+
+    def get_or_compute(
+        self,
+        key: str,
+        kind: str,
+        compute: Callable[[], Any],
+        sources: Iterable[str] = (),
+        users: Iterable[str] = (),
+        cacheable: Callable[[Any], bool] = bool,
+    ) -> Any:
+        """返回缓存结果；未命中时调用 compute() 并在 cacheable(结果) 为真时缓存
+
+        同一个键同时只计算一次，并发的相同请求等待并共享这次计算的结果。
+        sources / users 为输入涉及的记录类别与用户ID，用于新记录写入时的失效。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                self._drop(key, "expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["last_used"] = time.time()
+                self._stats["hits"] += 1
+                return entry["result"]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self._stats["misses"] += 1
+            else:
+                self._stats["shared"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        if cacheable(result):
+            self._put(key, kind, result, sources, users)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def _put(self, key: str, kind: str, result: Any, sources: Iterable[str], users: Iterable[str]) -> None:
+        now = time.time()
+        entry = {
+            "id": key,
+            "type": kind,
+            "user_id": "",
+            "result": result,
+            "sources": sorted(set(sources)),
+            "users": sorted(set(u for u in users if u)),
+            "timestamp": datetime.now().isoformat(),
+            "last_used": now,
+            "expires_at": now + self.ttl if self.ttl > 0 else None,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)), "evictions")
+        self._save(entry)
+
+    def _drop(self, key: str, reason: str) -> None:
+        """移除条目并在存储中写入 evicted 标记（需持有锁；标记在锁内写入，保证与随后的重新写入有序）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._stats[reason] += 1
+        self._save({"id": key, "type": entry.get("type"), "user_id": "", "evicted": True,
+                    "timestamp": datetime.now().isoformat()})
+
+    def _save(self, record: Dict[str, Any]) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.upsert(record)
+        except Exception as e:
+            print(f"保存分析缓存失败: {e}")
+
+    def on_record(self, kind: str, record: Optional[Dict[str, Any]]) -> None:
+        """DataService / SignalService 的监听回调：使依赖这类记录的条目失效
+
+        record 为 None（该类记录被清空或整体覆盖）时失效所有依赖该类记录的条目，
+        否则只失效输入中包含该记录所属用户的条目。
+        """
+        user_id = record.get("user_id") if isinstance(record, dict) else None
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if kind in entry.get("sources", ())
+                and (record is None or (user_id and user_id in entry.get("users", ())))
+            ]
+            for key in stale:
+                self._drop(key, "invalidated")
+
+    def clear(self) -> None:
+        """清空全部条目"""
+        with self._lock:
+            self._stats["invalidated"] += len(self._entries)
+            self._entries.clear()
+            if self.store is not None:
+                try:
+                    self.store.clear()
+                except Exception as e:
+                    print(f"清空分析缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中次数、命中率、当前条目数及按分析类型的条目数"""
+        with self._lock:
+            stats = dict(self._stats)
+            kinds: Dict[str, int] = {}
+            for entry in self._entries.values():
+                kinds[entry.get("type")] = kinds.get(entry.get("type"), 0) + 1
+            stats["entries"] = len(self._entries)
+            stats["kinds"] = kinds
+        lookups = stats["hits"] + stats["misses"] + stats["shared"]
+        stats["hit_rate"] = round((stats["hits"] + stats["shared"]) / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        return stats
+
+
+def _users_of(*record_lists: Iterable[Any]) -> List[str]:
+    users = set()
+    for records in record_lists:
+        for record in records or ():
+            if isinstance(record, dict) and record.get("user_id"):
+                users.add(record["user_id"])
+    return sorted(users)
+
+
+def _crisis_cacheable(result: Any) -> bool:
+    # 上游调用失败时 explanation 为空，不缓存
+    return isinstance(result, dict) and not (result.get("interpretation") == CRISIS_UNSTRUCTURED and not result.get("explanation"))
+
+
+class CachedAnalysisService(BaseAnalysisService):
+    """给分析服务加上结果缓存：危机指数、危机关键词、用户喜好与交叉验证按模型输入内容缓存
+
+    键取实际发给模型的输入（格式化后的对话文本、表情统计），与记录的时间戳等无关字段变化无关。
+    危机分析（analyze_danger）针对实时危险信号，每次都重新分析。调用失败的结果不缓存。
+    """
+
+    def __init__(self, service: BaseAnalysisService, cache: AnalysisCache):
+        self.service = service
+        self.cache = cache
+
+    def analyze_danger(self, history_messages: List[Dict], validate: bool = True) -> str:
+        return self.service.analyze_danger(history_messages, validate=validate)
+
+    def analyze_danger_keywords(self, history_messages: List[Dict]) -> str:
+        text = self.service._format_history(history_messages)
+        return self.cache.get_or_compute(
+            AnalysisCache.make_key("keywords", text), "keywords",
+            lambda: self.service.analyze_danger_keywords(history_messages),
+            sources=("chat",), users=_users_of(history_messages),
+        )
+
+    def analyze_crisis_index(self, history_messages: List[Dict], emotion_records: List[Dict], validate: bool = True) -> Dict:
+        text = self.service._crisis_index_input(history_messages, emotion_records)
+        return self.cache.get_or_compute(
+            AnalysisCache.make_key("crisis_index", text, validate), "crisis_index",
+            lambda: self.service.analyze_crisis_index(history_messages, emotion_records, validate=validate),
+            sources=("chat", "emotion"), users=_users_of(history_messages, emotion_records),
+            cacheable=_crisis_cacheable,
+        )
+
+    def analyze_preferences(self, history_messages: List[Dict]) -> Dict:
+        text = self.service._format_history(history_messages)
+        return self.cache.get_or_compute(
+            AnalysisCache.make_key("preferences", text), "preferences",
+            lambda: self.service.analyze_preferences(history_messages),
+            sources=("chat",), users=_users_of(history_messages),
+        )
+
+    def cross_validation(self, ai_response: str, **kwargs) -> str:
+        # 只依赖被验证的文本；危机指数命中缓存时，其交叉验证也随之命中
+        return self.cache.get_or_compute(
+            AnalysisCache.make_key("validation", ai_response), "validation",
+            lambda: self.service.cross_validation(ai_response, **kwargs),
+            cacheable=lambda r: bool(r) and r != "交叉验证失败",
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
@@ -0,0 +1,160 @@
+from typing import List, Dict, Any, Optional, Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import time
+
+# 单个调用的结束状态
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_SKIPPED = "skipped"  # 依赖的调用未成功，或整体预算已用完而未启动
+
+
+class AnalysisCall:
+    """编排中的一个分析调用
+
+    fn 接收已完成调用的结果字典（名称 -> 结果），只有 after 中列出的调用全部成功后才会启动；
+    没有依赖的调用在编排开始时一起启动。
+    """
+
+    __slots__ = ("name", "fn", "after", "timeout")
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Dict[str, Any]], Any],
+        after: Sequence[str] = (),
+        timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            name: 调用名称，作为结果事件的 name
+            fn: 执行调用的函数
+            after: 依赖的调用名称
+            timeout: 本调用的超时秒数，None 表示使用编排器的默认值
+        """
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.timeout = timeout
+
+
+class AnalysisOrchestrator:
+    """并发执行一组 AI 分析调用
+
+    相互独立的调用同时提交到线程池，有依赖的调用（如对某个结果的交叉验证）在其依赖完成后立即启动，
+    整体耗时取决于最长的一条依赖链，而不是所有调用耗时之和。每个调用结束（或超时）时立刻产出一个结果事件，
+    调用方可以边收边推送部分结果。
+
+    单个调用超过其超时、或整体超过 budget 秒时，不再等待该调用，产出 timeout 事件；
+    单个调用的超时从它在线程池中开始执行时计，排队等待空闲线程的时间只计入整体预算。
+    已在执行的上游请求无法中断，会在线程池中自然结束，其结果被丢弃。
+    """
+
+    def __init__(self, max_workers: int = 8, budget: float = 90.0, call_timeout: float = 60.0):
+        """
+        Args:
+            max_workers: 线程池大小（超时后仍在执行的调用也占用线程）
+            budget: 一次编排的默认总时长上限（秒）
+            call_timeout: 单个调用的默认超时（秒），从调用启动时计
+        """
+        self.budget = budget
+        self.call_timeout = call_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="analysis")
+
+    def run(self, calls: List[AnalysisCall], budget: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """执行一组调用，按完成顺序产出结果事件
+
+        事件格式: {"name", "status", "result", "error", "elapsed_ms"}，status 为 done / failed / timeout / skipped，
+        elapsed_ms 为从编排开始到该调用结束的毫秒数。每个调用恰好产出一个事件。
+        """
+        start = time.monotonic()
+        deadline = start + (self.budget if budget is None else budget)
+        names = {call.name for call in calls}
+        for call in calls:
+            missing = [dep for dep in call.after if dep not in names]
+            if missing:
+                raise ValueError(f"调用 {call.name} 依赖未知的调用: {', '.join(missing)}")
+
+        waiting = list(calls)
+        results: Dict[str, Any] = {}
+        finished = set()
+        running: Dict[Future, Any] = {}  # future -> (call, 超时秒数, 开始执行时间)
+
+        def event(name, status, result=None, error=None):
+            finished.add(name)
+            return {
+                "name": name,
+                "status": status,
+                "result": result,
+                "error": error,
+                "elapsed_ms": round((time.monotonic() - start) * 1000, 1),
+            }
+
+        def limit(now, timeout, started):
+            # 已开始执行：开始时间 + 超时；仍在排队：最早也要 now + timeout 才会超时
+            return min((started[0] if started else now) + timeout, deadline)
+
+        while waiting or running:
+            # 启动依赖已满足的调用；依赖失败的调用直接跳过
+            now = time.monotonic()
+            progressed = False
+            for call in list(waiting):
+                failed = [dep for dep in call.after if dep in finished and dep not in results]
+                if failed:
+                    waiting.remove(call)
+                    progressed = True
+                    yield event(call.name, STATUS_SKIPPED, error=f"依赖的调用未成功: {', '.join(failed)}")
+                elif all(dep in results for dep in call.after):
+                    waiting.remove(call)
+                    progressed = True
+                    if now >= deadline:
+                        yield event(call.name, STATUS_SKIPPED, error="分析总时长已超出预算")
+                        continue
+                    timeout = self.call_timeout if call.timeout is None else call.timeout
+                    started: List[float] = []
+                    future = self._executor.submit(self._timed, call.fn, dict(results), started)
+                    running[future] = (call, timeout, started)
+            if not running:
+                if not progressed:
+                    # 剩余调用相互依赖，永远无法启动
+                    for call in waiting:
+                        yield event(call.name, STATUS_SKIPPED, error="循环依赖")
+                    waiting = []
+                continue
+
+            # 尚未开始执行的调用最早在 now + timeout 超时，到时重新检查
+            now = time.monotonic()
+            nearest = min(limit(now, timeout, started) for _, timeout, started in running.values())
+            done, _ = wait(list(running), timeout=max(0.0, nearest - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                call = running.pop(future)[0]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"分析调用 {call.name} 失败: {e}")
+                    yield event(call.name, STATUS_FAILED, error=str(e))
+                else:
+                    results[call.name] = result
+                    yield event(call.name, STATUS_DONE, result=result)
+            now = time.monotonic()
+            for future, (call, timeout, started) in list(running.items()):
+                if not started and now < deadline:
+                    continue
+                if now >= limit(now, timeout, started):
+                    del running[future]
+                    future.cancel()
+                    reason = "分析总时长已超出预算" if now >= deadline else f"调用超过 {timeout:g} 秒未完成"
+                    print(f"分析调用 {call.name} 超时")
+                    yield event(call.name, STATUS_TIMEOUT, error=reason)
+
+    @staticmethod
+    def _timed(fn, results, started):
+        started.append(time.monotonic())
+        return fn(results)
+
+    def run_all(self, calls: List[AnalysisCall], budget: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """执行一组调用并等待全部结束，返回 名称 -> 结果事件"""
+        return {event["name"]: event for event in self.run(calls, budget)}
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,170 @@
+from typing import List, Dict, Any, Optional, Callable
+from collections import deque
+import threading
+import time
+from src.services.analysisService import BaseAnalysisService
+
+# 优先级类别，按优先级从高到低
+CRITICAL = "critical"        # 实时危险信号的危机分析
+INTERACTIVE = "interactive"  # 管理员页面触发的分析（危机指数、关键词）
+BATCH = "batch"              # 可以等待的分析（用户喜好）
+PRIORITIES = (CRITICAL, INTERACTIVE, BATCH)
+
+
+class _Ticket:
+    __slots__ = ("priority", "origin", "enqueued", "granted")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.origin = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class _ClassStats:
+    def __init__(self, window: int):
+        self.running = 0
+        self.completed = 0
+        self.promoted = 0
+        self.waits: "deque[float]" = deque(maxlen=window)
+
+
+class AnalysisScheduler:
+    """按优先级调度上游 AI 分析调用
+
+    每个优先级一个等待队列和一个并发上限，各级的并发名额互不占用：管理员页面的分析再多，
+    也不会占用 critical 的名额，实时危险信号的分析只需等待其它 critical 调用。
+    等待超过 aging 秒的调用提升一级（batch -> interactive），避免低优先级调用被长期饿死；
+    提升不会进入 critical，critical 的名额只留给实时危险分析。
+
+    调用在调用方线程中执行，调度器只决定何时放行。
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        aging: float = 30.0,
+        stats_window: int = 200,
+    ):
+        """
+        Args:
+            limits: 各优先级的并发上限，默认 critical 4 / interactive 2 / batch 1
+            aging: 等待多少秒后提升一级，0 表示不提升
+            stats_window: 统计等待时间时保留的最近调用数
+        """
+        self.limits = {CRITICAL: 4, INTERACTIVE: 2, BATCH: 1}
+        self.limits.update(limits or {})
+        self.aging = aging
+        self._cond = threading.Condition()
+        self._queues: Dict[str, "deque[_Ticket]"] = {p: deque() for p in PRIORITIES}
+        self._stats = {p: _ClassStats(stats_window) for p in PRIORITIES}
+
+    def run(self, priority: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """按优先级排队，轮到时在当前线程执行 fn(*args, **kwargs) 并返回其结果"""
+        if priority not in self._queues:
+            raise ValueError(f"未知的优先级: {priority}")
+        ticket = self._acquire(priority)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, priority: str) -> _Ticket:
+        ticket = _Ticket(priority)
+        with self._cond:
+            self._queues[priority].append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                # 带超时等待，使排队中的调用也能按时被提升
+                self._cond.wait(timeout=self.aging if self.aging > 0 else None)
+                if not ticket.granted:
+                    self._dispatch()
+        return ticket
+
+    def _release(self, ticket: _Ticket) -> None:
+        with self._cond:
+            stats = self._stats[ticket.priority]
+            stats.running -= 1
+            stats.completed += 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """提升等待过久的调用，然后按优先级放行有名额的调用（需持有锁）"""
+        if self.aging > 0:
+            self._promote(time.monotonic())
+        granted = False
+        for priority in PRIORITIES:
+            queue, stats = self._queues[priority], self._stats[priority]
+            while queue and stats.running < self.limits[priority]:
+                ticket = queue.popleft()
+                ticket.granted = True
+                stats.running += 1
+                self._stats[ticket.origin].waits.append(time.monotonic() - ticket.enqueued)
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _promote(self, now: float) -> None:
+        # batch 队列按入队时间有序，只需检查队首；提升后排在 interactive 队尾
+        queue = self._queues[BATCH]
+        while queue and now - queue[0].enqueued >= self.aging:
+            ticket = queue.popleft()
+            ticket.priority = INTERACTIVE
+            self._queues[INTERACTIVE].append(ticket)
+            self._stats[BATCH].promoted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """各优先级的排队数、执行中数量、并发上限、已完成数、被提升数及最近调用的等待时间（毫秒）"""
+        with self._cond:
+            result = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                waits = sorted(stats.waits)
+                queue = self._queues[priority]
+                result[priority] = {
+                    "queued": len(queue),
+                    "running": stats.running,
+                    "limit": self.limits[priority],
+                    "completed": stats.completed,
+                    "promoted": stats.promoted,
+                    "oldest_wait_ms": round((time.monotonic() - queue[0].enqueued) * 1000, 1) if queue else 0.0,
+                    "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                    "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                    "max_wait_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+                }
+            return result
+
+
+class ScheduledAnalysisService(BaseAnalysisService):
+    """给分析服务加上优先级调度：每个接口按其用途以固定优先级经 AnalysisScheduler 调用"""
+
+    def __init__(self, service: BaseAnalysisService, scheduler: AnalysisScheduler):
+        self.service = service
+        self.scheduler = scheduler
+
+    def analyze_danger(self, history_messages: List[Dict], validate: bool = True) -> str:
+        # validate 时包含随后的交叉验证，整体占用一个 critical 名额
+        return self.scheduler.run(CRITICAL, self.service.analyze_danger, history_messages, validate=validate)
+
+    def cross_validation(self, ai_response: str, priority: str = CRITICAL) -> str:
+        # 验证管理员页面的危机指数时以 interactive 调用，不占用实时危险分析的名额
+        return self.scheduler.run(priority, self.service.cross_validation, ai_response)
+
+    def analyze_danger_keywords(self, history_messages: List[Dict]) -> str:
+        return self.scheduler.run(INTERACTIVE, self.service.analyze_danger_keywords, history_messages)
+
+    def analyze_crisis_index(self, history_messages: List[Dict], emotion_records: List[Dict], validate: bool = True) -> Dict:
+        return self.scheduler.run(INTERACTIVE, self.service.analyze_crisis_index, history_messages, emotion_records,
+                                  validate=validate)
+
+    def analyze_crisis_index_delta(self, state: Dict, history_messages: List[Dict], emotion_records: List[Dict],
+                                   summary_chars: int = 600) -> Dict:
+        return self.scheduler.run(INTERACTIVE, self.service.analyze_crisis_index_delta, state, history_messages,
+                                  emotion_records, summary_chars=summary_chars)
+
+    def analyze_preferences(self, history_messages: List[Dict]) -> Dict:
+        return self.scheduler.run(BATCH, self.service.analyze_preferences, history_messages)
+
+    def __getattr__(self, name):
+        # 其余属性（如 _format_history）直接转发
+        return getattr(self.service, name)
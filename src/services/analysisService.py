@@ -4,6 +4,23 @@ import openai
 from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
 from ..config import Config
 
+# 危机指数未能解析出结构化 JSON 时的 interpretation
+CRISIS_UNSTRUCTURED = "AI未返回结构化JSON，已根据文本尝试推断"
+# analyze_danger 调用失败时返回的提示文本（不是分析结果）
+DANGER_UNAVAILABLE = "AI 服务暂不可用（余额或计费问题），无法生成危机分析。"
+DANGER_FAILED = "AI 服务调用失败，无法生成危机分析。"
+
+
+def is_danger_failure(analysis: str) -> bool:
+    """analyze_danger 的返回值是否表示调用失败（空结果或失败提示）"""
+    return not analysis or analysis in (DANGER_UNAVAILABLE, DANGER_FAILED)
+
+
+def with_validation(analysis: str, validation: str) -> str:
+    """把交叉验证结果附加到危机分析之后"""
+    return analysis + "\n\n\n以下为对分析结果多模型交叉验证的结果：\n" + validation
+
+
 class BaseAnalysisService(ABC):
     """AI分析服务基类"""
     
@@ -40,9 +57,8 @@ class DeepseekAnalysisService(BaseAnalysisService):
                 lines.append(f"{role}:{text}")
         return "\n".join(lines)
 
-    def analyze_danger_keywords(self, history_messages: List[Dict]) -> str:
-        """AI推测用户危机关键词"""
-        messages = [
+    def _keywords_messages(self, history_messages: List[Dict]) -> list:
+        return [
             ChatCompletionSystemMessageParam(
                 role="system",
                 content="""
@@ -57,6 +73,10 @@ class DeepseekAnalysisService(BaseAnalysisService):
                 content=self._format_history(history_messages)
             )
         ]
+
+    def analyze_danger_keywords(self, history_messages: List[Dict]) -> str:
+        """AI推测用户危机关键词"""
+        messages = self._keywords_messages(history_messages)
         try:
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
@@ -74,8 +94,8 @@ class DeepseekAnalysisService(BaseAnalysisService):
                 print(f'Deepseek analyze_danger_keywords 调用失败: {err}')
             return ""
         
-    def analyze_danger(self, history_messages: List[Dict]) -> str:
-        messages = [
+    def _danger_messages(self, history_messages: List[Dict]) -> list:
+        return [
             ChatCompletionSystemMessageParam(
                 role="system",
                 content="""
@@ -90,7 +110,10 @@ class DeepseekAnalysisService(BaseAnalysisService):
                 content=self._format_history(history_messages)
             )
         ]
-        
+
+    def analyze_danger(self, history_messages: List[Dict], validate: bool = True) -> str:
+        """危机分析；validate 为 False 时不附加交叉验证（由调用方另行并发执行）"""
+        messages = self._danger_messages(history_messages)
         print("Deepseek危机分析中...")
         try:
             response = self.client.chat.completions.create(
@@ -100,25 +123,27 @@ class DeepseekAnalysisService(BaseAnalysisService):
             )
             if response.choices[0].message.content is not None:
                 analysis = response.choices[0].message.content
+                if not validate:
+                    return analysis
                 try:
                     vidlie = self.cross_validation(analysis)
                 except Exception as e:
                     print(f"交叉验证失败: {e}")
                     vidlie = "交叉验证失败"
-                return analysis + "\n\n\n以下为对分析结果多模型交叉验证的结果：\n" + vidlie
+                return with_validation(analysis, vidlie)
             else:
                 return ""
         except Exception as e:
             err = str(e)
             if 'Insufficient Balance' in err or '402' in err:
                 print('Deepseek analyze_danger: 服务不可用（余额不足或计费问题）')
-                return 'AI 服务暂不可用（余额或计费问题），无法生成危机分析。'
+                return DANGER_UNAVAILABLE
             else:
                 print(f'Deepseek analyze_danger 调用失败: {err}')
-                return 'AI 服务调用失败，无法生成危机分析。'
+                return DANGER_FAILED
     
-    def cross_validation(self, ai_response: str) -> str:
-        messages = [
+    def _cross_validation_messages(self, ai_response: str) -> list:
+        return [
             ChatCompletionSystemMessageParam(
                 role="system",
                 content="""
@@ -132,6 +157,9 @@ class DeepseekAnalysisService(BaseAnalysisService):
                 content=ai_response
             )
         ]
+
+    def cross_validation(self, ai_response: str) -> str:
+        messages = self._cross_validation_messages(ai_response)
         print("Deepseek交叉验证中...")
         try:
             response = self.client.chat.completions.create(
@@ -176,9 +204,8 @@ class DeepseekAnalysisService(BaseAnalysisService):
         except Exception:
             return {"summary": content}
 
-    def analyze_crisis_index(self, history_messages: List[Dict], emotion_records: List[Dict]) -> Dict:
-        """综合聊天记录与表情识别记录，计算心理危机指数(0-100)，并输出说明、特征、建议与交叉验证结果。"""
-        # 1. 准备输入
+    def _crisis_index_input(self, history_messages: List[Dict], emotion_records: List[Dict]) -> str:
+        """危机指数的模型输入：对话文本 + 表情统计"""
         combined_text = self._format_history(history_messages)
         emotion_summary_lines = []
         counts = {}
@@ -197,30 +224,11 @@ class DeepseekAnalysisService(BaseAnalysisService):
             for k, v in counts.items():
                 emotion_summary_lines.append(f"{k}:{v}")
 
-        input_content = combined_text + "\n\n" + "\n".join(emotion_summary_lines)
-
-        system_prompt = (
-            "你是专业的心理健康分析师。请根据以下用户与智能体的全部对话和表情识别总结，计算一个心理危机指数（0-100，整数），"
-            "指数越高表示危机可能性越高。请同时输出：score（整数）、interpretation（简短含义）、features（导致高分的关键特征列表）、"
-            "explanation（给出评分的解释，3-5句）、suggestions（给专业心理专家的干预建议，50-150字）。以合法JSON格式返回以上字段。"
-        )
-
-        messages = [
-            ChatCompletionSystemMessageParam(role="system", content=system_prompt),
-            ChatCompletionUserMessageParam(role="user", content=input_content)
-        ]
-
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                temperature=0.7
-            )
-            content = response.choices[0].message.content or ""
-        except Exception as e:
-            print(f"analyze_crisis_index 调用失败: {e}")
-            content = ""
+        return combined_text + "\n\n" + "\n".join(emotion_summary_lines)
 
+    @staticmethod
+    def _parse_crisis_content(content: str) -> Dict:
+        """解析危机指数的模型输出，无法解析出 JSON 时从文本中尽量推断"""
         # 解析为 JSON（增强：支持提取 code-fence 中的 JSON 或文本内第一个 JSON 对象）
         import json as _json, re
         parsed = None
@@ -254,14 +262,51 @@ class DeepseekAnalysisService(BaseAnalysisService):
                     score = 0
             parsed = {
                 "score": score,
-                "interpretation": "AI未返回结构化JSON，已根据文本尝试推断",
+                "interpretation": CRISIS_UNSTRUCTURED,
                 "features": [],
                 "explanation": content.strip() or "",
                 "suggestions": "请查看原始AI输出",
                 "validation": "无"
             }
+        return parsed
+
+    def analyze_crisis_index(self, history_messages: List[Dict], emotion_records: List[Dict], validate: bool = True) -> Dict:
+        """综合聊天记录与表情识别记录，计算心理危机指数(0-100)，并输出说明、特征、建议与交叉验证结果。
+
+        validate 为 False 时不做交叉验证（validation 字段由调用方另行填写）。
+        """
+        # 1. 准备输入
+        input_content = self._crisis_index_input(history_messages, emotion_records)
+
+        system_prompt = (
+            "你是专业的心理健康分析师。请根据以下用户与智能体的全部对话和表情识别总结，计算一个心理危机指数（0-100，整数），"
+            "指数越高表示危机可能性越高。请同时输出：score（整数）、interpretation（简短含义）、features（导致高分的关键特征列表）、"
+            "explanation（给出评分的解释，3-5句）、suggestions（给专业心理专家的干预建议，50-150字）。以合法JSON格式返回以上字段。"
+        )
+
+        messages = [
+            ChatCompletionSystemMessageParam(role="system", content=system_prompt),
+            ChatCompletionUserMessageParam(role="user", content=input_content)
+        ]
+
+        try:
+            response = self.client.chat.completions.create(
+                model="deepseek-chat",
+                messages=messages,
+                temperature=0.7
+            )
+            content = response.choices[0].message.content or ""
+        except Exception as e:
+            print(f"analyze_crisis_index 调用失败: {e}")
+            content = ""
+
+        parsed = self._parse_crisis_content(content)
+
+        if not validate:
+            return parsed
 
         # 多模型交叉验证（保留原有行为）
+        import json as _json
         try:
             validation = self.cross_validation(_json.dumps(parsed))
             parsed['validation'] = validation
@@ -269,3 +314,56 @@ class DeepseekAnalysisService(BaseAnalysisService):
             print(f"交叉验证失败: {e}")
 
         return parsed
+
+    def analyze_crisis_index_delta(
+        self,
+        state: Dict,
+        history_messages: List[Dict],
+        emotion_records: List[Dict],
+        summary_chars: int = 600,
+    ) -> Dict:
+        """增量计算心理危机指数：只发送上次评估的结论（分数、特征、压缩摘要）与之后新增的对话和表情记录
+
+        返回字段同 analyze_crisis_index（不含交叉验证），另有 summary：合并新增内容后的压缩摘要，
+        作为下一次增量计算的输入。每次调用的输入长度取决于新增内容与摘要长度，与历史总长度无关。
+        """
+        previous = [
+            f"上次危机指数：{state.get('score', 0)}",
+            f"上次关键特征：{'、'.join(str(f) for f in state.get('features') or []) or '无'}",
+            f"此前全部记录的摘要：{state.get('summary') or '无'}",
+        ]
+        input_content = (
+            "\n".join(previous)
+            + "\n\n新增记录：\n"
+            + self._crisis_index_input(history_messages, emotion_records)
+        )
+
+        system_prompt = (
+            "你是专业的心理健康分析师。下面给出上一次的心理危机评估结论、此前全部对话的压缩摘要，以及此后新增的用户与智能体对话和表情识别统计。"
+            "请结合以往结论与新增内容，重新计算心理危机指数（0-100，整数），指数越高表示危机可能性越高。请同时输出：score（整数）、"
+            "interpretation（简短含义）、features（导致高分的关键特征列表）、explanation（给出评分的解释，3-5句）、"
+            "suggestions（给专业心理专家的干预建议，50-150字）、"
+            f"summary（把此前摘要与新增内容合并后的压缩摘要，保留与心理危机相关的事实与变化趋势，不超过{summary_chars}字）。"
+            "以合法JSON格式返回以上字段。"
+        )
+
+        messages = [
+            ChatCompletionSystemMessageParam(role="system", content=system_prompt),
+            ChatCompletionUserMessageParam(role="user", content=input_content)
+        ]
+
+        try:
+            response = self.client.chat.completions.create(
+                model="deepseek-chat",
+                messages=messages,
+                temperature=0.7
+            )
+            content = response.choices[0].message.content or ""
+        except Exception as e:
+            print(f"analyze_crisis_index_delta 调用失败: {e}")
+            content = ""
+
+        parsed = self._parse_crisis_content(content)
+        summary = parsed.get("summary")
+        parsed["summary"] = str(summary)[:summary_chars] if summary else (state.get("summary") or "")
+        return parsed
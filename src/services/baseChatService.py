@@ -1,22 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, Optional
 
 class BaseChatService(ABC):
     """聊天服务基类"""
     
     @abstractmethod
-    def processMessage(self, message: str) -> str:
-        """处理用户消息"""
+    def processMessage(self, message: str, user_id: str = "") -> str:
+        """处理用户消息，user_id 为发送消息的用户/会话ID"""
         pass
         
     @abstractmethod
-    def processStreamMessage(self, message: str) -> Generator:
-        """流式处理用户消息"""
+    def processStreamMessage(self, message: str, user_id: str = "") -> Generator:
+        """流式处理用户消息，user_id 为发送消息的用户/会话ID"""
         pass
         
     @abstractmethod
-    def getChatHistory(self) -> List[Dict]:
-        """获取聊天历史"""
+    def getChatHistory(self, user_id: str = "") -> List[Dict]:
+        """获取该用户的聊天历史"""
         pass
         
     @abstractmethod
@@ -30,8 +30,8 @@ class BaseChatService(ABC):
         pass
         
     @abstractmethod
-    def deleteChatHistory(self) -> None:
-        """删除聊天历史"""
+    def deleteChatHistory(self, user_id: Optional[str] = None) -> None:
+        """删除聊天历史，user_id 为 None 时删除全部用户的记录"""
         pass
         
     @abstractmethod
@@ -5,11 +5,12 @@ class BaseEmotionService(ABC):
     """表情分析服务基类"""
     
     @abstractmethod
-    def analyze_emotion(self, image_path: str) -> Dict:
+    def analyze_emotion(self, image_path: str, user_id: str = "") -> Dict:
         """分析图片中的表情
         
         Args:
             image_path: 图片文件路径
+            user_id: 图片所属的用户ID，用于保存识别记录
             
         Returns:
             Dict: 包含表情分析结果的字典
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 class BaseSignalService(ABC):
     """危险信号服务基类"""
@@ -10,8 +10,9 @@ class BaseSignalService(ABC):
         pass
         
     @abstractmethod
-    def add_dangerous_chat(self, user_id: str, content: str, analysis: str) -> None:
-        """添加一个危险对话记录"""
+    def add_dangerous_chat(self, user_id: str, content: str, analysis: Optional[str] = None,
+                           screening: Optional[Dict] = None) -> Dict:
+        """添加一个危险对话记录，analysis 为 None 表示分析稍后补充；screening 不为 None 时为本地预筛产生的临时信号"""
         pass
     
     @abstractmethod
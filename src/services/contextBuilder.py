@@ -0,0 +1,123 @@
+from typing import List, Dict, Any, Optional, Callable
+from collections import deque
+import threading
+
+
+class ContextWindow:
+    """单个会话的上下文缓存：已构建好的消息对象、滚动摘要及已处理到的最后一条消息"""
+
+    def __init__(self):
+        self.entries: deque = deque()  # (字符数, 消息对象, 角色, 文本, 会话中的原消息)
+        self.chars = 0
+        self.summary_lines: deque = deque()
+        self.summary_chars = 0
+        self.summary_message: Any = None
+        self.anchor: Optional[Dict[str, Any]] = None
+        self.lock = threading.Lock()
+
+
+class ContextBuilder:
+    """按字符预算增量构建对话上下文
+
+    每个会话缓存已构建的消息对象，每轮只为新增的消息构建对象；窗口内消息总字符数超过
+    char_budget（或条数超过 max_messages）时，最早的消息被移出窗口并折叠为一行摘要，
+    摘要按 summary_chars 滚动保留最近的部分，作为第一条上下文消息发送。
+    """
+
+    def __init__(
+        self,
+        build_message: Callable[[str, str], Any],
+        char_budget: int = 6000,
+        summary_chars: int = 800,
+        max_messages: int = 50,
+        summary_line_chars: int = 80,
+    ):
+        """
+        Args:
+            build_message: (角色, 文本) -> 上游接口使用的消息对象
+            char_budget: 窗口内消息的总字符数上限
+            summary_chars: 滚动摘要的字符数上限，0 表示不保留摘要
+            max_messages: 窗口内消息条数上限
+            summary_line_chars: 每条被折叠的消息在摘要中保留的字符数
+        """
+        self.build_message = build_message
+        self.char_budget = max(1, char_budget)
+        self.summary_chars = summary_chars
+        self.max_messages = max(1, max_messages)
+        self.summary_line_chars = summary_line_chars
+
+    def build(self, session, exclude: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """返回该会话本轮要发送的上下文消息（摘要 + 窗口内消息，时间顺序）
+
+        Args:
+            exclude: 不放入结果的会话消息（按对象身份比较），如本轮刚追加、另行发送的用户发言
+        """
+        window = session.context
+        if window is None:
+            window = session.context = ContextWindow()
+        with window.lock:
+            new_messages = self._new_messages(window, session)
+            for msg in new_messages:
+                self._add(window, msg)
+            result = []
+            if window.summary_lines:
+                if window.summary_message is None:
+                    window.summary_message = self.build_message(
+                        "user", "以下是较早对话的摘要：\n" + "\n".join(window.summary_lines)
+                    )
+                result.append(window.summary_message)
+            result.extend(entry[1] for entry in window.entries if entry[4] is not exclude)
+            return result
+
+    @staticmethod
+    def _new_messages(window: ContextWindow, session) -> List[Dict[str, Any]]:
+        """从会话末尾往前找到上次处理到的消息，返回其后的新消息；找不到时重建整个窗口"""
+        with session.lock:
+            messages = session.messages
+            new = []
+            for msg in reversed(messages):
+                if msg is window.anchor:
+                    break
+                new.append(msg)
+            else:
+                if window.anchor is not None:
+                    # 会话被清空或裁剪掉了上次处理到的位置
+                    window.entries.clear()
+                    window.chars = 0
+                    window.summary_lines.clear()
+                    window.summary_chars = 0
+                    window.summary_message = None
+            if messages:
+                window.anchor = messages[-1]
+        new.reverse()
+        return new
+
+    def _add(self, window: ContextWindow, msg: Dict[str, Any]) -> None:
+        if not isinstance(msg, dict):
+            return
+        # 兼容旧字段名 'content'，跳过没有实际文本的历史项
+        text = msg.get("message") if msg.get("message") is not None else msg.get("content")
+        if not text:
+            return
+        text = str(text)[:self.char_budget]
+        role = "user" if msg.get("role") == "user" else "assistant"
+        window.entries.append((len(text), self.build_message(role, text), role, text, msg))
+        window.chars += len(text)
+        while len(window.entries) > 1 and (window.chars > self.char_budget or len(window.entries) > self.max_messages):
+            size, _, old_role, old_text, _ = window.entries.popleft()
+            window.chars -= size
+            self._fold(window, old_role, old_text)
+
+    def _fold(self, window: ContextWindow, role: str, text: str) -> None:
+        """把移出窗口的消息压缩为一行并入滚动摘要"""
+        if self.summary_chars <= 0:
+            return
+        snippet = " ".join(text.split())
+        if len(snippet) > self.summary_line_chars:
+            snippet = snippet[:self.summary_line_chars] + "…"
+        line = f"{'用户' if role == 'user' else '助手'}：{snippet}"
+        window.summary_lines.append(line)
+        window.summary_chars += len(line)
+        while len(window.summary_lines) > 1 and window.summary_chars > self.summary_chars:
+            window.summary_chars -= len(window.summary_lines.popleft())
+        window.summary_message = None
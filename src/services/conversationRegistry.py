@@ -0,0 +1,62 @@
+from typing import Dict, Any, Optional
+from datetime import datetime
+import os
+import threading
+from src.services import serializer
+
+
+class ConversationRegistry:
+    """用户/会话 -> Coze 服务端会话 (conversation_id) 的持久化映射
+
+    保存在 data/coze_conversations.json。每个映射带一个 scope（智能体ID与创建时上下文的指纹），
+    scope 变化（换了智能体、用户喜好更新等）时视为没有会话，由调用方重新创建。
+    """
+
+    def __init__(self, path: str = os.path.join("data", "coze_conversations.json")):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = serializer.loads(f.read())
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"读取 Coze 会话映射失败: {e}")
+            return {}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(serializer.dumps_pretty(self._entries))
+        os.replace(tmp_path, self.path)
+
+    def get(self, user_id: str, scope: str) -> Optional[str]:
+        """返回该用户在该 scope 下的 conversation_id，没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.get("scope") != scope:
+                return None
+            return entry.get("conversation_id")
+
+    def set(self, user_id: str, scope: str, conversation_id: str) -> None:
+        with self._lock:
+            self._entries[user_id] = {
+                "scope": scope,
+                "conversation_id": conversation_id,
+                "updated_at": datetime.now().isoformat(),
+            }
+            self._save()
+
+    def drop(self, user_id: Optional[str] = None) -> None:
+        """删除该用户的映射；user_id 为 None 时删除全部"""
+        with self._lock:
+            if user_id is None:
+                self._entries = {}
+            elif self._entries.pop(user_id, None) is None:
+                return
+            self._save()
@@ -1,128 +1,273 @@
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, AsyncGenerator, Optional
+import asyncio
+import functools
+import hashlib
 import json
 import os
 from datetime import datetime
-from cozepy import Coze, TokenAuth, Message, ChatEventType, COZE_CN_BASE_URL
+from cozepy import Coze, AsyncCoze, TokenAuth, AsyncTokenAuth, Message, ChatEventType, CozeAPIError
 from src.services.baseChatService import BaseChatService
 from src.config import Config
+from src.services import serializer
 from src.services.dataService import DataService
+from src.services.sessionManager import SessionManager
+from src.services.contextBuilder import ContextBuilder
+from src.services.conversationRegistry import ConversationRegistry
+
+async def _inThread(fn, *args):
+    """在默认线程池中执行阻塞调用（会话加载、聊天记录写入等），不占用事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
 
 class CozeChatService(BaseChatService):
     """基于Coze的聊天服务实现"""
     
     def __init__(self):
         self.config = Config()
-        self.chatHistory = []
         # 使用 data/chat 作为聊天数据存储目录
         self.data_service = DataService()
+        # 每个用户/会话各自的对话状态，首次访问时从 DataService 懒加载
+        self.sessions = SessionManager(
+            loader=lambda user_id, limit: self.data_service.get_recent_chats(user_id, limit),
+            max_sessions=self.config.sessionMaxCount,
+            idle_timeout=self.config.sessionIdleTimeout,
+            max_messages=self.config.sessionMaxMessages,
+        )
+        self.preferences: Optional[Dict] = None
+        self._preferencesMessage: Optional[Message] = None
+        # 按字符预算增量构建上下文，已构建的 Message 对象按会话缓存
+        self.contextBuilder = ContextBuilder(
+            self._buildMessage,
+            char_budget=self.config.contextCharBudget,
+            summary_chars=self.config.contextSummaryChars,
+            max_messages=self.config.maxHistoryLength,
+        )
         token = self.config.cozeApiToken if self.config.cozeApiToken is not None else ""
         if not token:
             raise ValueError("Coze API token is missing. Please set cozeApiToken in the configuration.")
         self.coze = Coze(
             auth=TokenAuth(token=token),
-            base_url=COZE_CN_BASE_URL
+            base_url=self.config.cozeCnBaseUrl
         )
+        self._token = token
+        # 异步客户端在首次调用 processStreamMessageAsync 时于事件循环内创建
+        self._asyncCoze: Optional[AsyncCoze] = None
+        self.botId = self.config.cozeBotId
+        # 复用服务端会话时的 用户 -> conversation_id 映射
+        self.conversations = ConversationRegistry() if self.config.cozeReuseConversation else None
     
-    def processStreamMessage(self, message: str) -> Generator:
+    def processStreamMessage(self, message: str, user_id: str = "") -> Generator:
         """处理流式消息"""
         if not message:
             yield {"type": "error", "message": "请输入有效的信息。"}
             return
-        user_ts = datetime.now().isoformat()
-        self.chatHistory.append({"role": "user", "message": message, "timestamp": user_ts})
-        # 立即保存用户发言到 DataService
-        try:
-            self.data_service.save_chat(user_id="", message=message, role="user", timestamp=user_ts)
-        except Exception:
-            pass
-        context_messages = self._prepareContextMessages()
+        session, turn = self._beginTurn(message, user_id)
+        if self.conversations is not None:
+            events = self._streamInConversation(session, user_id, turn)
+        else:
+            events = self.coze.chat.stream(
+                bot_id=self.botId,
+                user_id=user_id or "random_string",
+                additional_messages=self._prepareContextMessages(session)
+            )
         current = ''
-        for event in self.coze.chat.stream(
-            bot_id="7499749049093570598",
-            user_id="random_string",
-            additional_messages=context_messages
-        ):
+        for event in events:
             if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
                 if event.message is not None and hasattr(event.message, "content"):
                     print(event.message.content, end="", flush=True)
                     current += event.message.content
                     yield {"type": "normal", "message": event.message.content}
-        self.chatHistory.append({"role": "assistant", "message": current})
-        # 保存助理回复
+        self._endTurn(session, user_id, current)
+
+    async def processStreamMessageAsync(self, message: str, user_id: str = "") -> AsyncGenerator:
+        """processStreamMessage 的异步版本（AsyncCoze），供 ASGI 服务在协程中流式输出
+
+        与同步版本共用会话状态、上下文构建与服务端会话映射；会话加载与记录读写在线程池中执行。
+        """
+        if not message:
+            yield {"type": "error", "message": "请输入有效的信息。"}
+            return
+        session, turn = await _inThread(self._beginTurn, message, user_id)
+        if self.conversations is not None:
+            events = self._streamInConversationAsync(session, user_id, turn)
+        else:
+            events = self._getAsyncCoze().chat.stream(
+                bot_id=self.botId,
+                user_id=user_id or "random_string",
+                additional_messages=self._prepareContextMessages(session)
+            )
+        current = ''
+        async for event in events:
+            if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+                if event.message is not None and hasattr(event.message, "content"):
+                    current += event.message.content
+                    yield {"type": "normal", "message": event.message.content}
+        await _inThread(self._endTurn, session, user_id, current)
+
+    def _beginTurn(self, message: str, user_id: str):
+        """把用户发言追加到会话并保存，返回 (会话, 追加的消息)"""
+        session = self.sessions.get(user_id)
+        user_ts = datetime.now().isoformat()
+        turn = {"role": "user", "message": message, "timestamp": user_ts}
+        session.append(turn)
+        # 立即保存用户发言到 DataService
+        try:
+            self.data_service.save_chat(user_id=user_id, message=message, role="user", timestamp=user_ts)
+        except Exception:
+            pass
+        return session, turn
+
+    def _endTurn(self, session, user_id: str, reply: str) -> None:
+        """保存助理回复"""
         assistant_ts = datetime.now().isoformat()
-        self.chatHistory[-1]["timestamp"] = assistant_ts
+        session.append({"role": "assistant", "message": reply, "timestamp": assistant_ts})
         try:
-            self.data_service.save_chat(user_id="", message=current, role="assistant", timestamp=assistant_ts)
+            self.data_service.save_chat(user_id=user_id, message=reply, role="assistant", timestamp=assistant_ts)
         except Exception:
             pass
 
-    def processMessage(self, message: str) -> str:
+    def _getAsyncCoze(self) -> AsyncCoze:
+        if self._asyncCoze is None:
+            self._asyncCoze = AsyncCoze(
+                auth=AsyncTokenAuth(token=self._token),
+                base_url=self.config.cozeCnBaseUrl
+            )
+        return self._asyncCoze
+
+    def _streamInConversation(self, session, user_id: str, turn: Dict) -> Generator:
+        """在该用户的 Coze 服务端会话中发送本轮消息，只上传新消息
+
+        没有会话时用本地历史创建一个；服务端会话已失效（请求在产生任何事件前出错）时重建一次。
+        """
+        conversation_id = self.conversations.get(user_id, self._conversationScope())
+        if conversation_id is None:
+            conversation_id = self._createConversation(session, user_id, turn)
+        started = False
+        try:
+            for event in self._chatInConversation(conversation_id, user_id, turn["message"]):
+                started = True
+                yield event
+            return
+        except CozeAPIError as e:
+            if started:
+                raise
+            print(f"Coze 会话 {conversation_id} 不可用，使用本地历史重建: {e}")
+        conversation_id = self._createConversation(session, user_id, turn)
+        yield from self._chatInConversation(conversation_id, user_id, turn["message"])
+
+    async def _streamInConversationAsync(self, session, user_id: str, turn: Dict) -> AsyncGenerator:
+        """_streamInConversation 的异步版本"""
+        conversation_id = self.conversations.get(user_id, self._conversationScope())
+        if conversation_id is None:
+            conversation_id = await self._createConversationAsync(session, user_id, turn)
+        started = False
+        try:
+            async for event in self._chatInConversationAsync(conversation_id, user_id, turn["message"]):
+                started = True
+                yield event
+            return
+        except CozeAPIError as e:
+            if started:
+                raise
+            print(f"Coze 会话 {conversation_id} 不可用，使用本地历史重建: {e}")
+        conversation_id = await self._createConversationAsync(session, user_id, turn)
+        async for event in self._chatInConversationAsync(conversation_id, user_id, turn["message"]):
+            yield event
+
+    def _conversationScope(self) -> str:
+        """服务端会话的适用范围：智能体ID + 用户喜好指纹，喜好变化后旧会话不再复用"""
+        if not self.preferences:
+            return self.botId
+        digest = hashlib.sha1(serializer.dumps(self.preferences).encode("utf-8")).hexdigest()[:12]
+        return f"{self.botId}:{digest}"
+
+    def _chatInConversation(self, conversation_id: str, user_id: str, message: str):
+        return self.coze.chat.stream(
+            bot_id=self.botId,
+            user_id=user_id or "random_string",
+            conversation_id=conversation_id,
+            additional_messages=[Message.build_user_question_text(message)]
+        )
+
+    def _createConversation(self, session, user_id: str, turn: Dict) -> str:
+        """用本地上下文（不含本轮的用户消息 turn，它随本轮对话单独发送）创建服务端会话并记录映射"""
+        history = self._prepareContextMessages(session, exclude=turn)
+        conversation = self.coze.conversations.create(messages=history)
+        self.conversations.set(user_id, self._conversationScope(), conversation.id)
+        return conversation.id
+
+    def _chatInConversationAsync(self, conversation_id: str, user_id: str, message: str):
+        return self._getAsyncCoze().chat.stream(
+            bot_id=self.botId,
+            user_id=user_id or "random_string",
+            conversation_id=conversation_id,
+            additional_messages=[Message.build_user_question_text(message)]
+        )
+
+    async def _createConversationAsync(self, session, user_id: str, turn: Dict) -> str:
+        history = self._prepareContextMessages(session, exclude=turn)
+        conversation = await self._getAsyncCoze().conversations.create(messages=history)
+        await _inThread(self.conversations.set, user_id, self._conversationScope(), conversation.id)
+        return conversation.id
+
+    def processMessage(self, message: str, user_id: str = "") -> str:
         """处理单条消息"""
-        m = self.processStreamMessage(message)
+        m = self.processStreamMessage(message, user_id)
         sum = ""
         for each in m:
             sum += each.get('message', '')
-        print("\n历史记录:", self.chatHistory, "\n")
         return sum
 
-    def _prepareContextMessages(self) -> List[Message]:
-        """准备上下文消息"""
+    def _prepareContextMessages(self, session, exclude: Optional[Dict] = None) -> List[Message]:
+        """准备上下文消息：用户喜好 + 滚动摘要 + 预算内的最近消息（不含 exclude）"""
         messages = []
-        for msg in self.chatHistory[-self.config.maxHistoryLength:]:
-            # 兼容旧字段名 'content'，并对缺失消息做容错处理
-            text = None
-            if isinstance(msg, dict):
-                text = msg.get("message") if msg.get("message") is not None else msg.get("content")
-            if not text:
-                # 跳过没有实际文本的历史项
-                continue
-            if msg.get("role") == "user":
-                messages.append(Message.build_user_question_text(text))
-            else:
-                messages.append(Message.build_assistant_answer(text))
+        if self.preferences:
+            if self._preferencesMessage is None:
+                self._preferencesMessage = Message.build_user_question_text("当前最新的用户喜好:" + str(self.preferences))
+            messages.append(self._preferencesMessage)
+        messages.extend(self.contextBuilder.build(session, exclude=exclude))
         return messages
 
-    def getChatHistory(self) -> List[Dict]:
-        """获取聊天历史"""
-        return self.chatHistory
+    @staticmethod
+    def _buildMessage(role: str, text: str) -> Message:
+        if role == "user":
+            return Message.build_user_question_text(text)
+        return Message.build_assistant_answer(text)
+
+    def getChatHistory(self, user_id: str = "") -> List[Dict]:
+        """获取该用户会话的聊天历史（内存中最近的 sessionMaxMessages 条）"""
+        return self.sessions.get(user_id).messages
 
     def saveChatHistory(self) -> None:
-        """保存聊天历史到文件"""
+        """保存聊天历史到文件
+
+        每条消息在收发时已经写入 DataService，这里只需确保缓冲中的记录落盘。
+        """
         try:
-            # 使用 DataService 覆盖写入 chats.json
-            self.data_service._write_json(self.data_service.chats_file, self.chatHistory)
+            self.data_service.chats_store.sync()
         except Exception as e:
             print(f"保存聊天历史时出错: {str(e)}")
             raise
 
     def loadChatHistory(self) -> None:
-        """从文件加载聊天历史"""
-        try:
-            # 优先从 DataService 加载
-            self.chatHistory = self.data_service.get_chats()
-        except FileNotFoundError:
-            print("未找到聊天历史文件")
-            self.chatHistory = []
-        except Exception as e:
-            print(f"加载聊天历史时出错: {str(e)}")
-            raise
+        """从文件加载聊天历史：丢弃内存中的会话，之后访问时按用户重新加载"""
+        self.sessions.clear()
 
-    def deleteChatHistory(self) -> None:
-        """删除聊天历史"""
-        self.chatHistory = []
+    def deleteChatHistory(self, user_id: Optional[str] = None) -> None:
+        """删除聊天历史；指定 user_id 时只删除该用户的记录"""
+        if user_id is None:
+            self.sessions.clear()
+        else:
+            self.sessions.drop(user_id)
+        if self.conversations is not None:
+            self.conversations.drop(user_id)
         try:
-            # 清空 DataService 中的 chats 文件
-            self.data_service._write_json(self.data_service.chats_file, [])
+            # 清空 DataService 中的聊天记录
+            self.data_service.clear_chats(user_id)
         except Exception:
             pass
         
     def updateUserPreferences(self, preferences: Dict) -> None:
-        """更新用户喜好"""
-        ts = datetime.now().isoformat()
-        entry = {"role": "user", "message": "当前最新的用户喜好:" + str(preferences), "timestamp": ts}
-        self.chatHistory.append(entry)
-        try:
-            # 保存时使用 message 字段
-            self.data_service.save_chat(user_id="", message=entry["message"], role="user", timestamp=ts)
-        except Exception:
-            pass
+        """更新用户喜好：之后每次对话都会把喜好作为第一条上下文消息发送"""
+        self.preferences = preferences
+        self._preferencesMessage = None
@@ -0,0 +1,173 @@
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+import threading
+from src.services.analysisService import CRISIS_UNSTRUCTURED
+from src.services.recordStore import BaseRecordStore, latest_versions
+
+# 不区分用户、覆盖全部记录的评估使用的状态键
+ALL_USERS = "*"
+
+
+class CrisisIndexTracker:
+    """增量维护的心理危机指数
+
+    每个评估范围（某个用户，或全部用户）保存一份滚动状态：上次的评估结果（分数、特征等）、
+    压缩摘要和已处理到的最后一条记录的时间。每次计算只把之后新增的聊天与表情记录连同这份状态发给模型，
+    输入长度与历史总长度无关；没有新增记录时直接返回上次的结果，不调用模型。
+
+    积压的新增记录（如首次计算）按 delta_chars 分批依次处理，每批完成后即保存状态，
+    单次调用的输入长度始终有上界；中途失败时下次从失败的批次继续。
+    """
+
+    def __init__(
+        self,
+        analysis_service,
+        chat_data,
+        emotion_data,
+        store: Optional[BaseRecordStore] = None,
+        delta_chars: int = 6000,
+        summary_chars: int = 600,
+    ):
+        """
+        Args:
+            analysis_service: 提供 analyze_crisis_index_delta / _format_history 的分析服务
+            chat_data: 提供 get_chats(user_id, since) 的聊天数据服务，可为 None
+            emotion_data: 提供 get_emotions(user_id, since) 的表情数据服务，可为 None
+            store: 保存滚动状态的记录存储，None 表示只保存在内存中
+            delta_chars: 每次调用发送的新增对话字符数上限
+            summary_chars: 压缩摘要的字符数上限
+        """
+        self.analysis_service = analysis_service
+        self.chat_data = chat_data
+        self.emotion_data = emotion_data
+        self.store = store
+        self.delta_chars = max(1, delta_chars)
+        self.summary_chars = summary_chars
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._scope_locks: Dict[str, threading.Lock] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if self.store is None:
+            return
+        try:
+            records = self.store.read_all()
+        except Exception as e:
+            print(f"加载危机指数状态失败: {e}")
+            return
+        states = [r for r in latest_versions(records) if not r.get("reset")]
+        if len(states) < len(records):
+            try:
+                self.store.replace(states)
+            except Exception as e:
+                print(f"压缩危机指数状态失败: {e}")
+        for state in states:
+            self._states[state["id"]] = state
+
+    def get_state(self, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """返回该范围的滚动状态（副本），尚未计算过时返回 None"""
+        with self._lock:
+            state = self._states.get(user_id or ALL_USERS)
+            return dict(state) if state is not None else None
+
+    def compute(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """处理新增记录并返回最新的危机指数结果；user_id 为空时评估全部用户的记录"""
+        scope = user_id or ALL_USERS
+        with self._lock:
+            scope_lock = self._scope_locks.setdefault(scope, threading.Lock())
+        # 同一范围同时只处理一次，并发的请求等待后直接拿到处理完的结果
+        with scope_lock:
+            with self._lock:
+                state = dict(self._states.get(scope) or {})
+            since = state.get("last_timestamp")
+            chats, emotions = self._newRecords(user_id, since)
+            if not chats and not emotions and state.get("result") is not None:
+                return dict(state["result"])
+            for batch_chats, batch_emotions, last_timestamp in self._batches(chats, emotions):
+                result = self.analysis_service.analyze_crisis_index_delta(
+                    state, batch_chats, batch_emotions, summary_chars=self.summary_chars,
+                )
+                if result.get("interpretation") == CRISIS_UNSTRUCTURED:
+                    # 没有得到结构化结果（含调用失败），不推进状态，下次从这批记录重新计算
+                    return dict(state["result"]) if state.get("result") is not None else result
+                state = self._advance(scope, user_id, state, result, last_timestamp,
+                                      len(batch_chats), len(batch_emotions))
+            if state.get("result") is None:
+                # 范围内没有任何记录
+                return {"score": 0, "interpretation": "暂无记录", "features": [], "explanation": "",
+                        "suggestions": "", "validation": ""}
+            return dict(state["result"])
+
+    def _newRecords(self, user_id: Optional[str], since: Optional[str]) -> Tuple[List[Dict], List[Dict]]:
+        """读取 since 之后（不含）新增的聊天与表情记录"""
+        def after(records):
+            return [r for r in records if isinstance(r, dict) and (since is None or (r.get("timestamp") or "") > since)]
+
+        chats = after(self.chat_data.get_chats(user_id=user_id, since=since)) if self.chat_data is not None else []
+        emotions = after(self.emotion_data.get_emotions(user_id=user_id, since=since)) if self.emotion_data is not None else []
+        return chats, emotions
+
+    def _batches(self, chats: List[Dict], emotions: List[Dict]):
+        """把新增记录按时间顺序切成对话文本不超过 delta_chars 的批次，产出 (聊天, 表情, 批次最后时间)"""
+        timeline = [(c.get("timestamp") or "", 0, c) for c in chats] + [(e.get("timestamp") or "", 1, e) for e in emotions]
+        timeline.sort(key=lambda item: (item[0], item[1]))
+        batch_chats: List[Dict] = []
+        batch_emotions: List[Dict] = []
+        chars = 0
+        for timestamp, kind, record in timeline:
+            if kind == 0:
+                size = len(self.analysis_service._format_history([record]))
+                if batch_chats and chars + size > self.delta_chars:
+                    yield batch_chats, batch_emotions, last
+                    batch_chats, batch_emotions, chars = [], [], 0
+                batch_chats.append(record)
+                chars += size
+            else:
+                # 表情记录只以各情绪的计数进入输入，长度有上界，不计入字符预算
+                batch_emotions.append(record)
+            last = timestamp
+        if batch_chats or batch_emotions:
+            yield batch_chats, batch_emotions, last
+
+    def _advance(self, scope, user_id, state, result, last_timestamp, chat_count, emotion_count) -> Dict[str, Any]:
+        summary = result.pop("summary", "") or state.get("summary", "")
+        new_state = {
+            "id": scope,
+            "type": "crisis_state",
+            "user_id": user_id or "",
+            "score": result.get("score", 0),
+            "features": result.get("features") or [],
+            "summary": summary,
+            "result": result,
+            "last_timestamp": last_timestamp,
+            "processed_chats": state.get("processed_chats", 0) + chat_count,
+            "processed_emotions": state.get("processed_emotions", 0) + emotion_count,
+            "timestamp": datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._states[scope] = new_state
+        self._save(new_state)
+        return new_state
+
+    def _save(self, record: Dict[str, Any]) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.upsert(dict(record))
+        except Exception as e:
+            print(f"保存危机指数状态失败: {e}")
+
+    def reset(self, user_id: Optional[str] = None) -> None:
+        """丢弃滚动状态，下次计算从头开始；user_id 为空时丢弃全部范围的状态"""
+        with self._lock:
+            scopes = list(self._states) if user_id is None else [s for s in (user_id, ALL_USERS) if s in self._states]
+            for scope in scopes:
+                state = self._states.pop(scope)
+                self._save({"id": scope, "type": "crisis_state", "user_id": state.get("user_id", ""), "reset": True,
+                            "timestamp": datetime.now().isoformat()})
+
+    def on_record(self, kind: str, record: Optional[Dict[str, Any]]) -> None:
+        """DataService 的监听回调：聊天/表情记录被清空或整体覆盖时，已有的摘要不再可信，丢弃状态"""
+        if kind in ("chat", "emotion") and record is None:
+            self.reset()
@@ -0,0 +1,92 @@
+from typing import List, Dict, Any, Callable
+import importlib
+from src.services.analysisService import CRISIS_UNSTRUCTURED
+from src.services.dangerLexicon import DangerLexicon, load_lexicon
+from src.services.statsService import StatsService
+
+# 评分器：scorer(聊天记录, 表情记录) -> 危机指数结果 {"score", "interpretation", "features", "explanation", "suggestions"}
+Scorer = Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], Dict[str, Any]]
+
+
+class DeepseekCrisisScorer:
+    """用 DeepseekAnalysisService.analyze_crisis_index 评分（与综合评估页面使用同一提示词）"""
+
+    def __init__(self, validate: bool = False):
+        from src.services.analysisService import DeepseekAnalysisService
+        self.service = DeepseekAnalysisService()
+        self.validate = validate
+
+    def __call__(self, chats: List[Dict[str, Any]], emotions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        result = self.service.analyze_crisis_index(chats, emotions, validate=self.validate)
+        if result.get("interpretation") == CRISIS_UNSTRUCTURED and not result.get("explanation"):
+            # 上游调用失败，抛出异常使该组不被记为已完成，下次运行时重试
+            raise RuntimeError("模型调用失败")
+        return result
+
+
+class LexiconCrisisScorer:
+    """本地替代评分器：只用危机词库与表情统计估算危机指数，不调用任何网络服务
+
+    用于测试批量评分流程，或在没有模型额度时做粗筛。文本风险取各条用户消息词库风险分的最大值
+    （逐条合成在消息多时会迅速饱和），负面主导情绪占比最多再贡献一半的风险。
+    """
+
+    def __init__(self, lexicon: DangerLexicon = None):
+        self.lexicon = lexicon
+
+    def __call__(self, chats: List[Dict[str, Any]], emotions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if self.lexicon is None:
+            from src.config import Config
+            self.lexicon = load_lexicon(Config().dangerLexiconPath)
+        risk = 0.0
+        terms: Dict[str, int] = {}
+        for record in chats:
+            if not isinstance(record, dict) or record.get("role", "user") != "user":
+                continue
+            text = record.get("message") if record.get("message") is not None else record.get("content", "")
+            result = self.lexicon.scan(text or "")
+            risk = max(risk, result["score"])
+            for match in result["matches"]:
+                if not match["negated"]:
+                    terms[match["term"]] = terms.get(match["term"], 0) + 1
+        negative = 0
+        for record in emotions:
+            data = record.get("data") if isinstance(record, dict) else None
+            if isinstance(data, dict) and data.get("dominant_emotion") in StatsService.NEGATIVE_EMOTIONS:
+                negative += 1
+        negative_ratio = negative / len(emotions) if emotions else 0.0
+        score = int(round(100 * (1.0 - (1.0 - risk) * (1.0 - 0.5 * negative_ratio))))
+        if score >= 70:
+            interpretation = "高风险"
+        elif score >= 40:
+            interpretation = "中风险"
+        else:
+            interpretation = "低风险"
+        features = sorted(terms, key=lambda t: -terms[t])
+        return {
+            "score": score,
+            "interpretation": interpretation,
+            "features": features,
+            "explanation": f"词库命中 {sum(terms.values())} 次，负面表情占比 {negative_ratio:.0%}（本地词库评分，未调用模型）",
+            "suggestions": "",
+        }
+
+
+def load_scorer(spec: str) -> Scorer:
+    """按名称创建评分器
+
+    - deepseek：模型评分；deepseek+validate：同时做交叉验证
+    - lexicon：本地词库评分
+    - 模块路径:工厂函数（如 mypkg.scorers:create），工厂函数无参数，返回 Scorer
+    """
+    if spec == "deepseek":
+        return DeepseekCrisisScorer()
+    if spec == "deepseek+validate":
+        return DeepseekCrisisScorer(validate=True)
+    if spec == "lexicon":
+        return LexiconCrisisScorer()
+    module_name, sep, attr = spec.partition(":")
+    if not sep or not module_name or not attr:
+        raise ValueError(f"未知的评分器: {spec}")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
@@ -0,0 +1,184 @@
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from collections import deque
+import json
+import os
+
+# 默认危机词库：词 -> 权重（0~1，越高越危险）
+DEFAULT_TERMS = {
+    "自杀": 1.0, "轻生": 1.0, "不想活": 1.0, "活不下去": 0.9, "结束生命": 1.0, "结束自己": 0.9,
+    "想死": 0.9, "去死": 0.8, "寻死": 0.9, "死了算了": 0.9, "活着没意思": 0.9, "活着没有意义": 0.9,
+    "割腕": 1.0, "跳楼": 0.9, "上吊": 0.9, "吃安眠药": 0.8, "安眠药": 0.5, "遗书": 0.9, "遗言": 0.7,
+    "自残": 0.9, "伤害自己": 0.9, "划自己": 0.8, "撑不下去": 0.7, "解脱": 0.5, "一了百了": 0.8,
+    "绝望": 0.6, "没有希望": 0.6, "看不到希望": 0.6, "生不如死": 0.8, "崩溃": 0.4, "无助": 0.4,
+    "抑郁": 0.4, "痛苦": 0.3, "孤独": 0.3, "没人在乎": 0.5, "消失": 0.3, "伤害": 0.3, "报复": 0.4,
+}
+# 否定词：紧接在命中词之前，或与命中词之间只隔着 _MODALS 中的意愿/情态词（如“不想自杀”“没有想过要自杀”）时，该命中不计分
+DEFAULT_NEGATIONS = ["不", "没", "别", "未", "无意", "不会", "不想", "不要", "不是", "没有", "从不", "并不", "绝不", "从没"]
+# 否定词与命中词之间允许出现的词；其他字（如“忍不住想死”的“住”、“不开心想死”的“开心”）说明否定词修饰的是别的词
+_MODALS = ("打算", "愿意", "想", "要", "会", "去", "敢", "过", "再")
+
+
+class AhoCorasick:
+    """Aho–Corasick 多模式匹配自动机：一次扫描找出文本中所有词库词的出现位置，耗时与文本长度成正比，与词库大小无关"""
+
+    def __init__(self, patterns: Iterable[str], dfa_limit: int = 500000):
+        """
+        Args:
+            patterns: 模式串
+            dfa_limit: 状态数 × 首字符数不超过该值时把失败指针展开为完整转移表（更快但占用更多内存）
+        """
+        self.patterns: List[str] = [p for p in patterns if p]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        outputs: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append([])
+                node = nxt
+            outputs[node].append(index)
+        # 按层构建失败指针，并把失败指针所指节点的输出合并进来
+        queue = deque(self._goto[0].values())
+        order: List[int] = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                outputs[child].extend(outputs[self._fail[child]])
+        self._out = [tuple(o) for o in outputs]
+        self._lengths = [len(p) for p in self.patterns]
+        self._delta = self._build_delta(order) if len(self._goto) * len(self._goto[0]) <= dfa_limit else None
+
+    def _build_delta(self, order: List[int]) -> List[Dict[str, int]]:
+        """把失败指针展开为完整的状态转移表，扫描时每个字符只需一次字典查找
+
+        每个状态只保存转移到非根状态的边，缺省即回到根状态。
+        """
+        delta: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in range(len(self._goto) - 1)]
+        for node in order:
+            table = dict(delta[self._fail[node]])
+            table.update(self._goto[node])
+            delta[node] = table
+        return delta
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """逐个产出 (起始位置, 模式序号)"""
+        out, lengths = self._out, self._lengths
+        node = 0
+        if self._delta is not None:
+            delta = self._delta
+            for i, ch in enumerate(text):
+                node = delta[node].get(ch, 0)
+                if out[node]:
+                    for index in out[node]:
+                        yield i - lengths[index] + 1, index
+            return
+        goto, fail = self._goto, self._fail
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for index in out[node]:
+                    yield i - lengths[index] + 1, index
+
+
+class DangerLexicon:
+    """本地危机词库预筛
+
+    用 Aho–Corasick 自动机一次扫描出消息中命中的危机词，按权重合成 0~1 的风险分：
+    score = 1 - ∏(1 - 权重)，同一个词只计一次；直接被否定词修饰（如“不想自杀”）的命中不计分，
+    否定词修饰的是别的词时（如“忍不住想自杀”“不开心想死”）照常计分。
+    不依赖任何网络调用，单条消息耗时在微秒级，可以在每条用户消息进入聊天服务之前执行。
+    """
+
+    def __init__(
+        self,
+        terms: Optional[Dict[str, float]] = None,
+        negations: Optional[Iterable[str]] = None,
+        negation_window: int = 6,
+    ):
+        """
+        Args:
+            terms: 词 -> 权重，默认 DEFAULT_TERMS
+            negations: 否定词，默认 DEFAULT_NEGATIONS
+            negation_window: 否定词与命中词之间最多相隔的字数（含否定词本身）
+        """
+        self.terms = {t: max(0.0, min(1.0, float(w))) for t, w in (terms if terms is not None else DEFAULT_TERMS).items() if t}
+        self.negations = tuple(negations if negations is not None else DEFAULT_NEGATIONS)
+        self.negation_window = negation_window
+        self._matcher = AhoCorasick(self.terms)
+        self._weights = [self.terms[p] for p in self._matcher.patterns]
+
+    @classmethod
+    def from_file(cls, path: str, negation_window: int = 6) -> "DangerLexicon":
+        """从 JSON 文件加载词库：{"terms": {词: 权重}, "negations": [否定词]}，缺省的部分使用默认值"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("terms"), data.get("negations"), negation_window=negation_window)
+
+    def _negated(self, text: str, start: int) -> bool:
+        """命中词前是否有直接修饰它的否定词：否定词之后到命中词之前只能是意愿/情态词"""
+        lo = max(0, start - self.negation_window)
+        for end in range(start, lo, -1):
+            if end < start and not _modal_run(text[end:start]):
+                continue
+            if any(end - len(neg) >= lo and text.startswith(neg, end - len(neg)) for neg in self.negations):
+                return True
+        return False
+
+    def scan(self, text: str) -> Dict[str, Any]:
+        """返回 {"score": 风险分, "matches": [{"term", "weight", "start", "negated"}]}，没有命中时 matches 为空"""
+        matches = []
+        if not text:
+            return {"score": 0.0, "matches": matches}
+        seen = set()
+        safe = 1.0
+        for start, index in self._matcher.iter_matches(text):
+            term = self._matcher.patterns[index]
+            negated = bool(self.negations) and self._negated(text, start)
+            matches.append({"term": term, "weight": self._weights[index], "start": start, "negated": negated})
+            if not negated and index not in seen:
+                seen.add(index)
+                safe *= 1.0 - self._weights[index]
+        return {"score": round(1.0 - safe, 4), "matches": matches}
+
+    def has_match(self, texts: Iterable[str]) -> bool:
+        """任一文本中有未被否定的命中时返回 True"""
+        return any(self.scan(text)["score"] > 0 for text in texts if text)
+
+
+def _modal_run(text: str) -> bool:
+    """text 是否完全由 _MODALS 中的词组成"""
+    i = 0
+    while i < len(text):
+        for modal in _MODALS:
+            if text.startswith(modal, i):
+                i += len(modal)
+                break
+        else:
+            return False
+    return True
+
+
+def load_lexicon(path: Optional[str]) -> DangerLexicon:
+    """path 指向的词库文件存在时从文件加载，否则使用默认词库"""
+    if path and os.path.exists(path):
+        try:
+            return DangerLexicon.from_file(path)
+        except Exception as e:
+            print(f"加载危机词库 {path} 失败，使用默认词库: {e}")
+    return DangerLexicon()
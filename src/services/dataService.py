@@ -1,36 +1,56 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
 import os
-import json
 from datetime import datetime
+from src.config import Config
+from src.services.recordStore import BaseRecordStore, create_record_store
+from src.services.retentionService import iter_rotated
 
 
 class DataService:
     """处理需要保存的数据：聊天记录和表情识别结果
 
-    存储文件（默认）：
-    - data/chats.json
-    - data/emotions.json
+    存储文件（默认 jsonl 后端）：
+    - data/chats.jsonl
+    - data/emotions.jsonl
+
+    后端由 `Config.storageBackend` 决定，设置为 'json' 时沿用旧版
+    data/chats.json、data/emotions.json 整文件数组格式，设置为 'sqlite' 时
+    写入 data/luminest.db 并使用索引完成排序与过滤。
+    开启 `Config.storageSharding` 后文件类后端按用户分片存放在
+    data/users/<用户ID>/chats.jsonl 等文件中，指定 user_id 的查询只读取该用户的分片。
     """
 
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", backend: Optional[str] = None):
         self.data_dir = data_dir
         os.makedirs(self.data_dir, exist_ok=True)
-        self.chats_file = os.path.join(self.data_dir, "chats.json")
-        self.emotions_file = os.path.join(self.data_dir, "emotions.json")
-
-    # ---- 低级文件操作辅助方法 ----
-    def _read_json(self, path: str) -> List[Dict[str, Any]]:
-        if not os.path.exists(path):
-            return []
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return []
-
-    def _write_json(self, path: str, data: List[Dict[str, Any]]) -> None:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self.backend = backend or Config().storageBackend
+        self.chats_store: BaseRecordStore = create_record_store(self.backend, self.data_dir, "chats")
+        self.emotions_store: BaseRecordStore = create_record_store(self.backend, self.data_dir, "emotions")
+        self._listeners: List[Callable[[str, Optional[Dict[str, Any]]], None]] = []
+        # 表情列式时间序列（与 emotions 记录并存），numpy 不可用时不启用
+        self.emotion_series = None
+        if Config().emotionSeriesEnabled:
+            try:
+                from src.services.emotionSeriesStore import get_emotion_series
+                self.emotion_series = get_emotion_series(self.data_dir)
+            except ImportError as e:
+                print(f"表情时间序列存储不可用: {e}")
+
+    # ---- 写入监听 ----
+    def add_listener(self, callback: Callable[[str, Optional[Dict[str, Any]]], None]) -> None:
+        """注册写入监听回调
+
+        回调参数为 (kind, record)：kind 为 'chat' 或 'emotion'，record 为新写入的记录；
+        record 为 None 表示该类记录被清空或整体覆盖。
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, record: Optional[Dict[str, Any]]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(kind, record)
+            except Exception as e:
+                print(f"数据监听回调出错: {e}")
 
     def _now_iso(self) -> str:
         return datetime.now().isoformat()
@@ -62,14 +82,68 @@ class DataService:
             "timestamp": timestamp,
         }
 
-        chats = self._read_json(self.chats_file)
-        chats.append(entry)
-        self._write_json(self.chats_file, chats)
+        self.chats_store.append(entry)
+        self._notify("chat", entry)
+
+    def get_chats(
+        self,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """返回按时间升序排列的聊天记录，默认返回全部
+
+        Args:
+            user_id: 仅返回该用户的记录
+            since: ISO 时间字符串，包含该时刻
+            until: ISO 时间字符串，不包含该时刻
+            limit: 最多返回条数
+        """
+        return self.chats_store.query(user_id=user_id, since=since, until=until, limit=limit)
+
+    def get_chats_page(
+        self,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页返回按时间升序排列的聊天记录
+
+        Returns:
+            (本页记录, 下一页游标)，没有更多数据时游标为 None
+        """
+        return self.chats_store.query_page(user_id=user_id, since=since, until=until, limit=limit, cursor=cursor)
+
+    def get_recent_chats(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """返回该用户最近的 limit 条聊天记录（时间升序），用于加载会话"""
+        recent = self.chats_store.query(user_id=user_id, limit=limit or None, descending=True)
+        recent.reverse()
+        return recent
 
-    def get_chats(self) -> List[Dict[str, Any]]:
-        """返回按时间升序排列的所有聊天记录"""
-        chats = self._read_json(self.chats_file)
-        return sorted(chats, key=lambda x: x.get("timestamp", ""))
+    def iter_chats(self, include_rotated: bool = False) -> Iterator[Dict[str, Any]]:
+        """按时间升序逐条返回聊天记录，供流式接口使用，内存占用与历史长度无关
+
+        include_rotated 为 True 时先返回数据保留轮转到 data/segments/、data/archive/ 中的记录。
+        """
+        if include_rotated:
+            return self._withRotated("chats", self.chats_store.iter_ordered())
+        return self.chats_store.iter_ordered()
+
+    def replace_chats(self, chats: List[Dict[str, Any]]) -> None:
+        """用给定列表整体覆盖聊天记录"""
+        self.chats_store.replace(chats)
+        self._notify("chat", None)
+
+    def clear_chats(self, user_id: Optional[str] = None) -> None:
+        """清空聊天记录；指定 user_id 时只删除该用户的记录"""
+        if user_id is None:
+            self.chats_store.clear()
+        else:
+            self.chats_store.replace([c for c in self.chats_store.iter_records() if c.get("user_id", "") != user_id])
+        self._notify("chat", None)
 
     # ---- 表情记录相关 ----
     def save_emotion(self, emotion_data: Dict[str, Any]) -> None:
@@ -97,20 +171,71 @@ class DataService:
             "note": emotion_data.get("note", "")
         }
 
-        emotions = self._read_json(self.emotions_file)
-        emotions.append(entry)
-        self._write_json(self.emotions_file, emotions)
+        self.emotions_store.append(entry)
+        if self.emotion_series is not None:
+            try:
+                self.emotion_series.append(entry["data"]["dominant_emotion"], entry["data"]["emotions"], timestamp)
+            except Exception as e:
+                print(f"写入表情时间序列失败: {e}")
+        self._notify("emotion", entry)
+
+    def get_emotions(
+        self,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """返回按时间升序排列的表情记录，参数含义同 get_chats"""
+        return self.emotions_store.query(user_id=user_id, since=since, until=until, limit=limit)
+
+    def get_emotions_page(
+        self,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页返回按时间升序排列的表情记录，参数含义同 get_chats_page"""
+        return self.emotions_store.query_page(user_id=user_id, since=since, until=until, limit=limit, cursor=cursor)
+
+    def iter_emotions(self, include_rotated: bool = False) -> Iterator[Dict[str, Any]]:
+        """按时间升序逐条返回表情记录，供流式接口使用
+
+        include_rotated 为 True 时先返回轮转出的记录；已压缩归档的表情为按（用户, 分钟）降采样的摘要记录。
+        """
+        if include_rotated:
+            return self._withRotated("emotions", self.emotions_store.iter_ordered())
+        return self.emotions_store.iter_ordered()
+
+    def _withRotated(self, name: str, active: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        yield from iter_rotated(self.data_dir, name)
+        yield from active
+
+    def get_emotion_frames(self, since: Optional[str] = None, until: Optional[str] = None):
+        """从列式时间序列按时间范围读取表情帧
+
+        Returns:
+            numpy 结构化数组（字段 ts / dominant / probs），帧有序时为内存映射上的零拷贝视图；
+            未启用时间序列时返回 None
+        """
+        if self.emotion_series is None:
+            return None
+        return self.emotion_series.range(since, until)
 
-    def get_emotions(self) -> List[Dict[str, Any]]:
-        """返回按时间升序排列的所有表情记录"""
-        emotions = self._read_json(self.emotions_file)
-        return sorted(emotions, key=lambda x: x.get("timestamp", ""))
+    def clear_emotions(self) -> None:
+        """清空表情记录"""
+        self.emotions_store.clear()
+        if self.emotion_series is not None:
+            self.emotion_series.clear()
+        self._notify("emotion", None)
 
     # ---- 合并读取 ----
     def get_all_data(self) -> List[Dict[str, Any]]:
         """返回聊天记录与表情记录的合并列表，按时间升序排列"""
-        chats = self._read_json(self.chats_file)
-        emotions = self._read_json(self.emotions_file)
+        chats = self.chats_store.read_all()
+        emotions = self.emotions_store.read_all()
         combined = []
         # 标准化各条目的 timestamp 字段
         for c in chats:
@@ -127,5 +252,5 @@ class DataService:
     # ---- 可选：清理数据 ----
     def clear_all(self) -> None:
         """清空聊天和表情数据文件（慎重使用）"""
-        self._write_json(self.chats_file, [])
-        self._write_json(self.emotions_file, [])
+        self.clear_chats()
+        self.clear_emotions()
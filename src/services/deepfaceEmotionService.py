@@ -46,7 +46,7 @@ class DeepfaceEmotionService(BaseEmotionService):
         # 归一化处理
         return {k: v/total for k, v in normalized.items()}
 
-    def analyze_emotion(self, image_path: str) -> Dict:
+    def analyze_emotion(self, image_path: str, user_id: str = "") -> Dict:
         """分析图片中的表情"""
         try:
             result = analyze_face(
@@ -77,7 +77,7 @@ class DeepfaceEmotionService(BaseEmotionService):
             # 保存识别结果到 DataService（非阻塞）
             try:
                 record = {
-                    "user_id": "",
+                    "user_id": user_id,
                     "dominant_emotion": dominant_emotion,
                     "emotions": normalized_emotions,
                     "timestamp": datetime.now().isoformat()
@@ -162,11 +162,12 @@ class DeepfaceEmotionService(BaseEmotionService):
         
         return is_depressed
         
-    def capture_and_analyze(self, camera_index: int = 0) -> Dict:
+    def capture_and_analyze(self, camera_index: int = 0, user_id: str = "") -> Dict:
         """从摄像头捕获并分析表情
         
         Args:
             camera_index: 摄像头索引，默认为0（第一个摄像头）
+            user_id: 被拍摄的用户ID，用于保存识别记录
             
         Returns:
             Dict: 表情分析结果
@@ -180,7 +181,7 @@ class DeepfaceEmotionService(BaseEmotionService):
                 raise Exception("无法捕获图像")
             temp_image = "temp_capture.jpg"
             cv2.imwrite(temp_image, frame)
-            result = self.analyze_emotion(temp_image)
+            result = self.analyze_emotion(temp_image, user_id)
             cap.release()
             return result
         except Exception as e:
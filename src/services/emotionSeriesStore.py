@@ -0,0 +1,150 @@
+from typing import List, Dict, Any, Optional, Union
+from datetime import datetime
+import os
+import threading
+import numpy as np
+
+# 与 DeepfaceEmotionService 输出一致的情绪顺序，probs 列按此顺序存放
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+UNKNOWN_CODE = 255
+
+# 每帧 37 字节：int64 毫秒时间戳 + uint8 主导情绪编码 + 7 个 float32 概率
+FRAME_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("dominant", "u1"),
+    ("probs", "<f4", (len(EMOTION_LABELS),)),
+])
+
+
+def to_epoch_ms(value: Union[str, datetime, int, float]) -> int:
+    """把 ISO 时间字符串 / datetime / 秒级时间戳转换为毫秒时间戳"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value * 1000)
+
+
+class EmotionSeriesStore:
+    """列式表情时间序列存储
+
+    每帧以定长二进制结构追加到文件末尾，读取时通过 np.memmap 映射整个文件，
+    按时间范围切片返回的是映射上的视图（零拷贝），分析长时间监控数据时无需解析 JSON。
+    帧按写入顺序（即时间顺序）存放，范围查询使用二分查找。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = None
+        self._last_ts: Optional[int] = None
+        # None 表示尚未检查；出现乱序写入后范围查询退化为布尔掩码
+        self._sorted: Optional[bool] = None
+
+    def _handle(self):
+        if self._fh is None or self._fh.closed:
+            self._fh = open(self.path, "ab")
+        return self._fh
+
+    def append(self, dominant_emotion: str, emotions: Dict[str, float], timestamp: Union[str, datetime]) -> None:
+        """追加一帧"""
+        frame = np.zeros(1, dtype=FRAME_DTYPE)
+        ts = to_epoch_ms(timestamp)
+        frame["ts"] = ts
+        frame["dominant"] = EMOTION_LABELS.index(dominant_emotion) if dominant_emotion in EMOTION_LABELS else UNKNOWN_CODE
+        frame["probs"] = [float(emotions.get(label, 0.0)) for label in EMOTION_LABELS]
+        with self._lock:
+            if self._last_ts is None:
+                frames = self.frames()
+                self._last_ts = int(frames["ts"][-1]) if len(frames) else ts
+            if ts < self._last_ts:
+                self._sorted = False
+            self._last_ts = max(self._last_ts, ts)
+            fh = self._handle()
+            fh.write(frame.tobytes())
+            fh.flush()
+
+    def frames(self) -> np.ndarray:
+        """以只读内存映射返回全部帧；文件末尾不完整的帧会被忽略"""
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=FRAME_DTYPE)
+        count = os.path.getsize(self.path) // FRAME_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=FRAME_DTYPE)
+        return np.memmap(self.path, dtype=FRAME_DTYPE, mode="r", shape=(count,))
+
+    def range(
+        self,
+        since: Optional[Union[str, datetime, int, float]] = None,
+        until: Optional[Union[str, datetime, int, float]] = None,
+    ) -> np.ndarray:
+        """返回 [since, until) 时间范围内的帧
+
+        帧有序时返回内存映射上的切片视图（零拷贝）；出现过乱序写入时返回按掩码复制的数组。
+        """
+        frames = self.frames()
+        if len(frames) == 0:
+            return frames
+        start = to_epoch_ms(since) if since is not None else None
+        end = to_epoch_ms(until) if until is not None else None
+        if self._sorted is None:
+            self._sorted = bool(np.all(np.diff(frames["ts"]) >= 0))
+        ts = frames["ts"]
+        if not self._sorted:
+            mask = np.ones(len(frames), dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts < end
+            return frames[mask]
+        i = int(np.searchsorted(ts, start, side="left")) if start is not None else 0
+        j = int(np.searchsorted(ts, end, side="left")) if end is not None else len(frames)
+        return frames[i:j]
+
+    @staticmethod
+    def to_records(frames: np.ndarray) -> List[Dict[str, Any]]:
+        """把帧数组转换回与 DataService 表情记录相同结构的字典列表"""
+        records = []
+        for frame in frames:
+            code = int(frame["dominant"])
+            dominant = EMOTION_LABELS[code] if code < len(EMOTION_LABELS) else "unknown"
+            records.append({
+                "type": "emotion",
+                "timestamp": datetime.fromtimestamp(int(frame["ts"]) / 1000).isoformat(),
+                "data": {
+                    "dominant_emotion": dominant,
+                    "emotions": {label: float(p) for label, p in zip(EMOTION_LABELS, frame["probs"])},
+                },
+            })
+        return records
+
+    def clear(self) -> None:
+        """删除全部帧"""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            open(self.path, "wb").close()
+            self._last_ts = None
+            self._sorted = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+_series: Dict[str, EmotionSeriesStore] = {}
+_series_lock = threading.Lock()
+
+
+def get_emotion_series(data_dir: str) -> EmotionSeriesStore:
+    """返回 data_dir 下共享的表情时间序列存储（data/emotions.frames）"""
+    path = os.path.abspath(os.path.join(data_dir, "emotions.frames"))
+    with _series_lock:
+        store = _series.get(path)
+        if store is None:
+            store = EmotionSeriesStore(path)
+            _series[path] = store
+        return store
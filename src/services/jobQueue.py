@@ -0,0 +1,270 @@
+from typing import List, Dict, Any, Optional, Callable
+from collections import OrderedDict
+from datetime import datetime
+import queue
+import threading
+import traceback
+import uuid
+from src.services.recordStore import BaseRecordStore, latest_versions
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# 状态记录中保存的字段；其余字段（类型、用户、payload、提交时间）只在提交记录中写一次
+STATUS_FIELDS = ("id", "status", "result", "error", "started_at", "finished_at")
+
+
+class JobQueue:
+    """后台任务队列
+
+    固定数量的工作线程从有界队列中取任务执行，任务按 kind 分发给注册的处理函数。
+    提交时追加一条提交记录（job_id、类型、用户、payload、提交时间），payload 只写这一次；
+    之后每次状态变化（queued -> running -> done / failed）只以 upsert 写入按 id 更新的状态记录
+    （STATUS_FIELDS 与变化时间），加载时按任务合并两者。进程重启后未完成的任务会重新入队；
+    内存中只保留最近 max_finished 个已结束的任务。
+    状态变化通过监听回调推送，也可以用 get() 轮询。
+    """
+
+    def __init__(
+        self,
+        store: BaseRecordStore,
+        workers: int = 2,
+        max_pending: int = 1000,
+        max_finished: int = 1000,
+    ):
+        """
+        Args:
+            store: 任务记录存储
+            workers: 工作线程数
+            max_pending: 待执行任务上限，超出时 submit 抛出 queue.Full
+            max_finished: 内存及启动压缩后保留的已结束任务数
+        """
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_finished = max_finished
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_pending)
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._threads: List[threading.Thread] = []
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """注册任务处理函数：handler(payload) 的返回值作为任务结果（需可序列化）"""
+        self._handlers[kind] = handler
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """注册任务状态变化回调，参数为任务记录的副本"""
+        self._listeners.append(callback)
+
+    def start(self) -> None:
+        """加载任务记录、把未完成的任务重新入队并启动工作线程"""
+        if self._threads:
+            return
+        for job in self._load():
+            self._queue.put_nowait(job["id"])
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """读取任务记录，返回需要重新执行的任务；同时把存储压缩为每个任务一条提交记录与最新的状态记录"""
+        try:
+            records = self.store.read_all()
+        except Exception as e:
+            print(f"加载后台任务记录失败: {e}")
+            return []
+        jobs = self._merge(records)
+        finished = [j for j in jobs if j.get("status") in (STATUS_DONE, STATUS_FAILED)]
+        unfinished = [j for j in jobs if j.get("status") not in (STATUS_DONE, STATUS_FAILED)]
+        kept = finished[-self.max_finished:] if self.max_finished else []
+        compacted = []
+        for job in sorted(kept + unfinished, key=lambda j: j.get("timestamp") or ""):
+            compacted.append(self._submission(job))
+            compacted.append(self._status(job, job.get("finished_at") or job.get("started_at") or job.get("timestamp")))
+        if len(compacted) < len(records):
+            try:
+                self.store.replace(compacted)
+            except Exception as e:
+                print(f"压缩后台任务记录失败: {e}")
+        with self._lock:
+            for job in kept + unfinished:
+                self._jobs[job["id"]] = job
+        if unfinished:
+            print(f"重新执行 {len(unfinished)} 个未完成的后台任务")
+        for job in unfinished:
+            job["status"] = STATUS_QUEUED
+        # 超出队列容量的任务保持 queued 状态，等下次启动再执行
+        return unfinished[:self._queue.maxsize] if self._queue.maxsize > 0 else unfinished
+
+    @staticmethod
+    def _merge(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按任务合并提交记录与最新的状态记录，按提交时间排列
+
+        只有提交记录的任务（提交后、写入状态前退出）视为 queued；旧版本写入的完整任务记录作为状态记录读取。
+        """
+        submissions: Dict[str, Dict[str, Any]] = {}
+        statuses = []
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            if record.get("id") is not None:
+                statuses.append(record)
+            elif record.get("job_id") is not None:
+                submissions[record["job_id"]] = record
+        jobs = []
+        for status in latest_versions(statuses):
+            job = dict(status)
+            submission = submissions.pop(job["id"], None)
+            if submission is not None:
+                job.update({k: v for k, v in submission.items() if k != "job_id"})
+            jobs.append(job)
+        for submission in submissions.values():
+            job = {k: v for k, v in submission.items() if k != "job_id"}
+            job.update({"id": submission["job_id"], "status": STATUS_QUEUED, "result": None, "error": None,
+                        "started_at": None, "finished_at": None})
+            jobs.append(job)
+        jobs.sort(key=lambda j: j.get("timestamp") or "")
+        return jobs
+
+    @staticmethod
+    def _submission(job: Dict[str, Any]) -> Dict[str, Any]:
+        """任务的提交记录：不带 id 字段，状态记录的 upsert 不会覆盖它"""
+        return {
+            "job_id": job["id"],
+            "type": job.get("type"),
+            "user_id": job.get("user_id", ""),
+            "payload": job.get("payload"),
+            "timestamp": job.get("timestamp"),
+        }
+
+    @staticmethod
+    def _status(job: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """任务的状态记录：STATUS_FIELDS 加上状态变化的时间"""
+        status = {k: job.get(k) for k in STATUS_FIELDS}
+        status["timestamp"] = timestamp
+        return status
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "") -> Dict[str, Any]:
+        """提交一个任务，返回任务记录；待执行任务已满时抛出 queue.Full"""
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        now = datetime.now().isoformat()
+        job = {
+            "id": uuid.uuid4().hex,
+            "type": kind,
+            "user_id": user_id,
+            "status": STATUS_QUEUED,
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "timestamp": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+        try:
+            self.store.append(self._submission(job))
+        except Exception as e:
+            print(f"保存后台任务记录失败: {e}")
+        # 先落盘再入队，避免工作线程写入的 running 状态被 queued 覆盖
+        self._save(dict(job))
+        try:
+            self._queue.put_nowait(job["id"])
+        except queue.Full:
+            self._update(job, status=STATUS_FAILED, error="后台任务队列已满", finished_at=datetime.now().isoformat())
+            raise
+        return self._public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """返回任务记录（不含 payload），不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job is not None else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """按提交时间倒序返回内存中的任务记录（不含 payload）"""
+        with self._lock:
+            jobs = [j for j in reversed(self._jobs.values()) if status is None or j.get("status") == status]
+            return [self._public(j) for j in jobs[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        """各状态的任务数与排队长度"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.get("status")] = counts.get(job.get("status"), 0) + 1
+        return {"workers": self.workers, "pending": self._queue.qsize(), "jobs": counts}
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if k != "payload"}
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"后台任务 {job_id} 执行出错: {e}")
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+        handler = self._handlers.get(job.get("type"))
+        self._update(job, status=STATUS_RUNNING, started_at=datetime.now().isoformat())
+        if handler is None:
+            self._update(job, status=STATUS_FAILED, error=f"未注册的任务类型: {job.get('type')}",
+                         finished_at=datetime.now().isoformat())
+            return
+        try:
+            result = handler(job.get("payload") or {})
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job, status=STATUS_FAILED, error=str(e), finished_at=datetime.now().isoformat())
+        else:
+            self._update(job, status=STATUS_DONE, result=result, finished_at=datetime.now().isoformat())
+        self._trim()
+
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        with self._lock:
+            job.update(fields)
+            snapshot = dict(job)
+        self._save(snapshot)
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        try:
+            self.store.upsert(self._status(job, datetime.now().isoformat()))
+        except Exception as e:
+            print(f"保存后台任务记录失败: {e}")
+        public = self._public(job)
+        for callback in self._listeners:
+            try:
+                callback(public)
+            except Exception as e:
+                print(f"后台任务监听回调出错: {e}")
+
+    def _trim(self) -> None:
+        """内存中只保留最近 max_finished 个已结束的任务"""
+        with self._lock:
+            finished = [k for k, j in self._jobs.items() if j.get("status") in (STATUS_DONE, STATUS_FAILED)]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = False) -> None:
+        """通知工作线程在处理完队列中已有任务后退出"""
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
@@ -0,0 +1,574 @@
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple
+import os
+import json
+import base64
+import heapq
+import threading
+from src.services import serializer
+
+
+def encode_cursor(timestamp: str, seq: int) -> str:
+    """把 (timestamp, 序号) 编码为不透明的分页游标"""
+    raw = json.dumps([timestamp, seq], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析分页游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, seq = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(timestamp), int(seq)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def paginate(
+    records: Iterable[Dict[str, Any]],
+    user_id: Optional[str] = None,
+    record_type: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """对按写入顺序排列的记录做过滤与游标分页
+
+    记录以 (timestamp, 写入序号) 排序，序号保证时间戳相同的记录也有稳定顺序。
+    指定 limit 时只保留前 limit+1 条候选（堆选择），不对全部结果排序。
+    """
+    after = decode_cursor(cursor) if cursor else None
+    matched = []
+    for seq, record in enumerate(records):
+        if user_id is not None and record.get("user_id", "") != user_id:
+            continue
+        if record_type is not None and record.get("type") != record_type:
+            continue
+        ts = record.get("timestamp", "")
+        if since is not None and ts < since:
+            continue
+        if until is not None and ts >= until:
+            continue
+        key = (ts, seq)
+        if after is not None and (key >= after if descending else key <= after):
+            continue
+        matched.append((key, record))
+
+    if limit is None:
+        matched.sort(key=lambda x: x[0], reverse=descending)
+        return [r for _, r in matched], None
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(limit + 1, matched, key=lambda x: x[0])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*page[-1][0]) if page else None
+    return [r for _, r in page], next_cursor
+
+
+def latest_versions(records: Iterable[Dict[str, Any]], key: str = "id") -> List[Dict[str, Any]]:
+    """合并 upsert 追加的多个版本：同一 key 只保留最后一个版本，位置取第一次出现处；没有 key 的记录原样保留"""
+    result: List[Dict[str, Any]] = []
+    positions: Dict[Any, int] = {}
+    for record in records:
+        value = record.get(key) if isinstance(record, dict) else None
+        if value is None:
+            result.append(record)
+        elif value in positions:
+            result[positions[value]] = record
+        else:
+            positions[value] = len(result)
+            result.append(record)
+    return result
+
+
+def _timestamp(record: Dict[str, Any]) -> str:
+    return str(record.get("timestamp") or "") if isinstance(record, dict) else ""
+
+
+class TimeOrder:
+    """追加写存储的时间顺序状态：写入顺序是否仍是时间升序，以及最后一条记录的时间
+
+    写入顺序不一定等于时间顺序：旧版文件迁移、replace 传入的列表、并发写入时先取时间后追加都可能乱序。
+    known 为 False 表示尚未检查过现有文件，由 iter_ordered 首次调用时扫描一遍确定。
+    """
+
+    def __init__(self):
+        self.known = False
+        self.ordered = True
+        self.last = ""
+
+    def reset(self, records: Iterable[Dict[str, Any]] = ()) -> None:
+        """文件内容被整体替换为 records（轮转后为空）"""
+        self.known, self.ordered, self.last = True, True, ""
+        self.observe(records)
+
+    def observe(self, records: Iterable[Dict[str, Any]]) -> None:
+        """记录追加写入的 records"""
+        if not self.known:
+            return
+        for record in records:
+            ts = _timestamp(record)
+            if ts < self.last:
+                self.ordered = False
+            else:
+                self.last = ts
+
+
+class BaseRecordStore(ABC):
+    """记录存储基类：一个存储对象对应一类记录（聊天 / 表情 / 信号）"""
+
+    # 是否支持索引查询；为 False 时 query 退化为全量扫描
+    indexed = False
+
+    @abstractmethod
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录"""
+        pass
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        """批量追加记录"""
+        for record in records:
+            self.append(record)
+
+    @abstractmethod
+    def read_all(self) -> List[Dict[str, Any]]:
+        """按写入顺序返回全部记录"""
+        pass
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """按写入顺序逐条返回记录"""
+        yield from self.read_all()
+
+    def iter_ordered(self) -> Iterator[Dict[str, Any]]:
+        """按时间升序逐条返回记录
+
+        写入顺序已是时间顺序时按写入顺序流式返回，不把全部记录载入内存；
+        否则退回到读出全部记录后按时间稳定排序（时间相同的记录保持写入顺序）。
+        """
+        if self._write_order_is_time_order():
+            yield from self.iter_records()
+        else:
+            yield from sorted(self.read_all(), key=_timestamp)
+
+    def _write_order_is_time_order(self) -> bool:
+        """写入顺序是否为时间升序；默认扫描一遍全部记录判断"""
+        last = ""
+        for record in self.iter_records():
+            ts = _timestamp(record)
+            if ts < last:
+                return False
+            last = ts
+        return True
+
+    @abstractmethod
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        """用给定记录整体覆盖存储内容"""
+        pass
+
+    def clear(self) -> None:
+        """清空全部记录"""
+        self.replace([])
+
+    def upsert(self, record: Dict[str, Any], key: str = "id") -> None:
+        """按 record[key] 插入或更新一条记录
+
+        追加写的存储以追加新版本实现（不重写文件），读取方需用 latest_versions 合并同一 key 的多个版本；
+        支持原地更新的存储（JSON 数组、SQLite）会覆盖旧记录。
+        """
+        self.append(record)
+
+    def query(
+        self,
+        user_id: Optional[str] = None,
+        record_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        descending: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """按条件查询记录，结果按 timestamp 排序
+
+        Args:
+            user_id: 仅返回该用户的记录
+            record_type: 仅返回该类型（记录的 type 字段）的记录
+            since: ISO 时间字符串，包含该时刻
+            until: ISO 时间字符串，不包含该时刻
+            limit: 最多返回条数
+            descending: 为 True 时按时间倒序
+        """
+        return self.query_page(user_id, record_type, since, until, limit, None, descending)[0]
+
+    def query_page(
+        self,
+        user_id: Optional[str] = None,
+        record_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descending: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页查询，参数同 query；cursor 为上一页返回的游标
+
+        Returns:
+            (本页记录, 下一页游标)，没有更多数据时游标为 None
+        """
+        return paginate(self.iter_records(), user_id, record_type, since, until, limit, cursor, descending)
+
+    def rotate(self, dest_path: str, before: Optional[str] = None) -> bool:
+        """把活动文件中的记录移动到 dest_path 作为归档分段
+
+        Args:
+            dest_path: 分段文件路径
+            before: ISO 时间字符串；指定时只移动时间早于该时刻的记录，其余记录留在活动文件中，
+                为 None 时整个文件移动到分段，之后的写入进入新的空文件
+
+        Returns:
+            bool: 是否有记录被移动；不支持分段轮转的存储返回 False
+        """
+        return False
+
+    def flush(self) -> None:
+        """等待缓冲中的写入全部交给底层存储（默认无操作）"""
+        pass
+
+    def sync(self) -> None:
+        """将已写入的数据刷到磁盘（默认无操作）"""
+        pass
+
+    def close(self) -> None:
+        """释放文件句柄等资源（默认无操作）"""
+        pass
+
+
+class JsonArrayStore(BaseRecordStore):
+    """旧版存储：整个文件是一个带缩进的 JSON 数组，每次追加都会重写整个文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, list) else []
+        except Exception:
+            return []
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=4)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            data = self._read()
+            data.extend(records)
+            self._write(data)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._read()
+
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._write(list(records))
+
+    def upsert(self, record: Dict[str, Any], key: str = "id") -> None:
+        with self._lock:
+            data = self._read()
+            for i, existing in enumerate(data):
+                if isinstance(existing, dict) and existing.get(key) == record.get(key):
+                    data[i] = record
+                    break
+            else:
+                data.append(record)
+            self._write(data)
+
+
+class JsonlStore(BaseRecordStore):
+    """追加写存储：每行一条 JSON 记录，写入成本与历史长度无关"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = None
+        self._order = TimeOrder()
+
+    def _handle(self):
+        if self._fh is None or self._fh.closed:
+            self._fh = open(self.path, "a", encoding="utf-8")
+        return self._fh
+
+    @staticmethod
+    def _encode(record: Dict[str, Any]) -> str:
+        return serializer.dumps(record) + "\n"
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = self._encode(record)
+        with self._lock:
+            fh = self._handle()
+            fh.write(line)
+            fh.flush()
+            self._order.observe([record])
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        records = list(records)
+        chunk = "".join(self._encode(r) for r in records)
+        if not chunk:
+            return
+        with self._lock:
+            fh = self._handle()
+            fh.write(chunk)
+            fh.flush()
+            self._order.observe(records)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield serializer.loads(line)
+                except ValueError:
+                    # 进程崩溃时可能留下半行，跳过即可
+                    continue
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return list(self.iter_records())
+
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(self._encode(record))
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            os.replace(tmp_path, self.path)
+            self._order.reset(records)
+
+    def _write_order_is_time_order(self) -> bool:
+        """首次调用时扫描一遍文件（持锁，期间的追加等待），之后由写入操作增量维护"""
+        with self._lock:
+            if not self._order.known:
+                self._order.reset()
+                if self._fh is not None:
+                    self._fh.flush()
+                self._order.observe(self.iter_records())
+            return self._order.ordered
+
+    def size(self) -> int:
+        """活动文件字节数"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def first_record(self) -> Optional[Dict[str, Any]]:
+        """返回活动文件中的第一条记录（用于判断分段年龄）"""
+        for record in self.iter_records():
+            return record
+        return None
+
+    def rotate(self, dest_path: str, before: Optional[str] = None) -> bool:
+        with self._lock:
+            if self.size() == 0:
+                return False
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            if before is None:
+                os.replace(self.path, dest_path)
+                self._order.reset()
+                return True
+            # 逐行拆分：早于 before 的记录写入分段，其余记录（保持原顺序）写入新的活动文件
+            keep_path = self.path + ".tmp"
+            moved = 0
+            order = TimeOrder()
+            order.reset()
+            with open(self.path, "r", encoding="utf-8") as src, \
+                    open(dest_path + ".tmp", "w", encoding="utf-8") as old, \
+                    open(keep_path, "w", encoding="utf-8") as keep:
+                for line in src:
+                    stripped = line.strip()
+                    if not stripped:
+                        continue
+                    try:
+                        record = serializer.loads(stripped)
+                    except ValueError:
+                        continue
+                    if _timestamp(record) < before:
+                        old.write(stripped + "\n")
+                        moved += 1
+                    else:
+                        keep.write(stripped + "\n")
+                        order.observe([record])
+            if not moved:
+                os.remove(dest_path + ".tmp")
+                os.remove(keep_path)
+                return False
+            os.replace(dest_path + ".tmp", dest_path)
+            os.replace(keep_path, self.path)
+            self._order = order
+            return True
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._fh is not None and not self._fh.closed:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def migrate_json_to_jsonl(json_path: str, jsonl_path: str) -> int:
+    """将旧版 JSON 数组文件一次性迁移为 JSONL 文件
+
+    仅当 JSONL 文件尚不存在时执行；迁移完成后原文件重命名为 `*.migrated` 保留备份。
+
+    Returns:
+        int: 迁移的记录条数（未执行迁移时为 0）
+    """
+    if os.path.exists(jsonl_path) or not os.path.exists(json_path):
+        return 0
+    records = JsonArrayStore(json_path).read_all()
+    JsonlStore(jsonl_path).replace(records)
+    os.replace(json_path, json_path + ".migrated")
+    print(f"已将 {json_path} 迁移为 {jsonl_path}，共 {len(records)} 条记录")
+    return len(records)
+
+
+def read_legacy_records(data_dir: str, name: str) -> List[Dict[str, Any]]:
+    """读取 name 对应的旧版文件（依次尝试 .jsonl、.json、.msgpack），并将其重命名为 `*.migrated`"""
+    for ext, store_cls in ((".jsonl", JsonlStore), (".json", JsonArrayStore)):
+        path = os.path.join(data_dir, name + ext)
+        if os.path.exists(path):
+            records = store_cls(path).read_all()
+            os.replace(path, path + ".migrated")
+            return records
+    path = os.path.join(data_dir, name + ".msgpack")
+    if os.path.exists(path):
+        from src.services.msgpackRecordStore import MsgpackRecordStore
+        records = MsgpackRecordStore(path).read_all()
+        os.replace(path, path + ".migrated")
+        return records
+    return []
+
+
+STORAGE_BACKENDS = ("json", "jsonl", "sqlite", "msgpack")
+
+_stores: Dict[tuple, BaseRecordStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _open_store(backend: str, data_dir: str, name: str) -> BaseRecordStore:
+    """打开 data_dir 下名为 name 的底层存储，必要时迁移旧版文件（不做缓存与写后缓冲）"""
+    json_path = os.path.join(data_dir, f"{name}.json")
+    if backend == "jsonl":
+        path = os.path.join(data_dir, f"{name}.jsonl")
+        migrate_json_to_jsonl(json_path, path)
+        return JsonlStore(path)
+    if backend == "sqlite":
+        from src.services.sqliteRecordStore import SqliteRecordStore
+        store = SqliteRecordStore(os.path.join(data_dir, "luminest.db"), name)
+        if store.count() == 0:
+            legacy = read_legacy_records(data_dir, name)
+            if legacy:
+                store.extend(legacy)
+                print(f"已将旧版 {name} 数据导入 SQLite，共 {len(legacy)} 条记录")
+        return store
+    if backend == "msgpack":
+        from src.services.msgpackRecordStore import MsgpackRecordStore
+        path = os.path.join(data_dir, f"{name}.msgpack")
+        store = MsgpackRecordStore(path)
+        if not os.path.exists(path):
+            legacy = read_legacy_records(data_dir, name)
+            if legacy:
+                store.replace(legacy)
+                print(f"已将旧版 {name} 数据转换为 MessagePack，共 {len(legacy)} 条记录")
+        return store
+    return JsonArrayStore(json_path)
+
+
+def _open_sharded_store(backend: str, data_dir: str, name: str) -> BaseRecordStore:
+    """打开按用户分片的存储；首次启用时把 data_dir 下的全局文件按 user_id 拆分到各分片"""
+    from src.services.shardedRecordStore import ShardedRecordStore, get_shard_index
+    store = ShardedRecordStore(
+        get_shard_index(os.path.join(data_dir, "users")),
+        name,
+        lambda shard_dir, shard_name: _open_store(backend, shard_dir, shard_name),
+    )
+    legacy = read_legacy_records(data_dir, name)
+    if legacy:
+        store.extend(legacy)
+        print(f"已将 {name} 数据按用户拆分到 {os.path.join(data_dir, 'users')}，共 {len(legacy)} 条记录")
+    return store
+
+
+def create_record_store(backend: str, data_dir: str, name: str) -> BaseRecordStore:
+    """按后端类型创建（或复用）名为 name 的记录存储
+
+    同一文件只会创建一个存储对象，多个 DataService 实例共享它，避免并发写互相覆盖。
+    若 Config.storageSharding 为真且后端为文件存储（json / jsonl / msgpack），
+    记录按 user_id 分片存放在 data/users/<id>/ 下；sqlite 后端已按 user_id 建索引，不分片。
+    若 Config.writeBehindEnabled 为真，返回的存储会包一层 WriteBehindStore。
+
+    Args:
+        backend: 存储后端，'json'（旧版数组文件）、'jsonl'（追加写）、'sqlite'（带索引的数据库）
+            或 'msgpack'（MessagePack 追加写，需要安装 msgpack）
+        data_dir: 数据目录
+        name: 记录名称，例如 'chats'、'emotions'
+    """
+    from src.config import Config
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"不支持的存储后端: {backend}")
+    sharded = Config().storageSharding and backend != "sqlite"
+    if sharded:
+        path = os.path.join(data_dir, "users") + "#" + name
+    elif backend == "jsonl":
+        path = os.path.join(data_dir, f"{name}.jsonl")
+    elif backend == "sqlite":
+        path = os.path.join(data_dir, "luminest.db") + "#" + name
+    elif backend == "msgpack":
+        path = os.path.join(data_dir, f"{name}.msgpack")
+    else:
+        path = os.path.join(data_dir, f"{name}.json")
+    key = (backend, os.path.abspath(path))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if sharded:
+                store = _open_sharded_store(backend, data_dir, name)
+            else:
+                store = _open_store(backend, data_dir, name)
+            store = _wrap_write_behind(store)
+            _stores[key] = store
+        return store
+
+
+def _wrap_write_behind(store: BaseRecordStore) -> BaseRecordStore:
+    from src.config import Config
+    from src.services.writeBehindStore import WriteBehindStore
+    config = Config()
+    if not config.writeBehindEnabled:
+        return store
+    return WriteBehindStore(
+        store,
+        batch_size=config.writeBehindBatchSize,
+        flush_interval=config.writeBehindFlushInterval,
+        fsync_interval=config.writeBehindFsyncInterval,
+    )
@@ -0,0 +1,290 @@
+from typing import List, Dict, Any, Optional, Callable, Iterator
+from collections import Counter
+from datetime import datetime, timedelta
+import gzip
+import os
+import shutil
+import threading
+from src.config import Config
+from src.services import serializer
+from src.services.recordStore import BaseRecordStore, JsonlStore, create_record_store
+
+
+class RetentionPolicy:
+    """数据保留策略
+
+    Args:
+        max_segment_bytes: 活动文件超过该大小时，把早于 min_active_days 天的记录轮转为分段
+        max_segment_age_days: 活动文件第一条记录早于该天数时，把早于该天数的记录轮转为分段
+        compact_after_days: 分段轮转超过该天数后压缩归档
+        min_active_days: 这么多天以内的记录始终留在活动文件中，不论文件大小
+    """
+
+    def __init__(
+        self,
+        max_segment_bytes: int = 32 * 1024 * 1024,
+        max_segment_age_days: float = 30,
+        compact_after_days: float = 90,
+        min_active_days: float = 7,
+    ):
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age_days = max_segment_age_days
+        self.compact_after_days = compact_after_days
+        self.min_active_days = min_active_days
+
+
+class RetentionService:
+    """data/ 目录的分段轮转与后台压缩
+
+    仅对 jsonl 后端生效。活动文件（如 data/chats.jsonl）按大小或年龄触发轮转，只把早于截止时间的记录
+    移到 data/segments/<name>-<轮转时间>.jsonl，较新的记录留在活动文件中；启动加载与查询只读取活动文件，
+    因此启动时间和内存中的活动数据量有上界，近期数据始终可见。分段超过 compact_after_days 后压缩：
+    - emotions：按 (用户, 分钟) 降采样为摘要记录，追加到 data/archive/emotions-summary.jsonl
+    - 其余：gzip 压缩为 data/archive/<分段名>.jsonl.gz
+
+    危机信号（signals）不参与轮转：信号以 upsert 追加新版本，后台任务也按ID回写分析结果，
+    按时间拆分会把同一信号的版本分到不同文件；信号数量少，始终全部留在活动文件中。
+    """
+
+    # 参与轮转的记录
+    ROTATED = ("chats", "emotions")
+    # 可被压缩的分段（含旧版本轮转出的 signals 分段）
+    NAMES = ("chats", "emotions", "signals")
+    STAMP_FORMAT = "%Y%m%dT%H%M%S"
+
+    def __init__(self, data_dir: str = "data", policy: Optional[RetentionPolicy] = None, backend: str = "jsonl"):
+        self.data_dir = data_dir
+        self.policy = policy or RetentionPolicy()
+        self.backend = backend
+        self.segments_dir = os.path.join(data_dir, "segments")
+        self.archive_dir = os.path.join(data_dir, "archive")
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend == "jsonl"
+
+    def add_listener(self, callback: Callable[[str, str], None]) -> None:
+        """注册轮转回调，参数为 (记录名称, 分段文件路径)"""
+        self._listeners.append(callback)
+
+    def _store(self, name: str) -> BaseRecordStore:
+        return create_record_store(self.backend, self.data_dir, name)
+
+    # ---- 轮转 ----
+    def _cutoff(self, store: JsonlStore, now: datetime) -> Optional[datetime]:
+        """返回本次轮转的截止时间（早于它的记录移到分段），不需要轮转时返回 None"""
+        size = store.size()
+        if size == 0:
+            return None
+        if size >= self.policy.max_segment_bytes:
+            return now - timedelta(days=self.policy.min_active_days)
+        age_cutoff = now - timedelta(days=self.policy.max_segment_age_days)
+        first = store.first_record()
+        ts = first.get("timestamp") if isinstance(first, dict) else None
+        if not ts:
+            return None
+        try:
+            return age_cutoff if datetime.fromisoformat(ts) < age_cutoff else None
+        except ValueError:
+            return None
+
+    def rotate(self, name: str, now: Optional[datetime] = None) -> Optional[str]:
+        """按策略把名为 name 的活动文件中早于截止时间的记录轮转为分段，返回分段路径（未轮转时为 None）"""
+        if not self.enabled or name not in self.ROTATED:
+            return None
+        now = now or datetime.now()
+        store = self._store(name)
+        store.flush()
+        inner = getattr(store, "inner", store)
+        if not isinstance(inner, JsonlStore):
+            return None
+        cutoff = self._cutoff(inner, now)
+        if cutoff is None:
+            return None
+        os.makedirs(self.segments_dir, exist_ok=True)
+        segment = os.path.join(self.segments_dir, f"{name}-{now.strftime(self.STAMP_FORMAT)}.jsonl")
+        if not store.rotate(segment, before=cutoff.isoformat()):
+            return None
+        print(f"已轮转 {name} 数据分段: {segment}")
+        for callback in self._listeners:
+            try:
+                callback(name, segment)
+            except Exception as e:
+                print(f"轮转回调出错: {e}")
+        return segment
+
+    # ---- 压缩 ----
+    def _segments(self) -> Iterator[tuple]:
+        """返回 (记录名称, 分段路径, 轮转时间)"""
+        if not os.path.isdir(self.segments_dir):
+            return
+        for filename in sorted(os.listdir(self.segments_dir)):
+            stem, ext = os.path.splitext(filename)
+            name, _, stamp = stem.rpartition("-")
+            if ext != ".jsonl" or name not in self.NAMES:
+                continue
+            try:
+                rotated_at = datetime.strptime(stamp, self.STAMP_FORMAT)
+            except ValueError:
+                continue
+            yield name, os.path.join(self.segments_dir, filename), rotated_at
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """压缩所有超过 compact_after_days 的分段，返回处理的分段数"""
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=self.policy.compact_after_days)
+        done = 0
+        for name, path, rotated_at in list(self._segments()):
+            if rotated_at >= cutoff:
+                continue
+            os.makedirs(self.archive_dir, exist_ok=True)
+            try:
+                if name == "emotions":
+                    self._downsample_emotions(path)
+                else:
+                    self._gzip_segment(path)
+                os.remove(path)
+                done += 1
+            except Exception as e:
+                print(f"压缩数据分段 {path} 失败: {e}")
+        return done
+
+    def _gzip_segment(self, path: str) -> None:
+        dest = os.path.join(self.archive_dir, os.path.basename(path) + ".gz")
+        tmp = dest + ".tmp"
+        with open(path, "rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, dest)
+
+    def _downsample_emotions(self, path: str) -> None:
+        """把分段中的表情帧按 (用户, 分钟) 聚合为摘要：帧数、主导情绪计数与平均概率"""
+        summaries = JsonlStore(os.path.join(self.archive_dir, "emotions-summary.jsonl"))
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        current_minute = None
+        try:
+            for record in JsonlStore(path).iter_records():
+                ts = record.get("timestamp") or ""
+                minute = ts[:16]
+                if len(minute) < 16:
+                    continue
+                if current_minute is not None and minute != current_minute:
+                    # 分段按时间顺序写入，分钟变化时此前的分组都已完整
+                    summaries.extend(self._summary(k, g) for k, g in groups.items())
+                    groups = {}
+                current_minute = minute
+                key = (record.get("user_id", ""), minute)
+                group = groups.setdefault(key, {"frames": 0, "dominant": Counter(), "sums": Counter()})
+                data = record.get("data") if isinstance(record.get("data"), dict) else {}
+                group["frames"] += 1
+                group["dominant"][data.get("dominant_emotion") or "unknown"] += 1
+                for label, value in (data.get("emotions") or {}).items():
+                    group["sums"][label] += float(value)
+            summaries.extend(self._summary(k, g) for k, g in groups.items())
+            summaries.sync()
+        finally:
+            summaries.close()
+
+    @staticmethod
+    def _summary(key: tuple, group: Dict[str, Any]) -> Dict[str, Any]:
+        user_id, minute = key
+        frames = group["frames"]
+        return {
+            "type": "emotion_summary",
+            "user_id": user_id,
+            "timestamp": minute + ":00",
+            "frames": frames,
+            "data": {
+                "dominant_emotion": group["dominant"].most_common(1)[0][0],
+                "dominant_counts": dict(group["dominant"]),
+                "mean_emotions": {k: v / frames for k, v in group["sums"].items()},
+            },
+        }
+
+    # ---- 调度 ----
+    def run_once(self, now: Optional[datetime] = None) -> None:
+        """执行一轮轮转与压缩"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for name in self.ROTATED:
+                try:
+                    self.rotate(name, now)
+                except Exception as e:
+                    print(f"轮转 {name} 数据失败: {e}")
+            self.compact(now)
+
+    def start(self, interval: float = 3600) -> None:
+        """启动后台线程，每隔 interval 秒执行一次 run_once"""
+        if not self.enabled or self._thread is not None:
+            return
+
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"数据保留任务出错: {e}")
+
+        self._thread = threading.Thread(target=_loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def rotated_files(data_dir: str, name: str) -> List[str]:
+    """返回名为 name 的记录已轮转出活动文件的分段与归档文件，按时间先后排列（归档早于分段）
+
+    表情的归档是降采样后的摘要 archive/emotions-summary.jsonl，其余记录为 archive/<分段名>.jsonl.gz。
+    """
+    files = []
+    archive_dir = os.path.join(data_dir, "archive")
+    if os.path.isdir(archive_dir):
+        if name == "emotions":
+            summary = os.path.join(archive_dir, "emotions-summary.jsonl")
+            if os.path.exists(summary):
+                files.append(summary)
+        else:
+            files.extend(os.path.join(archive_dir, f) for f in sorted(os.listdir(archive_dir))
+                         if f.startswith(name + "-") and f.endswith(".jsonl.gz"))
+    segments_dir = os.path.join(data_dir, "segments")
+    if os.path.isdir(segments_dir):
+        files.extend(os.path.join(segments_dir, f) for f in sorted(os.listdir(segments_dir))
+                     if f.startswith(name + "-") and f.endswith(".jsonl"))
+    return files
+
+
+def iter_rotated(data_dir: str, name: str) -> Iterator[Dict[str, Any]]:
+    """按时间先后逐条读取已轮转出活动文件的记录（见 rotated_files），无法解析的行跳过"""
+    for path in rotated_files(data_dir, name):
+        if not path.endswith(".gz"):
+            yield from JsonlStore(path).iter_records()
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield serializer.loads(line)
+                except ValueError:
+                    continue
+
+
+def create_retention_service(data_dir: str = "data") -> Optional[RetentionService]:
+    """按 Config 创建保留服务；未启用时返回 None"""
+    config = Config()
+    # 按用户分片时每个分片都很小，不做轮转
+    if not config.retentionEnabled or config.storageSharding:
+        return None
+    policy = RetentionPolicy(
+        max_segment_bytes=config.retentionMaxSegmentBytes,
+        max_segment_age_days=config.retentionMaxSegmentAgeDays,
+        compact_after_days=config.retentionCompactAfterDays,
+        min_active_days=config.retentionMinActiveDays,
+    )
+    return RetentionService(data_dir, policy, backend=config.storageBackend)
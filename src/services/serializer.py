@@ -0,0 +1,47 @@
+"""
+序列化层：安装了 orjson 时使用 orjson，否则退回标准库 json
+
+所有输出均为紧凑格式且保留非 ASCII 字符（等价于 json.dumps(..., ensure_ascii=False)）。
+"""
+from typing import Any, Union
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为 UTF-8 编码的紧凑 JSON 字节串"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=_OPTIONS)
+        except TypeError:
+            # orjson 不支持的类型（如超出 64 位的整数）交给标准库处理
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑 JSON 字符串"""
+    if orjson is not None:
+        return dumps_bytes(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_pretty(obj: Any) -> str:
+    """序列化为带缩进的 JSON 字符串，用于需要人工查看的配置类文件"""
+    return json.dumps(obj, ensure_ascii=False, indent=4)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """反序列化 JSON，解析失败时抛出 ValueError（json.JSONDecodeError 是其子类）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
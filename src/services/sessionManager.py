@@ -0,0 +1,122 @@
+from typing import List, Dict, Any, Optional, Callable
+from collections import OrderedDict
+import threading
+import time
+
+
+class ChatSession:
+    """一个会话的对话状态：按时间顺序保存的消息，最多保留 max_messages 条"""
+
+    def __init__(self, session_id: str, messages: List[Dict[str, Any]], max_messages: int):
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.messages: List[Dict[str, Any]] = messages[-max_messages:] if max_messages else list(messages)
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        # 上下文构建器为该会话缓存的状态（见 ContextBuilder）
+        self.context = None
+
+    def append(self, message: Dict[str, Any]) -> None:
+        with self.lock:
+            self.messages.append(message)
+            overflow = len(self.messages) - self.max_messages
+            if self.max_messages and overflow > 0:
+                del self.messages[:overflow]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.messages = []
+
+
+class SessionManager:
+    """多会话对话状态管理
+
+    会话按 session_id 首次访问时通过 loader 从存储懒加载，热会话保存在容量为 max_sessions 的
+    LRU 中；超过 idle_timeout 秒未访问的会话在下次访问管理器时被淘汰（之后再访问会重新加载）。
+    每个会话最多在内存中保留 max_messages 条消息，内存占用与并发用户数、历史长度都有上界。
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str, int], List[Dict[str, Any]]],
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800,
+        max_messages: int = 200,
+    ):
+        """
+        Args:
+            loader: (session_id, 条数上限) -> 该会话最近的消息（时间升序）
+            max_sessions: 内存中最多保留的会话数
+            idle_timeout: 会话空闲多少秒后淘汰，0 表示不按空闲时间淘汰
+            max_messages: 每个会话最多保留的消息数
+        """
+        self.loader = loader
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> ChatSession:
+        """返回会话（不存在时从存储加载），并将其标记为最近使用"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.last_active = now
+                return session
+        # 加载可能读磁盘，不持有管理器锁
+        try:
+            messages = self.loader(session_id, self.max_messages)
+        except Exception as e:
+            print(f"加载会话 {session_id} 的聊天记录失败: {e}")
+            messages = []
+        loaded = ChatSession(session_id, messages, self.max_messages)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                # 并发加载同一会话时只保留先放入的那份
+                session = loaded
+                self._sessions[session_id] = session
+                self.loads += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            self._sessions.move_to_end(session_id)
+            session.last_active = now
+            return session
+
+    def _evict_idle(self, now: float) -> None:
+        # LRU 头部是最久未访问的会话，只需从头部检查
+        if self.idle_timeout <= 0:
+            return
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_active < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def drop(self, session_id: str) -> None:
+        """从内存中移除会话（下次访问时重新加载）"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self) -> None:
+        """移除全部内存中的会话"""
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """会话数量、缓存的消息总数及加载/淘汰次数"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
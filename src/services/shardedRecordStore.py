@@ -0,0 +1,296 @@
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple, Callable
+from collections import OrderedDict
+from datetime import datetime
+import base64
+import hashlib
+import heapq
+import os
+import re
+import threading
+from src.services import serializer
+from src.services.recordStore import BaseRecordStore
+
+# 可直接用作目录名的用户ID（仅小写）；其余ID（含空字符串）使用以下划线开头的派生目录名，二者不会冲突
+_SAFE_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+_CASED_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+ANONYMOUS_DIR = "_anonymous"
+
+
+def _digest(user_id: str, length: int) -> str:
+    return hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:length]
+
+
+def shard_dir_name(user_id: str) -> str:
+    """把用户ID映射为分片目录名
+
+    Windows / macOS 默认的文件系统不区分大小写，"Alice" 与 "alice" 会落到同一目录，
+    因此含大写字母的ID使用小写形式加原始ID的哈希后缀（如 "_alice.1a2b3c4d"），不同大小写得到不同目录。
+    """
+    if not user_id:
+        return ANONYMOUS_DIR
+    if _SAFE_ID.match(user_id):
+        return user_id
+    if _CASED_ID.match(user_id):
+        return f"_{user_id.lower()}.{_digest(user_id, 8)}"
+    return "_h" + _digest(user_id, 16)
+
+
+def _encode_cursor(key: Tuple[str, str, int]) -> str:
+    """把跨分片排序键 (timestamp, user_id, 分片内序号) 编码为不透明的分页游标"""
+    raw = serializer.dumps(list(key)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """解析跨分片分页游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, user_id, seq = serializer.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return str(timestamp), str(user_id), int(seq)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+class ShardIndex:
+    """用户分片目录索引：data/users/index.json，记录 用户ID -> 分片目录
+
+    目录名由用户ID派生，但含特殊字符的ID只能经索引还原，因此列举用户以索引为准。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = serializer.loads(f.read())
+            users = data.get("users") if isinstance(data, dict) else None
+            return users if isinstance(users, dict) else {}
+        except Exception as e:
+            print(f"读取用户分片索引失败: {e}")
+            return {}
+
+    def _save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(serializer.dumps_pretty({"users": self._users}))
+        os.replace(tmp_path, self.path)
+
+    def users(self) -> List[str]:
+        """返回已有分片的用户ID"""
+        with self._lock:
+            return list(self._users)
+
+    def shard_dir(self, user_id: str, create: bool = False) -> Optional[str]:
+        """返回用户的分片目录；create 为 True 时为新用户登记并创建目录，否则不存在时返回 None"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                if not create:
+                    return None
+                entry = {"dir": shard_dir_name(user_id), "created_at": datetime.now().isoformat()}
+                os.makedirs(os.path.join(self.root, entry["dir"]), exist_ok=True)
+                self._users[user_id] = entry
+                self._save()
+            return os.path.join(self.root, entry["dir"])
+
+
+class ShardedRecordStore(BaseRecordStore):
+    """按 user_id 分片的记录存储：每个用户一个目录 data/users/<id>/<name>.<ext>
+
+    每个分片是一个独立的文件存储（各自持有锁），不同用户的写入互不争用；
+    指定 user_id 的查询只读取该用户的分片，不指定时按时间归并所有分片。
+    跨分片的写入顺序不保留，read_all / iter_records 均按时间升序返回。
+    跨分片分页以 (timestamp, user_id, 分片内序号) 排序，这个键不随其他分片的增减变化，
+    翻页期间出现新用户的分片也不会跳过或重复记录。
+    """
+
+    def __init__(
+        self,
+        index: ShardIndex,
+        name: str,
+        open_shard: Callable[[str, str], BaseRecordStore],
+        max_open: int = 128,
+    ):
+        """
+        Args:
+            index: 共享的用户分片目录索引
+            name: 记录名称，例如 'chats'
+            open_shard: (分片目录, 记录名称) -> 分片存储
+            max_open: 最多保持打开写句柄的分片数，超出时关闭最久未写入的分片句柄
+        """
+        self.index = index
+        self.name = name
+        self._open_shard = open_shard
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._shards: Dict[str, BaseRecordStore] = {}
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    def _shard(self, user_id: str, create: bool = False) -> Optional[BaseRecordStore]:
+        with self._lock:
+            store = self._shards.get(user_id)
+            if store is not None:
+                return store
+            path = self.index.shard_dir(user_id, create=create)
+            if path is None:
+                return None
+            store = self._open_shard(path, self.name)
+            self._shards[user_id] = store
+            return store
+
+    def _all_shards(self) -> List[BaseRecordStore]:
+        return [s for s in (self._shard(u) for u in self.index.users()) if s is not None]
+
+    def _touch(self, user_id: str) -> None:
+        """记录最近写入的分片，关闭超出上限的旧句柄（再次写入时会自动重新打开）"""
+        with self._lock:
+            self._recent[user_id] = None
+            self._recent.move_to_end(user_id)
+            while len(self._recent) > self.max_open:
+                stale, _ = self._recent.popitem(last=False)
+                store = self._shards.get(stale)
+                if store is not None:
+                    store.close()
+
+    @staticmethod
+    def _group(records: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            groups.setdefault(str(record.get("user_id") or ""), []).append(record)
+        return groups
+
+    def users(self) -> List[str]:
+        """返回有分片的用户ID"""
+        return self.index.users()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for user_id, group in self._group(records).items():
+            self._shard(user_id, create=True).extend(group)
+            self._touch(user_id)
+
+    def upsert(self, record: Dict[str, Any], key: str = "id") -> None:
+        user_id = str(record.get("user_id") or "")
+        self._shard(user_id, create=True).upsert(record, key)
+        self._touch(user_id)
+
+    def iter_ordered(self) -> Iterator[Dict[str, Any]]:
+        return heapq.merge(
+            *(s.iter_ordered() for s in self._all_shards()),
+            key=lambda r: r.get("timestamp", ""),
+        )
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_ordered()
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return list(self.iter_ordered())
+
+    def query_page(
+        self,
+        user_id: Optional[str] = None,
+        record_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descending: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if user_id is not None:
+            shard = self._shard(user_id)
+            if shard is None:
+                return [], None
+            return shard.query_page(user_id, record_type, since, until, limit, cursor, descending)
+        return self._paginate_merged(record_type, since, until, limit, cursor, descending)
+
+    def _iter_keyed(self) -> Iterator[Tuple[Tuple[str, str, int], Dict[str, Any]]]:
+        """按 (timestamp, user_id, 分片内序号) 归并所有分片，返回 (排序键, 记录)"""
+        def keyed(user_id: str, shard: BaseRecordStore):
+            for seq, record in enumerate(shard.iter_ordered()):
+                yield (record.get("timestamp", ""), user_id, seq), record
+
+        shards = [(u, self._shard(u)) for u in self.index.users()]
+        return heapq.merge(*(keyed(u, s) for u, s in shards if s is not None), key=lambda x: x[0])
+
+    def _paginate_merged(
+        self,
+        record_type: Optional[str],
+        since: Optional[str],
+        until: Optional[str],
+        limit: Optional[int],
+        cursor: Optional[str],
+        descending: bool,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """跨分片的过滤与游标分页，与 paginate 相同，只是排序键换成跨分片稳定的键"""
+        after = _decode_cursor(cursor) if cursor else None
+        matched = []
+        for key, record in self._iter_keyed():
+            if record_type is not None and record.get("type") != record_type:
+                continue
+            ts = key[0]
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts >= until:
+                continue
+            if after is not None and (key >= after if descending else key <= after):
+                continue
+            matched.append((key, record))
+
+        if limit is None:
+            matched.sort(key=lambda x: x[0], reverse=descending)
+            return [r for _, r in matched], None
+        select = heapq.nlargest if descending else heapq.nsmallest
+        page = select(limit + 1, matched, key=lambda x: x[0])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = _encode_cursor(page[-1][0]) if page else None
+        return [r for _, r in page], next_cursor
+
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        groups = self._group(records)
+        for user_id in set(self.index.users()) | set(groups):
+            shard = self._shard(user_id, create=user_id in groups)
+            if shard is not None:
+                shard.replace(groups.get(user_id, []))
+
+    def clear(self) -> None:
+        for shard in self._all_shards():
+            shard.clear()
+
+    def sync(self) -> None:
+        with self._lock:
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.sync()
+
+    def close(self) -> None:
+        with self._lock:
+            shards = list(self._shards.values())
+            self._recent.clear()
+        for shard in shards:
+            shard.close()
+
+
+_indexes: Dict[str, ShardIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_shard_index(root: str) -> ShardIndex:
+    """返回 root 目录共享的分片索引（chats / emotions / signals 共用一份）"""
+    path = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = ShardIndex(path)
+            _indexes[path] = index
+        return index
@@ -0,0 +1,125 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import deque
+import itertools
+import queue
+import threading
+import uuid
+
+# 事件类型：新信号 / 已有信号被原地更新（表情发作片段）/ 信号列表被清空或重新加载（客户端应重新拉取列表）
+EVENT_SIGNAL = "signal"
+EVENT_UPDATE = "signal_update"
+EVENT_RESET = "reset"
+
+
+class Subscription:
+    """一个推送订阅：broker 把事件放入队列，由 SSE 响应线程取出"""
+
+    def __init__(self, broker: "SignalBroker", max_pending: int):
+        self._broker = broker
+        self._queue: "queue.Queue[Tuple[str, str, Any]]" = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def put(self, event: Tuple[str, str, Any]) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # 客户端消费太慢：丢弃积压并要求其重新拉取列表，而不是无限占用内存
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Tuple[str, str, Any]]:
+        """取出下一个事件，超时返回 None；积压溢出时返回一个 reset 事件"""
+        if self.overflowed:
+            self.overflowed = False
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            return self._broker.format_id(self._broker.last_id), EVENT_RESET, None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._broker.unsubscribe(self)
+
+
+class SignalBroker:
+    """进程内危险信号发布/订阅
+
+    作为 SignalService 的监听回调接收新信号，为每个事件分配递增ID，保存在环形缓冲中，
+    并推送给所有订阅者。事件ID形如 "<启动标识>-<序号>"，启动标识每次进程启动时随机生成，
+    服务重启后序号从头开始也不会与重启前的ID混淆。客户端断线重连时携带 Last-Event-ID，从缓冲中补发之后的事件；
+    缓冲中已找不到该ID（断线太久）或ID来自另一次启动时，不据此补发，而是发一个 reset 事件，由客户端重新拉取列表。
+    """
+
+    def __init__(self, buffer_size: int = 500, max_pending: int = 1000):
+        self._lock = threading.Lock()
+        self.boot = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+        self._buffer: "deque[Tuple[int, Tuple[str, str, Any]]]" = deque(maxlen=buffer_size)
+        self._subscribers: List[Subscription] = []
+        self.max_pending = max_pending
+        self.last_id = 0
+
+    def on_signal(self, kind: str, signal: Optional[Dict[str, Any]]) -> None:
+        """SignalService 监听回调：signal 为 None 表示信号列表被清空或重新加载"""
+        if signal is None:
+            self.publish(EVENT_RESET, None)
+        else:
+            self.publish(EVENT_UPDATE if kind == EVENT_UPDATE else EVENT_SIGNAL, signal)
+
+    def format_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def _parse_id(self, event_id: str) -> Optional[int]:
+        """取出本次启动分配的事件ID中的序号；来自其他启动或格式错误时返回 None"""
+        boot, sep, seq = event_id.rpartition("-")
+        if not sep or boot != self.boot or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, event_type: str, data: Any) -> str:
+        """发布一个事件，返回事件ID"""
+        with self._lock:
+            seq = next(self._ids)
+            event = (self.format_id(seq), event_type, data)
+            self.last_id = seq
+            self._buffer.append((seq, event))
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+        return event[0]
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[Subscription, List[Tuple[str, str, Any]]]:
+        """订阅后续事件
+
+        Args:
+            last_event_id: 客户端已收到的最后一个事件ID（断线重连时由 Last-Event-ID 请求头给出）
+
+        Returns:
+            (订阅, 需要先补发的事件列表)
+        """
+        subscription = Subscription(self, self.max_pending)
+        with self._lock:
+            self._subscribers.append(subscription)
+            if not last_event_id:
+                return subscription, []
+            seq = self._parse_id(last_event_id)
+            reset = [(self.format_id(self.last_id), EVENT_RESET, None)]
+            if seq is None:
+                # 服务重启前的ID：重启前后的序号互不相关，不能据此补发
+                return subscription, reset
+            if seq == self.last_id:
+                return subscription, []
+            oldest = self._buffer[0][0] if self._buffer else self.last_id + 1
+            if seq < oldest - 1 or seq > self.last_id:
+                return subscription, reset
+            return subscription, [event for s, event in self._buffer if s > seq]
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
@@ -1,46 +1,230 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
+from collections import Counter
 from datetime import datetime
-import json
+import bisect
 import os
+import threading
+import uuid
+from src.config import Config
 from src.services.baseSignalService import BaseSignalService
+from src.services.recordStore import (
+    BaseRecordStore, create_record_store, paginate, encode_cursor, decode_cursor, latest_versions,
+)
+
+
+class _TimeIndex:
+    """按 timestamp 有序的信号列表，附带并行的时间键列表用于二分查找
+
+    信号基本按时间顺序到达，追加为 O(1)；乱序到达时按时间插入到正确位置。
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.items: List[Dict] = []
+
+    def add(self, signal: Dict) -> None:
+        ts = signal.get("timestamp", "") or ""
+        if not self.keys or ts >= self.keys[-1]:
+            self.keys.append(ts)
+            self.items.append(signal)
+        else:
+            i = bisect.bisect_right(self.keys, ts)
+            self.keys.insert(i, ts)
+            self.items.insert(i, signal)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def newest(self, limit: Optional[int] = None) -> List[Dict]:
+        """返回最新的 limit 条（倒序），只复制返回的部分"""
+        n = len(self.items) if limit is None else min(limit, len(self.items))
+        return [self.items[-1 - i] for i in range(n)]
+
+    def page(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """按时间倒序分页，游标格式与 paginate 一致（时间戳, 在本列表中的位置）"""
+        lo = bisect.bisect_left(self.keys, since) if since is not None else 0
+        hi = bisect.bisect_left(self.keys, until) if until is not None else len(self.items)
+        if cursor:
+            hi = min(hi, decode_cursor(cursor)[1])
+        start = lo if limit is None else max(lo, hi - limit)
+        page = [self.items[i] for i in range(hi - 1, start - 1, -1)]
+        next_cursor = encode_cursor(self.keys[start], start) if page and start > lo else None
+        return page, next_cursor
+
 
 class SignalService(BaseSignalService):
-    """危险信号服务实现"""
+    """危险信号服务实现
+
+    内存中按时间维护全部信号，并维护按类型、用户ID、日期（YYYY-MM-DD）的二级索引，
+    按条件查询与取最新 N 条的开销只与结果条数有关。
+
+    同一用户连续的表情危险信号（相邻两帧间隔不超过 Config.emotionEpisodeWindow 秒）会合并为
+    一条“发作片段”信号并原地更新，记录起止时间、帧数以及各情绪的峰值与均值。
+    """
     
-    def __init__(self, signals_file: str = os.path.join("data", "signals.json")):
+    def __init__(self, signals_file: str = os.path.join("data", "signals.json"), backend: Optional[str] = None):
         """
         初始化危险信号服务
-        :param signals_file: 信号存储文件路径
+        :param signals_file: 信号存储文件路径（目录与文件名决定存储位置，扩展名由存储后端决定）
+        :param backend: 存储后端，默认取 Config.storageBackend
         """
-        self.signals: List[Dict] = []
+        self._lock = threading.RLock()
+        self.episode_window = Config().emotionEpisodeWindow
+        self._reset_indexes()
         self.signals_file = signals_file
+        self._listeners: List[Callable[[str, Optional[Dict]], None]] = []
+        data_dir = os.path.dirname(self.signals_file) or "."
         # 确保目录存在
         try:
-            dir_path = os.path.dirname(self.signals_file)
-            if dir_path:
-                os.makedirs(dir_path, exist_ok=True)
+            os.makedirs(data_dir, exist_ok=True)
         except Exception:
             pass
+        name = os.path.splitext(os.path.basename(self.signals_file))[0]
+        self.store: BaseRecordStore = create_record_store(backend or Config().storageBackend, data_dir, name)
         self.load_signals()
         
-    def add_emotion_signal(self, emotion_data: Dict) -> None:
+    def _reset_indexes(self) -> None:
+        self._all = _TimeIndex()
+        self._by_type: Dict[str, _TimeIndex] = {}
+        self._by_user: Dict[str, _TimeIndex] = {}
+        self._by_day: Dict[str, _TimeIndex] = {}
+        # self.signals 与时间索引共用同一个有序列表
+        self.signals: List[Dict] = self._all.items
+        # 每个用户当前（最近）的表情发作片段
+        self._episodes: Dict[str, Dict] = {}
+        # 带 id 的信号（发作片段、危险对话），用于原地更新
+        self._by_id: Dict[str, Dict] = {}
+
+    def _index(self, signal: Dict) -> None:
+        self._all.add(signal)
+        self._by_type.setdefault(signal.get("type") or "", _TimeIndex()).add(signal)
+        self._by_user.setdefault(signal.get("user_id") or "", _TimeIndex()).add(signal)
+        self._by_day.setdefault((signal.get("timestamp") or "")[:10], _TimeIndex()).add(signal)
+        if signal.get("id"):
+            self._by_id[signal["id"]] = signal
+        if signal.get("type") == "emotion" and isinstance(signal.get("episode"), dict):
+            self._episodes[signal.get("user_id") or ""] = signal
+
+    def add_listener(self, callback: Callable[[str, Optional[Dict]], None]) -> None:
+        """
+        注册新信号监听回调
+        :param callback: 回调参数为 ('signal', signal)；signal 为 None 表示信号列表被清空或重新加载
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, signal: Optional[Dict], kind: str = "signal") -> None:
+        for callback in self._listeners:
+            try:
+                callback(kind, signal)
+            except Exception as e:
+                print(f"信号监听回调出错: {e}")
+
+    def add_emotion_signal(self, emotion_data: Dict, user_id: str = "", timestamp: Optional[str] = None) -> None:
         """添加表情分析危险信号
         
+        若该用户上一帧危险表情距今不超过 episode_window 秒，则合并进同一个发作片段并原地更新，
+        否则开启新的片段；episode_window 为 0 时每帧单独记录为一条信号。
+        
         Args:
             emotion_data: 表情分析结果
+            user_id: 用户ID
+            timestamp: 该帧的 ISO 时间（可选，默认当前时间）
         """
-        signal = {
+        timestamp = timestamp or datetime.now().isoformat()
+        if self.episode_window <= 0:
+            self.add_signal({
+                "type": "emotion",
+                "user_id": user_id,
+                "trigger_message": emotion_data["dominant_emotion"],
+                "timestamp": timestamp,
+                "data": {
+                    "dominant_emotion": emotion_data["dominant_emotion"],
+                    "emotions": emotion_data["emotions"]
+                },
+                "analyze": f"用户表情呈现出抑郁特征，请关注用户情绪健康。"
+            })
+            return
+        with self._lock:
+            episode = self._episodes.get(user_id)
+            if episode is not None and self._within_window(episode["episode"]["end"], timestamp):
+                self._extend_episode(episode, emotion_data, timestamp)
+                updated = dict(episode)
+            else:
+                episode = None
+        if episode is None:
+            self.add_signal(self._new_episode(emotion_data, user_id, timestamp))
+            return
+        try:
+            self.store.upsert(updated)
+        except Exception as e:
+            print(f"更新表情发作片段失败: {e}")
+        self._notify(updated, "signal_update")
+
+    def _within_window(self, last: str, current: str) -> bool:
+        try:
+            gap = (datetime.fromisoformat(current) - datetime.fromisoformat(last)).total_seconds()
+        except (TypeError, ValueError):
+            return False
+        return 0 <= gap <= self.episode_window
+
+    @staticmethod
+    def _new_episode(emotion_data: Dict, user_id: str, timestamp: str) -> Dict[str, Any]:
+        emotions = {k: float(v) for k, v in emotion_data["emotions"].items()}
+        dominant = emotion_data["dominant_emotion"]
+        return {
+            "id": uuid.uuid4().hex,
             "type": "emotion",
-            "user_id": "",
-            "trigger_message": emotion_data["dominant_emotion"],
-            "timestamp": datetime.now().isoformat(),
+            "user_id": user_id,
+            "trigger_message": dominant,
+            "timestamp": timestamp,
             "data": {
-                "dominant_emotion": emotion_data["dominant_emotion"],
-                "emotions": emotion_data["emotions"]
+                "dominant_emotion": dominant,
+                "emotions": emotions
+            },
+            "episode": {
+                "start": timestamp,
+                "end": timestamp,
+                "frames": 1,
+                "dominant_counts": {dominant: 1},
+                "peak": dict(emotions),
+                "mean": dict(emotions),
             },
             "analyze": f"用户表情呈现出抑郁特征，请关注用户情绪健康。"
         }
-        self.add_signal(signal)
+
+    @staticmethod
+    def _extend_episode(signal: Dict[str, Any], emotion_data: Dict, timestamp: str) -> None:
+        """把一帧合并进发作片段；嵌套字典整体替换而不是原地修改，已交给存储的旧版本不受影响"""
+        old = signal["episode"]
+        frames = old["frames"] + 1
+        emotions = {k: float(v) for k, v in emotion_data["emotions"].items()}
+        labels = set(old["mean"]) | set(emotions)
+        mean = {
+            k: old["mean"].get(k, 0.0) + (emotions.get(k, 0.0) - old["mean"].get(k, 0.0)) / frames
+            for k in labels
+        }
+        peak = {k: max(old["peak"].get(k, 0.0), emotions.get(k, 0.0)) for k in labels}
+        counts = Counter(old["dominant_counts"])
+        counts[emotion_data["dominant_emotion"]] += 1
+        dominant = counts.most_common(1)[0][0]
+        minutes = (datetime.fromisoformat(timestamp) - datetime.fromisoformat(old["start"])).total_seconds() / 60
+        signal["episode"] = {
+            "start": old["start"],
+            "end": timestamp,
+            "frames": frames,
+            "dominant_counts": dict(counts),
+            "peak": peak,
+            "mean": mean,
+        }
+        signal["trigger_message"] = dominant
+        signal["data"] = {"dominant_emotion": dominant, "emotions": mean}
+        signal["analyze"] = f"用户表情持续呈现出抑郁特征（{frames} 帧，约 {minutes:.1f} 分钟），请关注用户情绪健康。"
         
     def add_signal(self, signal: Dict[str, Any]) -> None:
         """
@@ -50,41 +234,128 @@ class SignalService(BaseSignalService):
         if not isinstance(signal, dict):
             raise ValueError("信号数据必须是字典类型")
         print("收到了新的危机信号:", signal.get('type'), signal.get('trigger_message'))
-        self.signals.append(signal)
+        with self._lock:
+            self._index(signal)
         try:
-            self.save_signals()
+            self.store.append(signal)
         except Exception as e:
             # 保存失败时打印错误，但不要抛出异常以免影响调用者（例如流式处理器）
             print(f"保存危险信号失败: {e}")
+        self._notify(signal)
         
-    def add_dangerous_chat(self, user_id: str, content: str, analysis: str) -> None:
+    def add_dangerous_chat(self, user_id: str, content: str, analysis: Optional[str] = None,
+                           screening: Optional[Dict] = None) -> Dict:
         """
         添加一个危险对话记录
         :param user_id: 用户ID
         :param content: 对话内容
-        :param analysis: 分析结果
+        :param analysis: 分析结果；为 None 表示分析在后台进行，完成后用 update_signal 写入
+        :param screening: 本地词库预筛结果 {"score", "terms"}；不为 None 时记录为等待智能体确认的临时信号
+        :return: 新添加的信号
         """
         signal = {
+            "id": uuid.uuid4().hex,
             "type": "dangerous_chat",
             "user_id": user_id,
             "trigger_message": content,
-            "analyze": analysis,
+            "analyze": analysis if analysis is not None else "危机分析进行中…",
             "timestamp": datetime.now().isoformat()
         }
+        if screening is not None:
+            signal["provisional"] = True
+            signal["screening"] = screening
+            signal["analysis_status"] = "provisional"
+            signal["analyze"] = (
+                f"本地词库预警（风险分 {screening.get('score', 0):.2f}，命中：{'、'.join(screening.get('terms') or [])}），"
+                "等待智能体确认…"
+            )
+        elif analysis is None:
+            signal["analysis_status"] = "pending"
         self.add_signal(signal)
+        return signal
+
+    def get_signal(self, signal_id: str) -> Optional[Dict]:
+        """按 id 获取信号，不存在时返回 None"""
+        return self._by_id.get(signal_id)
+
+    def update_signal(self, signal_id: str, fields: Dict[str, Any]) -> Optional[Dict]:
+        """
+        原地更新一个带 id 的信号并持久化，监听者收到 'signal_update'
+        :param signal_id: 信号 id
+        :param fields: 要更新的字段
+        :return: 更新后的信号，不存在时返回 None
+        """
+        with self._lock:
+            signal = self._by_id.get(signal_id)
+            if signal is None:
+                return None
+            signal.update(fields)
+            updated = dict(signal)
+        try:
+            self.store.upsert(updated)
+        except Exception as e:
+            print(f"更新危险信号失败: {e}")
+        self._notify(updated, "signal_update")
+        return updated
         
-    def get_signals(self) -> List[Dict]:
+    def get_signals(self, limit: Optional[int] = None) -> List[Dict]:
         """
-        获取所有危险信号
+        获取危险信号
+        :param limit: 最多返回条数，默认返回全部
         :return: 危险信号列表（倒序排列）
         """
-        return self.signals[::-1]
+        return self._all.newest(limit)
         
+    def iter_signals(self) -> Iterator[Dict]:
+        """
+        逐条返回所有危险信号（倒序），不复制信号列表
+        :return: 危险信号迭代器
+        """
+        return reversed(self.signals)
+
+    def get_signals_page(
+        self,
+        signal_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按条件分页获取危险信号（按时间倒序）
+        :param signal_type: 信号类型
+        :param user_id: 用户ID
+        :param since: ISO 时间字符串，包含该时刻
+        :param until: ISO 时间字符串，不包含该时刻
+        :param limit: 每页条数
+        :param cursor: 上一页返回的游标
+        :return: (本页信号, 下一页游标)
+        """
+        with self._lock:
+            if signal_type is not None and user_id is not None:
+                # 两个条件同时指定时在较小的索引上过滤另一个条件
+                by_type = self._by_type.get(signal_type)
+                by_user = self._by_user.get(user_id)
+                if by_type is None or by_user is None:
+                    return [], None
+                if len(by_type) <= len(by_user):
+                    return paginate(by_type.items, user_id, None, since, until, limit, cursor, descending=True)
+                return paginate(by_user.items, None, signal_type, since, until, limit, cursor, descending=True)
+            if signal_type is not None:
+                index = self._by_type.get(signal_type)
+            elif user_id is not None:
+                index = self._by_user.get(user_id)
+            else:
+                index = self._all
+            if index is None:
+                return [], None
+            return index.page(since, until, limit, cursor)
+
     def save_signals(self) -> None:
         """保存信号到文件"""
         try:
-            with open(self.signals_file, 'w', encoding='utf-8') as f:
-                json.dump(self.signals, f, ensure_ascii=False, indent=4)
+            self.store.replace(self.signals)
         except Exception as e:
             print(f"保存危险信号时出错: {str(e)}")
             # 不抛出异常，保证调用流程稳定
@@ -92,21 +363,28 @@ class SignalService(BaseSignalService):
             
     def load_signals(self) -> None:
         """从文件加载信号"""
-        if os.path.exists(self.signals_file):
-            try:
-                with open(self.signals_file, 'r', encoding='utf-8') as f:
-                    self.signals = json.load(f)
-            except Exception as e:
-                print(f"加载危险信号时出错: {str(e)}")
-                print("还没保存过危险信号记录")
-                self.signals = []
-        else:
+        try:
+            records = self.store.read_all()
+            # 发作片段以追加新版本的方式更新，同一 id 只保留最后一个版本，并顺便压缩掉旧版本
+            signals = latest_versions(records)
+            if len(signals) < len(records):
+                self.store.replace(signals)
+        except Exception as e:
+            print(f"加载危险信号时出错: {str(e)}")
+            signals = []
+        with self._lock:
+            self._reset_indexes()
+            for signal in signals:
+                self._index(signal)
+        if not self.signals:
             print("还没保存过危险信号记录")
-            self.signals = []
+        self._notify(None)
     
     def clear_signals(self) -> None:
         """清空所有信号"""
-        self.signals = []
+        with self._lock:
+            self._reset_indexes()
+        self._notify(None)
         
     def get_signals_by_type(self, signal_type: str) -> List[Dict]:
         """
@@ -114,7 +392,8 @@ class SignalService(BaseSignalService):
         :param signal_type: 信号类型
         :return: 指定类型的信号列表
         """
-        return [signal for signal in self.signals if signal.get("type") == signal_type]
+        index = self._by_type.get(signal_type)
+        return list(index.items) if index is not None else []
         
     def get_signals_by_user(self, user_id: str) -> List[Dict]:
         """
@@ -122,4 +401,14 @@ class SignalService(BaseSignalService):
         :param user_id: 用户ID
         :return: 该用户的信号列表
         """
-        return [signal for signal in self.signals if signal.get("user_id") == user_id]
+        index = self._by_user.get(user_id)
+        return list(index.items) if index is not None else []
+
+    def get_signals_by_day(self, day: str) -> List[Dict]:
+        """
+        获取某一天的所有信号
+        :param day: 日期，格式 YYYY-MM-DD
+        :return: 当天的信号列表
+        """
+        index = self._by_day.get(day)
+        return list(index.items) if index is not None else []
@@ -0,0 +1,174 @@
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple
+import sqlite3
+import threading
+from src.services import serializer
+from src.services.recordStore import BaseRecordStore, encode_cursor, decode_cursor
+
+
+class SqliteRecordStore(BaseRecordStore):
+    """基于标准库 sqlite3 的记录存储（WAL 模式）
+
+    每类记录一张表，同一数据目录下的所有表共用一个数据库文件。
+    表中冗余存放 type / user_id / timestamp 三列并建立
+    (user_id, timestamp) 与 (type, timestamp) 索引，完整记录以 JSON 文本保存在 data 列。
+    """
+
+    indexed = True
+
+    def __init__(self, db_path: str, table: str):
+        if not table.isidentifier():
+            raise ValueError(f"非法的表名: {table}")
+        self.db_path = db_path
+        self.table = table
+        # sqlite3 连接不能跨线程共享，每个线程各持有一个连接；同时登记全部连接，close() 时统一关闭
+        self._local = threading.local()
+        self._conns: set = set()
+        self._conns_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "type TEXT, user_id TEXT, timestamp TEXT, data TEXT NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table} (user_id, timestamp)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_type_ts ON {table} (type, timestamp)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (timestamp)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn not in self._conns:
+            # 连接只在创建它的线程中使用；close() 可能在其他线程调用，因此关闭同线程检查
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conns_lock:
+                self._conns.add(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(record: Dict[str, Any]) -> tuple:
+        return (
+            record.get("type"),
+            record.get("user_id", ""),
+            record.get("timestamp", ""),
+            serializer.dumps(record),
+        )
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} (type, user_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                [self._row(r) for r in records],
+            )
+
+    def upsert(self, record: Dict[str, Any], key: str = "id") -> None:
+        # 先用 (user_id, type) 索引缩小范围，再比较 JSON 中的 key 字段；
+        # 用 IS 比较，type 或 user_id 为 NULL 的记录也能匹配到已有版本
+        if not key.isidentifier():
+            raise ValueError(f"非法的字段名: {key}")
+        row = self._row(record)
+        conn = self._conn()
+        with conn:
+            updated = conn.execute(
+                f"UPDATE {self.table} SET type = ?, user_id = ?, timestamp = ?, data = ? "
+                f"WHERE user_id IS ? AND type IS ? AND json_extract(data, '$.{key}') = ?",
+                row + (row[1], row[0], record.get(key)),
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    f"INSERT INTO {self.table} (type, user_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                    row,
+                )
+
+    def count(self) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        yield from self._iter(f"SELECT data FROM {self.table} ORDER BY id")
+
+    def iter_ordered(self) -> Iterator[Dict[str, Any]]:
+        yield from self._iter(f"SELECT data FROM {self.table} ORDER BY timestamp, id")
+
+    def _iter(self, sql: str) -> Iterator[Dict[str, Any]]:
+        cursor = self._conn().execute(sql)
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for (data,) in rows:
+                yield serializer.loads(data)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return list(self.iter_records())
+
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.executemany(
+                f"INSERT INTO {self.table} (type, user_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                [self._row(r) for r in records],
+            )
+
+    def query_page(
+        self,
+        user_id: Optional[str] = None,
+        record_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descending: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """使用索引完成过滤、排序与分页，游标中的序号即自增 id"""
+        clauses = []
+        params: List[Any] = []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if record_type is not None:
+            clauses.append("type = ?")
+            params.append(record_type)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if cursor:
+            after_ts, after_id = decode_cursor(cursor)
+            op = "<" if descending else ">"
+            clauses.append(f"(timestamp {op} ? OR (timestamp = ? AND id {op} ?))")
+            params.extend([after_ts, after_ts, after_id])
+        sql = f"SELECT id, timestamp, data FROM {self.table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        order = "DESC" if descending else "ASC"
+        sql += f" ORDER BY timestamp {order}, id {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit) + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            if rows:
+                next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return [serializer.loads(data) for (_, _, data) in rows], next_cursor
+
+    def sync(self) -> None:
+        self._conn().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        """关闭所有线程创建的连接；之后再访问时各线程会重新建立连接"""
+        with self._conns_lock:
+            conns, self._conns = self._conns, set()
+        for conn in conns:
+            conn.close()
+        self._local.conn = None
@@ -0,0 +1,166 @@
+from typing import Dict, Any, Optional, Callable, Iterable, List
+from collections import Counter
+from datetime import datetime, timedelta
+import threading
+
+
+class StatsService:
+    """增量维护的统计计数器
+
+    通过 DataService / SignalService 的监听回调在记录写入时更新，启动时从存储重建一次，
+    综合评估页面只需请求一次 /api/stats 即可拿到全部计数，无需下载完整历史。
+
+    sources 为 {记录类别: 返回该类记录迭代器的函数}，类别取 'chat' / 'emotion' / 'signal'，
+    用于启动重建以及某类记录被清空、整体覆盖后的重新计数。
+
+    重建在锁外扫描存储，扫描期间写入的记录照常计入当前计数并另行缓冲；扫描结束后在锁内换上新计数，
+    再补上扫描没有读到的缓冲记录（按影响计数的字段比对），重建期间的写入既不丢失也不重复计数。
+    """
+
+    KINDS = ("chat", "emotion", "signal")
+    # 与综合评估页面“异常”计数一致的负面主导情绪
+    NEGATIVE_EMOTIONS = ("sad", "angry", "fear", "disgust")
+    # 扫描时为这段时间以内的记录保留比对用的指纹；更早的记录只在重建期间已有写入时才保留
+    REBUILD_RECENT = timedelta(hours=1)
+
+    def __init__(self, sources: Optional[Dict[str, Callable[[], Iterable[Dict[str, Any]]]]] = None):
+        self.sources = sources or {}
+        self._lock = threading.Lock()
+        self._totals: Counter = Counter()
+        self._subtypes: Dict[str, Counter] = {}
+        self._dominant: Counter = Counter()
+        self._depression = 0
+        self._hourly: Dict[str, Counter] = {}
+        self._daily: Dict[str, Counter] = {}
+        # 正在重建的类别 -> 各次重建的写入缓冲
+        self._pending: Dict[str, List[List[Dict[str, Any]]]] = {}
+        self._reset_all()
+
+    def _reset_all(self) -> None:
+        self._totals = Counter()
+        self._subtypes = {kind: Counter() for kind in self.KINDS}
+        self._dominant = Counter()
+        self._depression = 0
+        self._hourly = {}
+        self._daily = {}
+
+    @staticmethod
+    def _dominant_of(record: Dict[str, Any]) -> Optional[str]:
+        data = record.get("data")
+        if isinstance(data, dict) and data.get("dominant_emotion"):
+            return data["dominant_emotion"]
+        return None
+
+    def _subtype_of(self, kind: str, record: Dict[str, Any]) -> str:
+        if kind == "chat":
+            return record.get("role") or "unknown"
+        if kind == "signal":
+            return record.get("type") or "unknown"
+        return self._dominant_of(record) or "unknown"
+
+    def _apply(self, kind: str, record: Dict[str, Any], delta: int) -> None:
+        self._totals[kind] += delta
+        self._subtypes[kind][self._subtype_of(kind, record)] += delta
+        if kind == "emotion":
+            dominant = self._dominant_of(record)
+            if dominant:
+                self._dominant[dominant] += delta
+                if dominant in self.NEGATIVE_EMOTIONS:
+                    self._depression += delta
+        ts = record.get("timestamp") or ""
+        if len(ts) >= 13:
+            self._hourly.setdefault(ts[:13], Counter())[kind] += delta
+            self._daily.setdefault(ts[:10], Counter())[kind] += delta
+
+    # ---- 监听回调 ----
+    def on_record(self, kind: str, record: Optional[Dict[str, Any]]) -> None:
+        """DataService / SignalService 的监听回调
+
+        record 为新写入的记录；为 None 表示该类记录被清空或整体覆盖，需要重新计数。
+        """
+        if kind not in self.KINDS:
+            return
+        if record is None:
+            self.rebuild(kind)
+            return
+        with self._lock:
+            self._apply(kind, record, 1)
+            for buffer in self._pending.get(kind, ()):
+                buffer.append(record)
+
+    # ---- 重建 ----
+    def rebuild(self, kind: Optional[str] = None) -> None:
+        """从 sources 重新计数；kind 为 None 时重建全部类别"""
+        kinds = self.KINDS if kind is None else (kind,)
+        for k in kinds:
+            buffer: List[Dict[str, Any]] = []
+            with self._lock:
+                self._pending.setdefault(k, []).append(buffer)
+            recent = (datetime.now() - self.REBUILD_RECENT).isoformat()
+            fresh = StatsService()
+            scanned: Counter = Counter()
+            try:
+                source = self.sources.get(k)
+                if source is not None:
+                    for record in source():
+                        if isinstance(record, dict):
+                            fresh._apply(k, record, 1)
+                            if buffer or (record.get("timestamp") or "") >= recent:
+                                scanned[self._fingerprint(k, record)] += 1
+            finally:
+                with self._lock:
+                    self._pending[k] = [b for b in self._pending[k] if b is not buffer]
+                    if not self._pending[k]:
+                        del self._pending[k]
+            with self._lock:
+                self._replace_kind(k, fresh)
+                # 扫描没有读到的写入（写在扫描位置之后，或来源是扫描开始时的快照）补计一次
+                for record in buffer:
+                    fingerprint = self._fingerprint(k, record)
+                    if scanned[fingerprint] > 0:
+                        scanned[fingerprint] -= 1
+                    else:
+                        self._apply(k, record, 1)
+
+    def _fingerprint(self, kind: str, record: Dict[str, Any]) -> tuple:
+        """计数只取决于这些字段，指纹相同的记录互换不影响结果"""
+        return self._subtype_of(kind, record), self._dominant_of(record), record.get("timestamp") or ""
+
+    def _replace_kind(self, kind: str, fresh: "StatsService") -> None:
+        self._totals[kind] = fresh._totals[kind]
+        self._subtypes[kind] = fresh._subtypes[kind]
+        if kind == "emotion":
+            self._dominant = fresh._dominant
+            self._depression = fresh._depression
+        for buckets, fresh_buckets in ((self._hourly, fresh._hourly), (self._daily, fresh._daily)):
+            for key in list(buckets):
+                buckets[key].pop(kind, None)
+                if not +buckets[key]:
+                    # 清空后没有任何计数的时间桶不再返回
+                    del buckets[key]
+            for key, counter in fresh_buckets.items():
+                if counter[kind]:
+                    buckets.setdefault(key, Counter())[kind] = counter[kind]
+
+    # ---- 读取 ----
+    def snapshot(self, hours: int = 24, days: int = 30) -> Dict[str, Any]:
+        """返回统计快照
+
+        Args:
+            hours: 返回最近多少个有数据的小时桶
+            days: 返回最近多少个有数据的日桶
+        """
+        def _recent(buckets: Dict[str, Counter], n: int) -> Dict[str, Dict[str, int]]:
+            keys = sorted(buckets)[-n:] if n > 0 else []
+            return {k: {kind: buckets[k][kind] for kind in self.KINDS} for k in keys}
+
+        with self._lock:
+            return {
+                "totals": {kind: self._totals[kind] for kind in self.KINDS},
+                "chat_roles": dict(self._subtypes["chat"]),
+                "signal_types": dict(self._subtypes["signal"]),
+                "dominant_emotions": {k: v for k, v in self._dominant.items() if v},
+                "depression_count": self._depression,
+                "hourly": _recent(self._hourly, hours),
+                "daily": _recent(self._daily, days),
+            }
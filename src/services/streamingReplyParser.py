@@ -0,0 +1,240 @@
+from typing import Optional, List
+import re
+
+# 字符串内容中不需要特殊处理的连续片段
+_PLAIN_RUN = re.compile(r'[^"\\]+')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+_TEXT, _JSON, _DONE = range(3)
+# 代码块开头一行（```json）最多这么多字符，超过仍没有换行时按普通文本输出
+_FENCE_LINE_LIMIT = 32
+
+
+class StreamingReplyParser:
+    """智能体流式回复的增量解析器
+
+    智能体的回复可能是普通文本，也可能是 {"type": "dangerous", "message": "..."} 形式的 JSON
+    （可以包在 ```json 代码块中，前面也可以带一段说明文字，如 `好的 {"type": ...}`）。
+    解析器逐个消费流式增量，每个字符只处理一次：
+
+    - 普通文本原样输出；文本中出现 `{` 后紧跟 `"`（可隔空白），或代码块开头的下一行以 `{` 开始时，
+      从这里起按 JSON 解析，此前的文字照常输出；
+    - JSON 部分只输出顶层 message 字段的内容（边到达边解码输出），顶层 type 字段一旦完整即可通过
+      type / dangerous 读取，不必等到整个回复结束；顶层对象结束之后的内容（如代码块结尾）不再输出。
+
+    解析是宽松的：字符串中未转义的换行等常见的模型输出瑕疵不会中断解析。
+    """
+
+    def __init__(self):
+        self.type: Optional[str] = None
+        self._mode = _TEXT
+        self._pending = ''  # 文本模式下尚不能确定是否为 JSON 开头的部分
+        self._started = False  # 是否已输出过非空白文本（回复开头的空白不输出）
+        self._raw: List[str] = []  # JSON 模式下收到的原始文本，没有 message 字段时作为兜底输出
+        self._emitted = False
+        # JSON 词法状态
+        self._depth = 0
+        self._in_string = False
+        self._escape: Optional[str] = None  # None / '' (刚读到反斜杠) / 'u....' (读取 \u 转义中)
+        self._high_surrogate: Optional[str] = None
+        self._expect_key = False
+        self._is_key = False
+        self._key: List[str] = []
+        self._current_key: Optional[str] = None
+        self._type_chars: List[str] = []
+
+    @property
+    def dangerous(self) -> bool:
+        return self.type == 'dangerous'
+
+    def feed(self, delta: str) -> str:
+        """消费一段增量，返回此时可以输出给前端的文本"""
+        if not delta:
+            return ''
+        if self._mode == _DONE:
+            return ''
+        if self._mode == _TEXT:
+            self._pending += delta
+            return self._scanText()
+        self._raw.append(delta)
+        return self._scan(delta, 0)
+
+    def finish(self) -> str:
+        """流结束时调用，返回剩余需要输出的文本"""
+        if self._mode == _TEXT:
+            # 结尾处未能判断的部分按普通文本输出
+            text, self._pending = self._pending, ''
+            return text if self._started else text.lstrip()
+        if not self._emitted:
+            # JSON 中没有 message 字段：退回原始文本，与旧版解析失败时的行为一致
+            self._emitted = True
+            return ''.join(self._raw).strip()
+        return ''
+
+    def _scanText(self) -> str:
+        """输出 _pending 中确定是普通文本的部分，遇到 JSON 开头时切换到 JSON 模式"""
+        out: List[str] = []
+        text = self._pending
+        if not self._started:
+            text = text.lstrip()
+        pos = 0
+        n = len(text)
+        while pos < n:
+            brace = text.find('{', pos)
+            tick = text.find('`', pos)
+            candidates = [i for i in (brace, tick) if i >= 0]
+            if not candidates:
+                out.append(text[pos:])
+                pos = n
+                break
+            i = min(candidates)
+            out.append(text[pos:i])
+            pos = i
+            if text[i] == '{':
+                rest = text[i + 1:].lstrip()
+                if not rest:
+                    break  # 等待下一段增量再判断
+                if rest[0] == '"':
+                    return self._emitText(out) + self._startJson(text, i)
+                out.append('{')
+                pos = i + 1
+                continue
+            # 反引号：可能是 ```json 代码块开头
+            run = len(text) - i - len(text[i:].lstrip('`'))
+            if text.startswith('```', i):
+                newline = text.find('\n', i)
+                if newline < 0:
+                    if n - i <= _FENCE_LINE_LIMIT:
+                        break
+                    out.append(text[i:i + 3])
+                    pos = i + 3
+                    continue
+                body = text[newline + 1:].lstrip()
+                if not body:
+                    break
+                if body[0] == '{':
+                    # 代码块开头一行不输出
+                    return self._emitText(out) + self._startJson(text, text.index('{', newline))
+                out.append(text[i:newline + 1])
+                pos = newline + 1
+                continue
+            if i + run == n and run < 3:
+                break  # 结尾的一两个反引号，可能是代码块开头的一部分
+            out.append(text[i:i + run])
+            pos = i + run
+        self._pending = text[pos:]
+        return self._emitText(out)
+
+    def _emitText(self, out: List[str]) -> str:
+        text = ''.join(out)
+        if text:
+            self._started = True
+        return text
+
+    def _startJson(self, text: str, pos: int) -> str:
+        self._mode = _JSON
+        self._pending = ''
+        self._raw.append(text[pos:])
+        return self._scan(text, pos)
+
+    def _scan(self, text: str, pos: int) -> str:
+        out: List[str] = []
+        n = len(text)
+        while pos < n and self._mode == _JSON:
+            if self._in_string:
+                pos = self._scanString(text, pos, out)
+                continue
+            ch = text[pos]
+            pos += 1
+            if ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                if self._is_key:
+                    self._key = []
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth <= 0:
+                    # 顶层对象结束，之后的内容（如代码块结尾）不再输出
+                    self._mode = _DONE
+            elif self._depth == 1:
+                if ch == ',':
+                    self._expect_key = True
+                elif ch == ':':
+                    self._expect_key = False
+        if out:
+            self._emitted = True
+        return ''.join(out)
+
+    def _scanString(self, text: str, pos: int, out: List[str]) -> int:
+        """消费字符串内容直到字符串结束或本段文本结束，返回新的位置"""
+        n = len(text)
+        while pos < n:
+            if self._escape is not None:
+                pos = self._scanEscape(text, pos, out)
+                continue
+            match = _PLAIN_RUN.match(text, pos)
+            if match:
+                self._emitChars(match.group(), out)
+                pos = match.end()
+                continue
+            ch = text[pos]
+            pos += 1
+            if ch == '\\':
+                self._escape = ''
+            else:  # '"'
+                self._closeString()
+                return pos
+        return pos
+
+    def _scanEscape(self, text: str, pos: int, out: List[str]) -> int:
+        if self._escape == '':
+            ch = text[pos]
+            if ch == 'u':
+                self._escape = 'u'
+                return pos + 1
+            self._escape = None
+            self._emitChars(_ESCAPES.get(ch, ch), out)
+            return pos + 1
+        # \uXXXX：凑齐 4 位十六进制后解码，代理对在低位到达后合并
+        need = 5 - len(self._escape)
+        self._escape += text[pos:pos + need]
+        pos += min(need, len(text) - pos)
+        if len(self._escape) < 5:
+            return pos
+        hex_digits, self._escape = self._escape[1:], None
+        try:
+            code = int(hex_digits, 16)
+        except ValueError:
+            self._emitChars('\\u' + hex_digits, out)
+            return pos
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = chr(code)
+            return pos
+        char = chr(code)
+        if self._high_surrogate is not None and 0xDC00 <= code < 0xE000:
+            char = (self._high_surrogate + char).encode('utf-16', 'surrogatepass').decode('utf-16')
+        self._high_surrogate = None
+        self._emitChars(char, out)
+        return pos
+
+    def _emitChars(self, chars: str, out: List[str]) -> None:
+        if self._is_key:
+            self._key.append(chars)
+        elif self._depth == 1:
+            if self._current_key == 'message':
+                out.append(chars)
+            elif self._current_key == 'type':
+                self._type_chars.append(chars)
+
+    def _closeString(self) -> None:
+        self._in_string = False
+        if self._is_key:
+            self._current_key = ''.join(self._key)
+            self._is_key = False
+        elif self._depth == 1 and self._current_key == 'type':
+            self.type = ''.join(self._type_chars)
+            self._type_chars = []
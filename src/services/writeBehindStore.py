@@ -0,0 +1,232 @@
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple
+import atexit
+import queue
+import signal
+import sys
+import threading
+import time
+from src.services.recordStore import BaseRecordStore
+
+# 队列中的停止标记；flush 标记为 ("flush", threading.Event)
+_STOP = object()
+
+
+class WriteBehindStore(BaseRecordStore):
+    """写后（write-behind）缓冲层
+
+    append/extend 只把记录放入内存队列后立即返回，由唯一的后台写线程按批次写入底层存储：
+    - 攒够 batch_size 条，或距本批第一条记录超过 flush_interval 秒时落盘一次
+    - 每隔 fsync_interval 秒调用一次底层存储的 sync()（为 0 时每批都 sync）
+    - 进程退出（atexit / SIGTERM）时写完队列中剩余的全部记录
+
+    读操作会先等待此前入队的操作写完（之后新入队的不必等待），保证调用方能读到自己刚写入的数据。
+    所有写入都由同一线程串行完成，多个请求线程之间不会再互相覆盖。
+    close() 之后的写操作直接写入底层存储。
+    """
+
+    def __init__(
+        self,
+        inner: BaseRecordStore,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        fsync_interval: float = 5.0,
+    ):
+        self.inner = inner
+        self.indexed = inner.indexed
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self.fsync_interval = max(0.0, fsync_interval)
+        self._queue: "queue.Queue" = queue.Queue()
+        # 保证 _closed 置位之后不再有操作入队，停止标记之后的队列中不会残留记录
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- 后台写线程 ----
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval or None)
+            except queue.Empty:
+                self._maybe_sync(force=True)
+                continue
+            batch = [item]
+            if item is not _STOP and item[0] != "flush":
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(nxt)
+                    if nxt is _STOP or nxt[0] == "flush":
+                        break
+            if self._apply(batch):
+                return
+
+    def _apply(self, batch: List[Any]) -> bool:
+        """把一批操作写入底层存储，返回是否收到停止标记"""
+        pending: List[Dict[str, Any]] = []
+        flushed: List[threading.Event] = []
+        stop = False
+        for item in batch:
+            if item is _STOP:
+                stop = True
+                continue
+            op, payload = item
+            if op == "flush":
+                flushed.append(payload)
+                continue
+            if op == "append":
+                pending.append(payload)
+                continue
+            self._write(pending)
+            pending = []
+            try:
+                if op == "replace":
+                    self.inner.replace(payload)
+                elif op == "upsert":
+                    self.inner.upsert(*payload)
+                self._dirty = True
+            except Exception as e:
+                print(f"写后缓冲执行 {op} 失败: {e}")
+        self._write(pending)
+        self._maybe_sync(force=stop)
+        for event in flushed:
+            event.set()
+        return stop
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        try:
+            self.inner.extend(records)
+            self._dirty = True
+        except Exception as e:
+            print(f"写后缓冲批量写入失败（{len(records)} 条）: {e}")
+
+    def _maybe_sync(self, force: bool = False) -> None:
+        if not self._dirty:
+            return
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.fsync_interval:
+            try:
+                self.inner.sync()
+            except Exception as e:
+                print(f"写后缓冲 sync 失败: {e}")
+            self._dirty = False
+            self._last_sync = now
+
+    # ---- 写操作：入队即返回 ----
+    def _enqueue(self, item: Any) -> bool:
+        """未关闭时把操作放入队列并返回 True；已关闭时返回 False，由调用方直接写底层存储"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._queue.put(item)
+            return True
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if not self._enqueue(("append", record)):
+            self.inner.append(record)
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def replace(self, records: List[Dict[str, Any]]) -> None:
+        if not self._enqueue(("replace", list(records))):
+            self.inner.replace(records)
+            return
+        self.flush()
+
+    def upsert(self, record: Dict[str, Any], key: str = "id") -> None:
+        if not self._enqueue(("upsert", (record, key))):
+            self.inner.upsert(record, key)
+
+    # ---- 读操作：先等待此前入队的操作写完 ----
+    def flush(self) -> None:
+        """阻塞直到调用前已入队的操作全部写入底层存储
+
+        写线程处理到本次的 flush 标记时即返回，不等待之后新入队的记录，持续写入时读操作也不会被无限期阻塞。
+        """
+        event = threading.Event()
+        if not self._enqueue(("flush", event)):
+            return
+        while not event.wait(1.0):
+            if not self._thread.is_alive():
+                return
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        self.flush()
+        return self.inner.read_all()
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        self.flush()
+        yield from self.inner.iter_records()
+
+    def iter_ordered(self) -> Iterator[Dict[str, Any]]:
+        self.flush()
+        yield from self.inner.iter_ordered()
+
+    def query_page(
+        self,
+        user_id: Optional[str] = None,
+        record_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descending: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        self.flush()
+        return self.inner.query_page(user_id, record_type, since, until, limit, cursor, descending)
+
+    def rotate(self, dest_path: str, before: Optional[str] = None) -> bool:
+        self.flush()
+        return self.inner.rotate(dest_path, before)
+
+    def sync(self) -> None:
+        self.flush()
+        self.inner.sync()
+
+    def close(self) -> None:
+        """写完剩余记录并停止后台线程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        # 写线程已退出（或此前异常退出）时，由当前线程写完队列中剩余的操作
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if remaining:
+            self._apply(remaining)
+        self.inner.close()
+
+
+def install_shutdown_handlers() -> None:
+    """把 SIGTERM 转换为正常退出，使 atexit 中的落盘逻辑得以执行
+
+    只能在主线程中调用；若进程已自行设置了 SIGTERM 处理函数则保持不变。
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    try:
+        if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    except (ValueError, OSError, AttributeError):
+        pass
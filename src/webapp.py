@@ -1,25 +1,73 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, session
+from flask.json.provider import DefaultJSONProvider
 from src.services.coze_chat_service import CozeChatService
 from src.services.signalService import SignalService
-from src.services.analysisService import DeepseekAnalysisService
+from src.services.analysisService import DeepseekAnalysisService, with_validation, is_danger_failure
 from src.services.deepfaceEmotionService import DeepfaceEmotionService
 from src.services.baiduAudioService import BaiduAudioService
+from src.services.writeBehindStore import install_shutdown_handlers
+from src.services.statsService import StatsService
+from src.services.signalBroker import SignalBroker
+from src.services.streamingReplyParser import StreamingReplyParser
+from src.services.retentionService import create_retention_service
+from src.services.recordStore import create_record_store
+from src.services.jobQueue import JobQueue
+from src.services.analysisScheduler import AnalysisScheduler, ScheduledAnalysisService, CRITICAL, INTERACTIVE, BATCH
+from src.services.analysisOrchestrator import AnalysisOrchestrator, AnalysisCall, STATUS_DONE
+from src.services.analysisCache import AnalysisCache, CachedAnalysisService
+from src.services.crisisIndexTracker import CrisisIndexTracker
+from src.services.dangerLexicon import load_lexicon
+from src.config import Config
+from src.services import serializer
 import subprocess
 import tempfile
 import shutil
 import socket
 import json
 import os
+import queue
 import sys
-import re
+import uuid
+from datetime import datetime
 from src.generate_cert import generate_self_signed_cert
 
+class FastJSONProvider(DefaultJSONProvider):
+    """让 jsonify 使用 serializer（优先 orjson）编码响应
+
+    只有紧凑输出（jsonify 默认只传入 separators）走 serializer；调用方指定缩进（调试模式）、sort_keys 等参数时
+    交给 Flask 默认实现，行为与未替换时一致。
+    """
+
+    # 与 serializer 的输出一致：保留非 ASCII 字符，不排序键
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) <= {'separators'} and not self.sort_keys:
+            return serializer.dumps(obj)
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return serializer.loads(s)
+
+
 class WebApp:
     """Luminest Web应用"""
+
+    # 分页接口单页最大条数
+    MAX_PAGE_SIZE = 500
     
     def __init__(self):
         """初始化Web应用"""
         self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
+        self.app.secret_key = self._loadSecretKey()
+        # 先按保留策略轮转过大/过旧的数据文件，使后续启动加载的数据量有上界
+        self.retentionService = create_retention_service()
+        if self.retentionService is not None:
+            self.retentionService.run_once()
         self.chatService = CozeChatService()
         # 用于后端语音识别（浏览器上传音频后调用）
         try:
@@ -27,8 +75,55 @@ class WebApp:
         except Exception:
             self.audioService = None
         self.signalService = SignalService()
-        self.analysisService = DeepseekAnalysisService()
+        # 本地危机词库预筛：每条用户消息进入聊天服务之前执行，不依赖网络
+        self.dangerLexicon = load_lexicon(Config().dangerLexiconPath) if Config().dangerLexiconEnabled else None
+        # 新信号经进程内发布/订阅实时推送给 /api/signals/stream 的订阅者
+        self.signalBroker = SignalBroker(buffer_size=Config().signalStreamBuffer)
+        self.signalService.add_listener(self.signalBroker.on_signal)
+        # 所有 AI 分析按用途分优先级调度，管理页面的分析不会挤占实时危险分析的并发名额
+        self.analysisScheduler = AnalysisScheduler(
+            limits={
+                CRITICAL: Config().analysisLimitCritical,
+                INTERACTIVE: Config().analysisLimitInteractive,
+                BATCH: Config().analysisLimitBatch,
+            },
+            aging=Config().analysisAging,
+        )
+        self.analysisService = ScheduledAnalysisService(DeepseekAnalysisService(), self.analysisScheduler)
+        # 缓存在调度之前：命中缓存的分析不排队、不调用上游
+        self.analysisCache = None
+        if Config().analysisCacheEnabled:
+            self.analysisCache = AnalysisCache(
+                create_record_store(Config().storageBackend, 'data', 'analysis_cache'),
+                max_entries=Config().analysisCacheSize,
+                ttl=Config().analysisCacheTtl,
+            )
+            self.analysisService = CachedAnalysisService(self.analysisService, self.analysisCache)
+        # 一次分析中相互独立的调用（危机指数、关键词）并发执行，交叉验证在其输入完成后立即开始
+        self.analysisOrchestrator = AnalysisOrchestrator(
+            max_workers=Config().analysisWorkers,
+            budget=Config().analysisBudget,
+            call_timeout=Config().analysisCallTimeout,
+        )
+        # 危机分析在后台任务中执行，聊天响应不再等待分析（及其交叉验证）完成
+        self.jobQueue = JobQueue(
+            create_record_store(Config().storageBackend, 'data', 'jobs'),
+            workers=Config().jobWorkers,
+            max_pending=Config().jobMaxPending,
+        )
+        self.jobQueue.register('danger_analysis', self._runDangerAnalysis)
+        # 任务队列在 _loadHistory 载入危险信号之后才启动：重启时恢复的任务要按ID回写信号
         self.emotionService = DeepfaceEmotionService()
+        self.statsService = self._createStatsService()
+        if self.analysisCache is not None:
+            # 新的聊天/表情记录写入或被清空时，依赖它们的缓存条目失效
+            for service in (self.chatService.data_service, self.emotionService.data_service):
+                if service is not None:
+                    service.add_listener(self.analysisCache.on_record)
+        self.crisisTracker = self._createCrisisTracker()
+        if self.retentionService is not None:
+            self.retentionService.add_listener(self._onSegmentRotated)
+            self.retentionService.start(Config().retentionInterval)
         self.preferences = {}
         self._setupRoutes()
         try:
@@ -46,6 +141,84 @@ class WebApp:
             print(f"启动HTTPS服务器失败: {str(e)}")
             sys.exit(1)
         
+    def _loadSecretKey(self):
+        """读取会话签名密钥：优先 Config.flaskSecretKey，否则使用（首次生成的）data/.flask_secret"""
+        secret = Config().flaskSecretKey
+        if secret:
+            return secret
+        path = os.path.join('data', '.flask_secret')
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    secret = f.read().strip()
+            if not secret:
+                os.makedirs('data', exist_ok=True)
+                secret = os.urandom(32).hex()
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(secret)
+        except Exception as e:
+            print(f"读取会话密钥失败，本次运行使用临时密钥: {e}")
+            secret = os.urandom(32).hex()
+        return secret
+
+    def _currentUserId(self):
+        """解析当前请求的用户ID
+
+        依次取 X-User-Id 请求头、JSON 请求体中的 user_id、会话 Cookie；
+        都没有时为该浏览器生成一个随机ID并写入会话 Cookie，之后的请求沿用。
+        请求头与请求体中的ID由客户端自行声明、未经认证，只用于区分对话与记录归属，不能作为访问控制依据。
+        """
+        userId = request.headers.get('X-User-Id')
+        if not userId and request.is_json:
+            body = request.get_json(silent=True)
+            if isinstance(body, dict) and isinstance(body.get('user_id'), str):
+                userId = body['user_id']
+        if not userId:
+            userId = session.get('user_id')
+        if not userId:
+            userId = uuid.uuid4().hex
+            session['user_id'] = userId
+            session.permanent = True
+        return userId.strip()[:128]
+
+    def _createStatsService(self):
+        """创建统计服务：挂到各数据服务的写入回调上，并从存储重建一次计数"""
+        chatData = self.chatService.data_service
+        emotionData = self.emotionService.data_service
+        sources = {'signal': self.signalService.iter_signals}
+        if chatData is not None:
+            sources['chat'] = chatData.iter_chats
+        if emotionData is not None:
+            sources['emotion'] = emotionData.iter_emotions
+        stats = StatsService(sources)
+        for service in (chatData, emotionData, self.signalService):
+            if service is not None:
+                service.add_listener(stats.on_record)
+        stats.rebuild()
+        return stats
+
+    def _createCrisisTracker(self):
+        """创建增量危机指数计算：保存每个评估范围的滚动状态，记录被清空时丢弃状态"""
+        if not Config().crisisIncremental:
+            return None
+        chatData = self.chatService.data_service
+        emotionData = self.emotionService.data_service
+        tracker = CrisisIndexTracker(
+            self.analysisService, chatData, emotionData,
+            create_record_store(Config().storageBackend, 'data', 'crisis_state'),
+            delta_chars=Config().crisisDeltaChars,
+            summary_chars=Config().crisisSummaryChars,
+        )
+        for service in (chatData, emotionData):
+            if service is not None:
+                service.add_listener(tracker.on_record)
+        return tracker
+
+    def _onSegmentRotated(self, name, segment):
+        """数据文件轮转后按活动文件中留下的记录重建统计（危机信号不参与轮转）"""
+        if name in ('chats', 'emotions'):
+            self.statsService.rebuild(name[:-1])
+
     def _setupRoutes(self):
         """设置路由"""
         # 页面路由
@@ -63,6 +236,11 @@ class WebApp:
         # API路由
         self.app.add_url_rule('/api/receive', 'receiveData', self.receiveData, methods=['POST'])
         self.app.add_url_rule('/api/signals', 'getSignals', self.getSignals, methods=['GET'])
+        self.app.add_url_rule('/api/signals/stream', 'streamSignals', self.streamSignals, methods=['GET'])
+        self.app.add_url_rule('/api/jobs', 'getJobs', self.getJobs, methods=['GET'])
+        self.app.add_url_rule('/api/jobs/<jobId>', 'getJob', self.getJob, methods=['GET'])
+        self.app.add_url_rule('/api/analysis/scheduler', 'getSchedulerStats', self.getSchedulerStats, methods=['GET'])
+        self.app.add_url_rule('/api/analysis/cache', 'getAnalysisCacheStats', self.getAnalysisCacheStats, methods=['GET'])
         self.app.add_url_rule('/api/chat', 'chatApi', self.chatApi, methods=['POST'])
         self.app.add_url_rule('/api/stream_chat', 'streamChatApi', self.streamChatApi, methods=['POST'])
         self.app.add_url_rule('/api/voice_to_text', 'voiceToText', self.voice_to_text, methods=['POST'])
@@ -76,62 +254,238 @@ class WebApp:
         self.app.add_url_rule('/api/capture_emotion', 'captureEmotion', self.captureEmotion, methods=['POST'])
         self.app.add_url_rule('/api/chat_history', 'getChatHistory', self.getChatHistory, methods=['GET'])
         self.app.add_url_rule('/api/emotions', 'getEmotions', self.getEmotions, methods=['GET'])
+        self.app.add_url_rule('/api/stats', 'getStats', self.getStats, methods=['GET'])
         self.app.add_url_rule('/api/ai_danger_keywords', 'aiDangerKeywords', self.ai_danger_keywords, methods=['POST'])
         self.app.add_url_rule('/api/ai_crisis_index', 'aiCrisisIndex', self.ai_crisis_index, methods=['POST'])
+        self.app.add_url_rule('/api/ai_assessment/stream', 'aiAssessmentStream', self.aiAssessmentStream, methods=['GET'])
         self.app.add_url_rule('/api/clear_chats', 'clearChats', self.clear_chats, methods=['POST'])
         self.app.add_url_rule('/api/clear_emotions', 'clearEmotions', self.clear_emotions, methods=['POST'])
         self.app.add_url_rule('/api/clear_signals', 'clearSignals', self.clear_signals, methods=['POST'])
         self.app.add_url_rule('/api/clear_preferences', 'clearPreferences', self.clear_preferences, methods=['POST'])
 
 
+    def _pageArgs(self, extra=()):
+        """解析分页与时间范围查询参数（since / until / limit / cursor / user_id）
+
+        请求未携带任何此类参数时返回 None，接口保持旧行为返回完整列表；
+        参数格式错误时抛出 ValueError。
+        """
+        keys = ('since', 'until', 'limit', 'cursor', 'user_id') + tuple(extra)
+        if not any(k in request.args for k in keys):
+            return None
+        args = {}
+        for k in ('since', 'until'):
+            value = request.args.get(k) or None
+            if value is not None:
+                datetime.fromisoformat(value)
+            args[k] = value
+        args['cursor'] = request.args.get('cursor') or None
+        # user_id 允许为空字符串（匿名用户）
+        args['user_id'] = request.args.get('user_id') if 'user_id' in request.args else None
+        limit = request.args.get('limit')
+        args['limit'] = min(max(int(limit), 1), self.MAX_PAGE_SIZE) if limit else self.MAX_PAGE_SIZE
+        return args
+
+    def _streamJson(self, records):
+        """把记录迭代器流式输出为 JSON 数组；请求头 Accept 含 application/x-ndjson 时输出 NDJSON
+
+        记录逐条编码并按约 64KB 分块发送，内存占用与历史总量无关，首字节无需等待全部数据就绪。
+        """
+        ndjson = 'application/x-ndjson' in request.headers.get('Accept', '')
+        chunk_size = 64 * 1024
+
+        def generate():
+            buf = [] if ndjson else ['[']
+            size = 0
+            first = True
+            try:
+                for record in records:
+                    text = serializer.dumps(record)
+                    if ndjson:
+                        text += '\n'
+                    elif not first:
+                        text = ',' + text
+                    first = False
+                    buf.append(text)
+                    size += len(text)
+                    if size >= chunk_size:
+                        yield ''.join(buf)
+                        buf, size = [], 0
+            except Exception as e:
+                # 响应头已发出，只能记录错误并尽量输出合法的结尾
+                print(f"流式输出记录时出错: {str(e)}")
+            if not ndjson:
+                buf.append(']')
+            if buf:
+                yield ''.join(buf)
+
+        mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        return Response(generate(), mimetype=mimetype)
+
     def getChatHistory(self):
-        """返回所有聊天记录（用于综合评估页面统计）"""
+        """返回聊天记录（用于综合评估页面统计）
+
+        携带 since/until/limit/cursor/user_id 参数时按页返回 {"items": [...], "next_cursor": ...}，
+        否则以流式 JSON 数组（或 NDJSON）返回全部记录。
+        """
+        try:
+            page = self._pageArgs()
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
         try:
             if self.chatService.data_service is not None:
-                chats = self.chatService.data_service.get_chats()
-                return jsonify(chats)
+                if page is not None:
+                    items, next_cursor = self.chatService.data_service.get_chats_page(**page)
+                    return jsonify({'items': items, 'next_cursor': next_cursor})
+                return self._streamJson(self.chatService.data_service.iter_chats())
             else:
                 print("chatService.data_service 未初始化")
                 return jsonify([])
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
         except Exception as e:
             print(f"获取聊天记录时出错: {str(e)}")
             return jsonify([])
 
     def getEmotions(self):
-        """返回所有表情识别记录（用于综合评估页面统计）"""
+        """返回表情识别记录（用于综合评估页面统计），分页参数同 getChatHistory"""
+        try:
+            page = self._pageArgs()
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
         try:
             if self.emotionService.data_service is not None:
-                emotions = self.emotionService.data_service.get_emotions()
-                return jsonify(emotions)
+                if page is not None:
+                    items, next_cursor = self.emotionService.data_service.get_emotions_page(**page)
+                    return jsonify({'items': items, 'next_cursor': next_cursor})
+                return self._streamJson(self.emotionService.data_service.iter_emotions())
             else:
                 print("emotionService.data_service 未初始化")
                 return jsonify([])
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
         except Exception as e:
             print(f"获取表情记录时出错: {str(e)}")
             return jsonify([])
         
+    def getStats(self):
+        """返回增量维护的统计计数（综合评估页面使用），可选参数 hours / days 控制返回的时间桶数量"""
+        try:
+            hours = int(request.args.get('hours', 24))
+            days = int(request.args.get('days', 30))
+        except ValueError:
+            return jsonify({'error': 'hours 与 days 必须为整数'}), 400
+        return jsonify(self.statsService.snapshot(hours=hours, days=days))
+
     def ai_danger_keywords(self):
         """AI分析用户危机关键词，POST传入聊天历史"""
         try:
             data = request.get_json()
             history = data.get('history', []) if data else []
-            keywords = self.analysisService.analyze_danger_keywords(history)
+            keywords = self._dangerKeywords(history)
             return jsonify({'keywords': keywords})
         except Exception as e:
             print(f"AI危机关键词分析失败: {str(e)}")
             return jsonify({'keywords': ''})
 
     def ai_crisis_index(self):
-        """AI综合分析生成心理危机指数并返回结构化结果"""
+        """AI综合分析生成心理危机指数并返回结构化结果
+
+        请求体未提供 history / emotions 时由服务端直接读取已保存的聊天与表情记录（启用增量计算时只处理新增记录），
+        可选 user_id 只评估该用户的记录。
+        """
         try:
-            data = request.get_json()
-            history = data.get('history', []) if data else []
-            emotions = data.get('emotions', []) if data else []
-            result = self.analysisService.analyze_crisis_index(history, emotions)
+            data = request.get_json(silent=True) or {}
+            calls = self._crisisAssessmentCalls(data.get('history'), data.get('emotions'), keywords=False,
+                                                userId=data.get('user_id') or None)
+            events = self.analysisOrchestrator.run_all(calls)
+            crisis = events['crisis_index']
+            if crisis['status'] != STATUS_DONE:
+                return jsonify(self._crisisFallback(crisis))
+            result = dict(crisis['result'])
+            validation = events['validation']
+            if validation['status'] == STATUS_DONE:
+                result['validation'] = validation['result']
+            else:
+                result['validation'] = f"交叉验证未完成：{validation['error']}"
             return jsonify(result)
         except Exception as e:
             print(f"AI危机指数分析失败: {str(e)}")
             return jsonify({"score":0, "interpretation":"分析失败","features":[],"explanation":"","suggestions":"","validation":""})
+
+    def aiAssessmentStream(self):
+        """综合评估页面的 AI 分析（Server-Sent Events）
+
+        危机指数与危机关键词并发分析，危机指数一出结果就开始交叉验证；每个分析完成即推送一个事件，
+        事件名为 crisis_index / keywords / validation，数据为编排器的结果事件（status、result、error、elapsed_ms），
+        全部结束后推送 done。整体耗时受 ANALYSIS_BUDGET 限制。可选参数 user_id 只评估该用户的记录。
+        """
+        calls = self._crisisAssessmentCalls(userId=request.args.get('user_id') or None)
+
+        def event(eventType, data):
+            return f"event: {eventType}\ndata: {serializer.dumps(data)}\n\n"
+
+        def generate():
+            total = 0.0
+            for result in self.analysisOrchestrator.run(calls):
+                if result['name'] == 'crisis_index' and result['status'] != STATUS_DONE:
+                    result = dict(result, result=self._crisisFallback(result))
+                total = result['elapsed_ms']
+                yield event(result['name'], result)
+            yield event('done', {'elapsed_ms': total})
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+
+    def _assessmentInputs(self, history, emotions, userId=None):
+        """未提供的聊天历史 / 表情记录由服务端读取已保存的记录（userId 不为空时只读取该用户的）"""
+        if history is None:
+            chatData = self.chatService.data_service
+            history = chatData.get_chats(user_id=userId) if chatData is not None else []
+        if emotions is None:
+            emotionData = self.emotionService.data_service
+            emotions = emotionData.get_emotions(user_id=userId) if emotionData is not None else []
+        return history, emotions
+
+    def _crisisAssessmentCalls(self, history=None, emotions=None, keywords=True, userId=None):
+        """危机评估的分析调用：危机指数与关键词互不依赖，交叉验证依赖危机指数
+
+        history / emotions 均未提供且启用了增量计算时，危机指数由 crisisTracker 只处理新增记录；
+        需要读取的记录在各调用的工作线程中读取。
+        """
+        service = self.analysisService
+        if history is None and emotions is None and self.crisisTracker is not None:
+            crisis = lambda r: self.crisisTracker.compute(userId)
+        else:
+            crisis = lambda r: service.analyze_crisis_index(*self._assessmentInputs(history, emotions, userId), validate=False)
+        calls = [
+            AnalysisCall('crisis_index', crisis),
+            AnalysisCall(
+                'validation',
+                lambda r: service.cross_validation(json.dumps(r['crisis_index']), priority=INTERACTIVE),
+                after=['crisis_index'],
+            ),
+        ]
+        if keywords:
+            calls.append(AnalysisCall('keywords', lambda r: self._dangerKeywords(self._assessmentInputs(history, [], userId)[0])))
+        return calls
+
+    def _dangerKeywords(self, history):
+        """危机关键词分析；用户消息中没有任何词库命中时直接返回空结果，不调用模型"""
+        if self.dangerLexicon is not None:
+            texts = (m.get('message') if m.get('message') is not None else m.get('content', '')
+                     for m in history if isinstance(m, dict) and m.get('role', 'user') == 'user')
+            if not self.dangerLexicon.has_match(texts):
+                return ''
+        return self.analysisService.analyze_danger_keywords(history)
+
+    @staticmethod
+    def _crisisFallback(event):
+        """危机指数分析失败或超时时返回给页面的结果"""
+        interpretation = "分析超时" if event['status'] == 'timeout' else "分析失败"
+        return {"score":0, "interpretation":interpretation,"features":[],"explanation":event.get('error') or "","suggestions":"","validation":""}
         
     # 页面路由处理
     def index(self):
@@ -323,9 +677,52 @@ class WebApp:
             return jsonify({'status': 'error', 'message': '操作失败'}), 500
         
     def getSignals(self):
-        """获取所有危险信号"""
-        return jsonify(self.signalService.get_signals())
+        """获取危险信号（倒序），分页参数同 getChatHistory，另支持 type 按信号类型过滤"""
+        try:
+            page = self._pageArgs(extra=('type',))
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
+        if page is None:
+            return self._streamJson(self.signalService.iter_signals())
+        try:
+            items, next_cursor = self.signalService.get_signals_page(signal_type=request.args.get('type') or None, **page)
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
+        return jsonify({'items': items, 'next_cursor': next_cursor})
         
+    def streamSignals(self):
+        """以 Server-Sent Events 实时推送危险信号
+
+        事件 signal 携带新信号，signal_update 携带原地更新后的信号（按 id 替换），事件 reset 表示信号列表被清空/重新加载或断线期间的事件已无法补发，
+        客户端收到后应重新拉取列表。断线重连时浏览器自动携带 Last-Event-ID，服务端补发缓冲中之后的事件（服务重启前的ID只会得到 reset）；
+        空闲时定期发送注释行作为心跳，避免代理断开连接。
+        """
+        lastEventId = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        heartbeat = Config().signalStreamHeartbeat
+        subscription, backlog = self.signalBroker.subscribe(lastEventId)
+
+        def event(eventId, eventType, data):
+            return f"id: {eventId}\nevent: {eventType}\ndata: {serializer.dumps(data)}\n\n"
+
+        def generate():
+            try:
+                yield "retry: 3000\n\n"
+                for item in backlog:
+                    yield event(*item)
+                while True:
+                    item = subscription.get(timeout=heartbeat)
+                    if item is None:
+                        yield ": keep-alive\n\n"
+                    else:
+                        yield event(*item)
+            finally:
+                subscription.close()
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+
     def chatApi(self):
         """处理聊天请求"""
         data = request.json
@@ -333,8 +730,11 @@ class WebApp:
         if not userMessage:
             return jsonify({'response': "请输入有效的信息。"})
             
+        userId = self._currentUserId()
+        provisional = self._screenMessage(userId, userMessage)
+        confirmed = False
         try:
-            result = self.chatService.processMessage(userMessage)
+            result = self.chatService.processMessage(userMessage, userId)
             # 解析 AI 返回内容：优先当作 JSON 解析，若失败则当作普通文本
             try:
                 resultDict = json.loads(result)
@@ -348,18 +748,14 @@ class WebApp:
                     resultDict = {'type': 'text', 'message': result}
 
             if resultDict.get('type') == 'dangerous':
-                history = self.chatService.getChatHistory()
-                # 将历史按可用字段格式化为字符串（兼容 message/content）
-                historyStr = "\n".join([
-                    f"{msg.get('role')}:{msg.get('message') or msg.get('content', '')}"
-                    for msg in history
-                ])
-                analysis = self.analysisService.analyze_danger(history)
-                self.signalService.add_dangerous_chat("测试ID", userMessage, analysis)
+                self._recordDangerousChat(userId, userMessage, provisional)
+                confirmed = True
             return jsonify({'response': resultDict.get('message', str(result))})
         except Exception as e:
             print(f"Error in chat API: {str(e)}")
             return jsonify({'response': "抱歉，处理您的消息时出现错误，请稍后重试。"})
+        finally:
+            self._settleProvisional(provisional, confirmed)
 
     def streamChatApi(self):
         """处理流式聊天请求"""
@@ -367,106 +763,184 @@ class WebApp:
         userMessage = data.get('message') if data else None
         if not userMessage:
             return jsonify({'response': "请输入有效的信息。"})
+        # 生成器在请求上下文之外执行，需提前取出用户ID
+        userId = self._currentUserId()
+        # 在开始请求智能体之前完成本地预筛，命中时临时信号立即可见
+        provisional = self._screenMessage(userId, userMessage)
         
         def generate():
+            dangerous_handled = False
             try:
-                history = self.chatService.getChatHistory()
-                historyStr = "\n".join([f"{msg.get('role')}:{msg.get('message') or msg.get('content','')}" for msg in history])
-                dangerous_handled = False
-                assistant_accum = ''
-                for chunk in self.chatService.processStreamMessage(userMessage):
+                # 增量解析回复：JSON 回复只输出 message 字段，type 字段一完整即可判断危险
+                parser = StreamingReplyParser()
+                for chunk in self.chatService.processStreamMessage(userMessage, userId):
                     try:
-                        # Normalize chunk to dict
-                        try:
-                            jsonData = chunk if isinstance(chunk, dict) else json.loads(chunk)
-                        except Exception:
-                            # not a JSON chunk
-                            jsonData = {'message': str(chunk)}
-                        # Extract the message text
-                        raw_msg = jsonData.get('message') if isinstance(jsonData, dict) else str(jsonData)
-                        out_text = ''
-                        # 先尝试识别 ```json ... ``` 或 ``` ... ``` 中的 JSON
-                        if isinstance(raw_msg, str):
-                            s = raw_msg.strip()
-                            m = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", s, re.IGNORECASE)
-                            if not m:
-                                m = re.search(r"```\s*(\{[\s\S]*?\})\s*```", s)
-                            # 如果没找到 code-fence 包裹的 JSON，尝试文本中第一个 JSON 对象
-                            if not m:
-                                m = re.search(r"(\{[\s\S]*?\})", s)
-
-                            if m:
-                                json_text = m.group(1)
-                                try:
-                                    inner = json.loads(json_text)
-                                    if isinstance(inner, dict):
-                                        # 如果内部标注为危险，触发一次性处理（避免重复）
-                                        if not dangerous_handled and inner.get('type') == 'dangerous':
-                                            try:
-                                                latest_history = self.chatService.getChatHistory()
-                                                analysis = self.analysisService.analyze_danger(latest_history)
-                                                self.signalService.add_dangerous_chat("测试ID", userMessage, analysis)
-                                            except Exception as e:
-                                                print(f"添加危险聊天信号失败: {e}")
-                                            dangerous_handled = True
-                                        out_text = inner.get('message', s)
-                                    else:
-                                        out_text = s
-                                except Exception:
-                                    out_text = s
-                            else:
-                                out_text = s
-                        else:
-                            out_text = str(raw_msg)
-
-                        assistant_accum += out_text
-
-                        # 如果 jsonData 指示了类型（例如服务端产生 dict 且 type 字段存在），也单独处理
-                        if not dangerous_handled and isinstance(jsonData, dict) and jsonData.get('type') == 'dangerous':
-                            try:
-                                latest_history = self.chatService.getChatHistory()
-                                analysis = self.analysisService.analyze_danger(latest_history)
-                                self.signalService.add_dangerous_chat("测试ID", userMessage, analysis)
-                            except Exception as e:
-                                print(f"添加危险聊天信号失败: {e}")
+                        text, dangerous = self._chunkText(chunk)
+                        out_text = parser.feed(text)
+                        # 如果回复被标注为危险，触发一次性处理（避免重复）
+                        if (dangerous or parser.dangerous) and not dangerous_handled:
+                            self._recordDangerousChat(userId, userMessage, provisional)
                             dangerous_handled = True
-
-                        yield f"data: {json.dumps({'chunk': out_text})}\n\n"
+                        if out_text:
+                            yield f"data: {serializer.dumps({'chunk': out_text})}\n\n"
                     except Exception as e:
                         print(f"Error processing chunk: {str(e)}")
                         continue
+                out_text = parser.finish()
+                if out_text:
+                    yield f"data: {serializer.dumps({'chunk': out_text})}\n\n"
 
-                # 流结束后，若尚未处理到危险类型，尝试解析完整回复并处理
-                if not dangerous_handled and assistant_accum:
-                    try:
-                        s = assistant_accum.strip()
-                        if s.startswith('{') and s.endswith('}'):
-                            inner = json.loads(s)
-                            if isinstance(inner, dict) and inner.get('type') == 'dangerous':
-                                try:
-                                    latest_history = self.chatService.getChatHistory()
-                                    analysis = self.analysisService.analyze_danger(latest_history)
-                                    self.signalService.add_dangerous_chat("测试ID", userMessage, analysis)
-                                except Exception as e:
-                                    print(f"添加危险聊天信号失败(流结束后): {e}")
-                    except Exception:
-                        pass
-                        
             except Exception as e:
-                # 识别常见的权限/认证/网络错误并返回更友好的信息
-                err_str = str(e)
-                print(f"Error in stream chat API: {err_str}")
-                friendly = '抱歉，处理您的消息时出现错误，请稍后重试。'
-                # Coze 认证错误通常包含 code=4101 或提示 token 错误
-                if '4101' in err_str or 'token' in err_str.lower() or 'authentication' in err_str.lower():
-                    friendly = '后端 AI 服务认证失败：请检查 Coze/AI 服务的 API Token 配置（code 4101）。'
-                # DNS/网络解析错误（Windows 常见 errno 11001）
-                elif isinstance(e, socket.gaierror) or 'getaddrinfo' in err_str or '11001' in err_str:
-                    friendly = '网络错误：无法解析或连接到后端 AI 服务主机。请检查服务器网络、DNS 或代理设置（getaddrinfo 失败）。'
-                yield f"data: {json.dumps({'error': friendly})}\n\n"
+                print(f"Error in stream chat API: {str(e)}")
+                yield f"data: {serializer.dumps({'error': self._friendlyStreamError(e)})}\n\n"
+            finally:
+                self._settleProvisional(provisional, dangerous_handled)
         
         return Response(generate(), mimetype='text/event-stream')
 
+    @staticmethod
+    def _chunkText(chunk):
+        """取出聊天服务产出的流式片段中的文本，返回 (文本, 片段本身是否被标注为危险)"""
+        # Normalize chunk to dict
+        try:
+            jsonData = chunk if isinstance(chunk, dict) else json.loads(chunk)
+        except Exception:
+            # not a JSON chunk
+            jsonData = {'message': str(chunk)}
+        if not isinstance(jsonData, dict):
+            return str(jsonData), False
+        raw_msg = jsonData.get('message')
+        text = raw_msg if isinstance(raw_msg, str) else ('' if raw_msg is None else str(raw_msg))
+        return text, jsonData.get('type') == 'dangerous'
+
+    def _screenMessage(self, userId, userMessage):
+        """本地词库预筛：风险分达到阈值时立即记录一条临时危险信号（provisional），返回该信号，否则返回 None
+
+        在调用任何上游服务之前执行；临时信号由随后智能体的判断确认（_recordDangerousChat）或标记为未确认（_settleProvisional）。
+        """
+        if self.dangerLexicon is None:
+            return None
+        try:
+            result = self.dangerLexicon.scan(userMessage)
+            if result['score'] <= 0 or result['score'] < Config().dangerLexiconThreshold:
+                return None
+            terms = list(dict.fromkeys(m['term'] for m in result['matches'] if not m['negated']))
+            return self.signalService.add_dangerous_chat(userId, userMessage, screening={
+                'score': result['score'], 'terms': terms,
+            })
+        except Exception as e:
+            print(f"本地危机预筛失败: {e}")
+            return None
+
+    def _settleProvisional(self, provisional, confirmed):
+        """回复结束后，未被智能体确认为危险的临时信号标记为 unconfirmed（保留供人工查看）"""
+        if provisional is None or confirmed:
+            return
+        try:
+            self.signalService.update_signal(provisional['id'], {'analysis_status': 'unconfirmed'})
+        except Exception as e:
+            print(f"更新临时危险信号失败: {e}")
+
+    def _recordDangerousChat(self, userId, userMessage, provisional=None):
+        """立即记录危险聊天信号，危机分析提交到后台任务，完成后写回该信号（经 signal_update 推送）
+
+        provisional 为本地预筛已记录的临时信号时，确认该信号而不是另外新建一条。
+        """
+        try:
+            signal = None
+            if provisional is not None:
+                signal = self.signalService.update_signal(provisional['id'], {
+                    'provisional': False,
+                    'analyze': '危机分析进行中…',
+                    'analysis_status': 'pending',
+                })
+            if signal is None:
+                signal = self.signalService.add_dangerous_chat(userId, userMessage)
+            latest_history = list(self.chatService.getChatHistory(userId))
+        except Exception as e:
+            print(f"添加危险聊天信号失败: {e}")
+            return
+        payload = {'signal_id': signal['id'], 'history': latest_history}
+        try:
+            self.jobQueue.submit('danger_analysis', payload, user_id=userId)
+        except queue.Full:
+            # 不退回同步分析：聊天响应的延迟不应取决于分析
+            print('后台任务队列已满，危机分析未执行')
+            self.signalService.update_signal(signal['id'], {
+                'analyze': '后台任务队列已满，未能自动生成危机分析，请人工查看该对话。',
+                'analysis_status': 'failed',
+            })
+
+    def _runDangerAnalysis(self, payload):
+        """后台任务 danger_analysis：分析对话历史并把结果写回对应的危险信号
+
+        信号不存在（写回失败）或上游调用失败时抛出异常，任务记为失败而不是 done。
+        """
+        signalId = payload.get('signal_id')
+        history = payload.get('history') or []
+        service = self.analysisService
+
+        def writeBack(fields):
+            if self.signalService.update_signal(signalId, fields) is None:
+                raise RuntimeError(f'危险信号 {signalId} 不存在，分析结果无法写回')
+        # 分析与交叉验证是串行的两步，直接在任务线程中执行，不占用管理页面分析的编排线程池
+        try:
+            analysis = service.analyze_danger(history, validate=False)
+            error = (analysis or 'AI 未返回危机分析') if is_danger_failure(analysis) else None
+        except Exception as e:
+            error = str(e)
+        if error is not None:
+            writeBack({'analyze': f"危机分析失败: {error}", 'analysis_status': 'failed'})
+            raise RuntimeError(error)
+        # 先写回分析结果，交叉验证完成后再补充
+        writeBack({'analyze': analysis, 'analysis_status': 'validating'})
+        try:
+            validation = service.cross_validation(analysis)
+        except Exception as e:
+            print(f"危机分析交叉验证失败: {e}")
+            validation = f"交叉验证未完成：{e}"
+        writeBack({'analyze': with_validation(analysis, validation), 'analysis_status': 'done'})
+        return {'signal_id': signalId}
+
+    def getJobs(self):
+        """后台任务列表（按提交时间倒序），支持 status、limit 参数，同时返回各状态计数"""
+        try:
+            limit = min(int(request.args.get('limit', 100)), self.MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': f'查询参数无效: {e}'}), 400
+        jobs = self.jobQueue.list_jobs(status=request.args.get('status') or None, limit=limit)
+        return jsonify({'items': jobs, 'stats': self.jobQueue.stats()})
+
+    def getSchedulerStats(self):
+        """AI 分析调度器各优先级的排队数、执行中数量与等待时间"""
+        return jsonify(self.analysisScheduler.stats())
+
+    def getAnalysisCacheStats(self):
+        """AI 分析结果缓存的命中/未命中次数、命中率与条目数"""
+        if self.analysisCache is None:
+            return jsonify({'enabled': False})
+        return jsonify(dict(self.analysisCache.stats(), enabled=True))
+
+    def getJob(self, jobId):
+        """查询单个后台任务的状态与结果"""
+        job = self.jobQueue.get(jobId)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify(job)
+
+    @staticmethod
+    def _friendlyStreamError(e):
+        """识别常见的权限/认证/网络错误并返回更友好的信息"""
+        err_str = str(e)
+        friendly = '抱歉，处理您的消息时出现错误，请稍后重试。'
+        # Coze 认证错误通常包含 code=4101 或提示 token 错误
+        if '4101' in err_str or 'token' in err_str.lower() or 'authentication' in err_str.lower():
+            friendly = '后端 AI 服务认证失败：请检查 Coze/AI 服务的 API Token 配置（code 4101）。'
+        # DNS/网络解析错误（Windows 常见 errno 11001）
+        elif isinstance(e, socket.gaierror) or 'getaddrinfo' in err_str or '11001' in err_str:
+            friendly = '网络错误：无法解析或连接到后端 AI 服务主机。请检查服务器网络、DNS 或代理设置（getaddrinfo 失败）。'
+        return friendly
+
     def saveChatHistory(self):
         """保存历史记录到文件"""
         try:
@@ -478,9 +952,9 @@ class WebApp:
             return jsonify({'status': 'error', 'message': '保存聊天记录时出错，请稍后重试'}), 500
     
     def delHistory(self):
-        """删除历史记录"""
+        """删除当前用户的历史记录"""
         try:
-            self.chatService.deleteChatHistory()
+            self.chatService.deleteChatHistory(self._currentUserId())
             return jsonify({'status': 'success', 'message': '已经删了'}), 200
         except Exception as e:
             print(f'删除聊天记录时出错: {str(e)}')
@@ -499,7 +973,7 @@ class WebApp:
         """API: 清空表情识别记录文件"""
         try:
             if self.emotionService.data_service is not None:
-                self.emotionService.data_service._write_json(self.emotionService.data_service.emotions_file, [])
+                self.emotionService.data_service.clear_emotions()
                 return jsonify({'status': 'success', 'message': '表情识别记录已清空'}), 200
             else:
                 return jsonify({'status': 'error', 'message': 'emotion data service 未初始化'}), 500
@@ -530,8 +1004,9 @@ class WebApp:
                 except Exception:
                     # 退回为写入空对象
                     with open(pref_file, 'w', encoding='utf-8') as f:
-                        json.dump({}, f, ensure_ascii=False, indent=4)
+                        f.write(serializer.dumps_pretty({}))
             self.preferences = {}
+            self.chatService.updateUserPreferences({})
             return jsonify({'status': 'success', 'message': '用户喜好已清空'}), 200
         except Exception as e:
             print(f'清空用户喜好时出错: {str(e)}')
@@ -540,11 +1015,11 @@ class WebApp:
     def analyzePreferences(self):
         """分析用户喜好"""
         try:
-            history = self.chatService.getChatHistory()
+            history = self.chatService.getChatHistory(self._currentUserId())
             historyStr = "\n".join([f"{msg['role']}:{msg['content']}" for msg in history])
             result = self.analysisService.analyze_preferences(history)
             with open('preference.json', 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
+                f.write(serializer.dumps_pretty(result))
                 
             return jsonify({'status': 'success', 'message': '已经分析完毕并保存到文件'}), 200
         except Exception as e:
@@ -560,10 +1035,11 @@ class WebApp:
             image = request.files['image']
             image_path = "temp_emotion.jpg"
             image.save(image_path)
-            result = self.emotionService.analyze_emotion(image_path)
+            userId = self._currentUserId()
+            result = self.emotionService.analyze_emotion(image_path, userId)
             depressed_data = self.emotionService.is_depressed(result)
             if isinstance(depressed_data, bool) and depressed_data:
-                self.signalService.add_emotion_signal(result, )
+                self.signalService.add_emotion_signal(result, userId)
                 
             return jsonify({
                 'status': 'success',
@@ -578,11 +1054,12 @@ class WebApp:
     def captureEmotion(self):
         """从摄像头捕获并分析表情"""
         try:
-            result = self.emotionService.capture_and_analyze()
+            userId = self._currentUserId()
+            result = self.emotionService.capture_and_analyze(user_id=userId)
             depressed_data = self.emotionService.is_depressed(result)
             # 仅当 depressed_data 为 dict 且非空时才调用 add_emotion_signal
             if isinstance(depressed_data, bool) and depressed_data:
-                self.signalService.add_emotion_signal(result)
+                self.signalService.add_emotion_signal(result, userId)
                 
             return jsonify({
                 'status': 'success',
@@ -599,7 +1076,7 @@ class WebApp:
         try:
             if os.path.exists('preference.json'):
                 with open('preference.json', 'r', encoding='utf-8') as f:
-                    self.preferences = json.load(f)
+                    self.preferences = serializer.loads(f.read())
                     print("已载入喜好:", self.preferences)
             else:
                 print("还没保存过喜好记录")
@@ -611,6 +1088,7 @@ class WebApp:
         """加载聊天历史和信号"""
         self.chatService.loadChatHistory()
         self.signalService.load_signals()
+        self.jobQueue.start()
         self._loadPreferences()
         if self.preferences:
             self.chatService.updateUserPreferences(self.preferences)
@@ -618,6 +1096,8 @@ class WebApp:
     def run(self, host='0.0.0.0', port=5000, debug=False, ssl_context=None):
         """运行Web应用"""
         ssl_context = (self.cert_file, self.key_file) if ssl_context is None else ssl_context
+        # 收到 SIGTERM 时也要把写后缓冲中的记录落盘
+        install_shutdown_handlers()
         self._loadHistory()
         print("Luminest 工作坊网页版启动")
         if ssl_context:
@@ -0,0 +1,163 @@
+import threading
+import time
+import pytest
+
+from src.services.analysisCache import AnalysisCache, CachedAnalysisService
+from src.services.analysisService import CRISIS_UNSTRUCTURED
+from src.services.recordStore import JsonlStore
+
+
+class Counter:
+    def __init__(self, result="结果"):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+def test_hit_after_miss():
+    cache = AnalysisCache()
+    compute = Counter()
+    key = AnalysisCache.make_key("keywords", "对话")
+    assert cache.get_or_compute(key, "keywords", compute) == "结果"
+    assert cache.get_or_compute(key, "keywords", compute) == "结果"
+    assert compute.calls == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_key_depends_on_input():
+    assert AnalysisCache.make_key("keywords", "a") != AnalysisCache.make_key("keywords", "b")
+    assert AnalysisCache.make_key("keywords", "a") != AnalysisCache.make_key("preferences", "a")
+
+
+def test_concurrent_requests_compute_once():
+    cache = AnalysisCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(2.0)
+        return "结果"
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", "keywords", compute)))
+    owner.start()
+    started.wait(2.0)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", "keywords", compute)))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert results == ["结果", "结果"]
+    assert len(calls) == 1
+    assert cache.stats()["shared"] == 1
+
+
+def test_failures_are_not_cached():
+    cache = AnalysisCache()
+
+    def boom():
+        raise RuntimeError("上游失败")
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", "keywords", boom)
+    empty = Counter("")
+    cache.get_or_compute("k", "keywords", empty)
+    cache.get_or_compute("k", "keywords", empty)
+    assert empty.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_record_invalidates_only_that_user():
+    cache = AnalysisCache()
+    cache.get_or_compute("a", "keywords", Counter(), sources=["chat"], users=["u1"])
+    cache.get_or_compute("b", "keywords", Counter(), sources=["chat"], users=["u2"])
+    cache.get_or_compute("c", "validation", Counter())
+    cache.on_record("chat", {"user_id": "u1"})
+    assert cache.stats()["entries"] == 2
+    cache.on_record("emotion", {"user_id": "u2"})
+    assert cache.stats()["entries"] == 2
+    # 清空聊天记录：所有依赖聊天记录的条目失效，交叉验证结果保留
+    cache.on_record("chat", None)
+    assert cache.stats()["kinds"] == {"validation": 1}
+
+
+def test_lru_eviction():
+    cache = AnalysisCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute(key, "keywords", Counter())
+    compute = Counter()
+    cache.get_or_compute("a", "keywords", compute)
+    assert compute.calls == 1
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_expired_entry_is_recomputed():
+    cache = AnalysisCache(ttl=0.05)
+    compute = Counter()
+    cache.get_or_compute("k", "keywords", compute)
+    time.sleep(0.1)
+    cache.get_or_compute("k", "keywords", compute)
+    assert compute.calls == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_entries_survive_restart(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    cache = AnalysisCache(JsonlStore(path))
+    cache.get_or_compute("a", "keywords", Counter("甲"), sources=["chat"], users=["u1"])
+    cache.get_or_compute("b", "keywords", Counter("乙"), sources=["chat"], users=["u2"])
+    cache.on_record("chat", {"user_id": "u2"})
+
+    reloaded = AnalysisCache(JsonlStore(path))
+    compute = Counter("新")
+    assert reloaded.get_or_compute("a", "keywords", compute) == "甲"
+    assert reloaded.get_or_compute("b", "keywords", compute) == "新"
+    assert compute.calls == 1
+
+
+class FakeService:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def _format_history(self, history):
+        return "\n".join(m["message"] for m in history)
+
+    def _crisis_index_input(self, history, emotions):
+        return self._format_history(history) + f"|{len(emotions)}"
+
+    def analyze_crisis_index(self, history, emotions, validate=True):
+        self.calls += 1
+        if self.fail:
+            return {"score": 0, "interpretation": CRISIS_UNSTRUCTURED, "explanation": ""}
+        return {"score": 30, "interpretation": "低风险", "explanation": "说明"}
+
+    def analyze_danger_keywords(self, history):
+        self.calls += 1
+        return "关键词"
+
+
+def test_cached_service_ignores_unrelated_fields():
+    service = FakeService()
+    cached = CachedAnalysisService(service, AnalysisCache())
+    history = [{"user_id": "u1", "message": "你好", "timestamp": "2024-01-01T00:00:00"}]
+    cached.analyze_danger_keywords(history)
+    cached.analyze_danger_keywords([dict(history[0], timestamp="2024-01-02T00:00:00")])
+    assert service.calls == 1
+
+
+def test_cached_service_skips_failed_crisis_index():
+    service = FakeService()
+    service.fail = True
+    cached = CachedAnalysisService(service, AnalysisCache())
+    history = [{"user_id": "u1", "message": "你好"}]
+    cached.analyze_crisis_index(history, [])
+    cached.analyze_crisis_index(history, [])
+    assert service.calls == 2
@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+
+from src.services.analysisOrchestrator import (
+    AnalysisOrchestrator, AnalysisCall, STATUS_DONE, STATUS_FAILED, STATUS_TIMEOUT, STATUS_SKIPPED,
+)
+
+
+@pytest.fixture
+def orchestrator():
+    orchestrator = AnalysisOrchestrator(max_workers=4, budget=5.0, call_timeout=2.0)
+    yield orchestrator
+    orchestrator.shutdown()
+
+
+def test_dependent_call_receives_upstream_result(orchestrator):
+    calls = [
+        AnalysisCall("a", lambda r: 1),
+        AnalysisCall("b", lambda r: r["a"] + 1, after=["a"]),
+    ]
+    events = orchestrator.run_all(calls)
+    assert events["a"]["status"] == STATUS_DONE
+    assert events["b"]["result"] == 2
+
+
+def test_independent_calls_run_concurrently(orchestrator):
+    barrier = threading.Barrier(2, timeout=1.0)
+    calls = [AnalysisCall(name, lambda r: barrier.wait()) for name in ("a", "b")]
+    events = orchestrator.run_all(calls)
+    assert all(event["status"] == STATUS_DONE for event in events.values())
+
+
+def test_failure_skips_dependents(orchestrator):
+    def boom(results):
+        raise RuntimeError("上游失败")
+    calls = [
+        AnalysisCall("a", boom),
+        AnalysisCall("b", lambda r: r["a"], after=["a"]),
+    ]
+    events = orchestrator.run_all(calls)
+    assert events["a"]["status"] == STATUS_FAILED
+    assert events["a"]["error"] == "上游失败"
+    assert events["b"]["status"] == STATUS_SKIPPED
+
+
+def test_slow_call_times_out(orchestrator):
+    release = threading.Event()
+    calls = [AnalysisCall("slow", lambda r: release.wait(2.0), timeout=0.1)]
+    events = orchestrator.run_all(calls)
+    release.set()
+    assert events["slow"]["status"] == STATUS_TIMEOUT
+
+
+def test_timeout_starts_when_call_begins_running():
+    orchestrator = AnalysisOrchestrator(max_workers=1, budget=5.0, call_timeout=0.3)
+    try:
+        # 单线程池中第二个调用排队约 0.2 秒，本身只执行 0.2 秒，不应因排队时间超时
+        calls = [AnalysisCall(name, lambda r: time.sleep(0.2)) for name in ("a", "b")]
+        events = orchestrator.run_all(calls)
+    finally:
+        orchestrator.shutdown()
+    assert events["a"]["status"] == STATUS_DONE
+    assert events["b"]["status"] == STATUS_DONE
+
+
+def test_budget_exceeded(orchestrator):
+    release = threading.Event()
+    calls = [
+        AnalysisCall("a", lambda r: release.wait(2.0)),
+        AnalysisCall("b", lambda r: 1, after=["a"]),
+    ]
+    events = orchestrator.run_all(calls, budget=0.1)
+    release.set()
+    assert events["a"]["status"] == STATUS_TIMEOUT
+    assert events["b"]["status"] == STATUS_SKIPPED
+
+
+def test_cycle_is_skipped(orchestrator):
+    calls = [
+        AnalysisCall("a", lambda r: 1, after=["b"]),
+        AnalysisCall("b", lambda r: 1, after=["a"]),
+    ]
+    events = orchestrator.run_all(calls)
+    assert {event["status"] for event in events.values()} == {STATUS_SKIPPED}
+
+
+def test_unknown_dependency_is_rejected(orchestrator):
+    with pytest.raises(ValueError):
+        orchestrator.run_all([AnalysisCall("a", lambda r: 1, after=["missing"])])
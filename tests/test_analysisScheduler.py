@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from src.services.analysisScheduler import AnalysisScheduler, BATCH, CRITICAL, INTERACTIVE
+
+
+def _occupy(scheduler, priority, release, started):
+    def hold():
+        started.release()
+        release.wait(5)
+    thread = threading.Thread(target=scheduler.run, args=(priority, hold))
+    thread.start()
+    return thread
+
+
+def test_critical_not_blocked_by_saturated_interactive():
+    scheduler = AnalysisScheduler(limits={CRITICAL: 1, INTERACTIVE: 2, BATCH: 1}, aging=0)
+    release, started = threading.Event(), threading.Semaphore(0)
+    threads = [_occupy(scheduler, INTERACTIVE, release, started) for _ in range(4)]
+    for _ in range(2):
+        assert started.acquire(timeout=2)
+    assert scheduler.stats()[INTERACTIVE]["queued"] == 2
+    start = time.monotonic()
+    assert scheduler.run(CRITICAL, lambda: "ok") == "ok"
+    assert time.monotonic() - start < 0.5
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert scheduler.stats()[INTERACTIVE]["completed"] == 4
+
+
+def test_concurrency_limit_per_class():
+    scheduler = AnalysisScheduler(limits={INTERACTIVE: 2}, aging=0)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def work():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    threads = [threading.Thread(target=scheduler.run, args=(INTERACTIVE, work)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2
+
+
+def test_batch_is_promoted_after_aging():
+    scheduler = AnalysisScheduler(limits={CRITICAL: 1, INTERACTIVE: 1, BATCH: 1}, aging=0.05)
+    release, started = threading.Event(), threading.Semaphore(0)
+    holder = _occupy(scheduler, BATCH, release, started)
+    assert started.acquire(timeout=2)
+    waiter = threading.Thread(target=scheduler.run, args=(BATCH, lambda: None))
+    waiter.start()
+    waiter.join(2)
+    assert not waiter.is_alive()
+    assert scheduler.stats()[BATCH]["promoted"] == 1
+    release.set()
+    holder.join()
+
+
+def test_exceptions_release_the_slot():
+    scheduler = AnalysisScheduler(limits={CRITICAL: 1}, aging=0)
+
+    def boom():
+        raise RuntimeError("x")
+
+    with pytest.raises(RuntimeError):
+        scheduler.run(CRITICAL, boom)
+    assert scheduler.run(CRITICAL, lambda: 1) == 1
+    assert scheduler.stats()[CRITICAL]["running"] == 0
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        AnalysisScheduler().run("urgent", lambda: None)
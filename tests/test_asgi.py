@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import pytest
+
+asgi = pytest.importorskip("src.asgi")
+
+
+def _scope(path):
+    return {"type": "http", "method": "GET", "path": path, "query_string": b"", "http_version": "1.1",
+            "headers": [], "scheme": "http"}
+
+
+def _stream_app(closed):
+    """/stream 模拟 SSE：持续发送心跳直到连接关闭；其他路径立即返回"""
+    def app(environ, start_response):
+        if environ["PATH_INFO"] != "/stream":
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"pong"]
+
+        def generate():
+            try:
+                yield b"data: 1\n\n"
+                while True:
+                    closed.wait(0.05)
+                    yield b": keep-alive\n\n"
+            finally:
+                closed.set()
+        start_response("200 OK", [("Content-Type", "text/event-stream")])
+        return generate()
+    return app
+
+
+class Client:
+    """一个请求的 receive/send：disconnect() 之后 receive 返回 http.disconnect"""
+
+    def __init__(self):
+        self.messages = []
+        self.first_body = asyncio.Event()
+        self._disconnect = asyncio.Event()
+        self._sent_request = False
+
+    def disconnect(self):
+        self._disconnect.set()
+
+    async def receive(self):
+        if not self._sent_request:
+            self._sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.messages.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            self.first_body.set()
+
+    def body(self):
+        return b"".join(m.get("body", b"") for m in self.messages if m["type"] == "http.response.body")
+
+
+def test_request_is_served_while_a_stream_is_open():
+    closed = threading.Event()
+    app = asgi.ThreadedWsgi(_stream_app(closed), maxWorkers=4)
+
+    async def scenario():
+        stream = Client()
+        task = asyncio.ensure_future(app(_scope("/stream"), stream.receive, stream.send))
+        await asyncio.wait_for(stream.first_body.wait(), 2.0)
+        ping = Client()
+        await asyncio.wait_for(app(_scope("/ping"), ping.receive, ping.send), 2.0)
+        assert ping.body() == b"pong"
+        assert not task.done()
+        # 客户端断开后流式响应结束并关闭，释放线程
+        stream.disconnect()
+        await asyncio.wait_for(task, 2.0)
+
+    asyncio.run(scenario())
+    assert closed.is_set()
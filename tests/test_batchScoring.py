@@ -0,0 +1,181 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+
+from src.batchScoring import BatchScoringJob, WindowGrouper, iter_timeline
+from src.services.crisisScorers import LexiconCrisisScorer
+from src.services.dangerLexicon import DangerLexicon
+from src.services.retentionService import RetentionPolicy, RetentionService, iter_rotated
+from src.services.recordStore import JsonlStore
+
+# factory 创建的评分器对这些用户抛出异常
+FAIL_USERS = set()
+
+
+def factory():
+    inner = LexiconCrisisScorer(DangerLexicon())
+
+    def score(chats, emotions):
+        if chats and chats[0]["user_id"] in FAIL_USERS:
+            raise RuntimeError("评分失败")
+        return inner(chats, emotions)
+    return score
+
+
+SCORER = "tests.test_batchScoring:factory"
+
+
+@pytest.fixture(autouse=True)
+def _reset_failures():
+    FAIL_USERS.clear()
+    yield
+    FAIL_USERS.clear()
+
+
+def _chat(user_id, day, hour, message="你好"):
+    return {"user_id": user_id, "role": "user", "message": message, "timestamp": f"2024-01-{day:02d}T{hour:02d}:00:00"}
+
+
+class FakeData:
+    def __init__(self, chats, emotions=(), rotated_chats=()):
+        self.chats = sorted(chats, key=lambda r: r["timestamp"])
+        self.emotions = sorted(emotions, key=lambda r: r["timestamp"])
+        self.rotated_chats = list(rotated_chats)
+
+    def iter_chats(self, include_rotated=False):
+        return iter((self.rotated_chats if include_rotated else []) + self.chats)
+
+    def iter_emotions(self, include_rotated=False):
+        return iter(self.emotions)
+
+
+def _data():
+    return FakeData(
+        [_chat("a", 1, 1), _chat("a", 1, 5, "我想死"), _chat("b", 1, 2), _chat("a", 2, 3), _chat("b", 3, 4)],
+        [{"user_id": "a", "timestamp": "2024-01-01T02:00:00", "data": {"dominant_emotion": "sad"}}],
+    )
+
+
+def _groups(grouper, records):
+    groups = []
+    for kind, record in records:
+        groups.extend(grouper.feed(kind, record))
+    return groups + grouper.flush()
+
+
+def test_timeline_is_merged_in_time_order():
+    timeline = list(iter_timeline(_data(), users=["a"]))
+    assert [record["timestamp"] for _, record in timeline] == sorted(r["timestamp"] for _, r in timeline)
+    assert [kind for kind, _ in timeline].count("emotion") == 1
+    assert {record["user_id"] for _, record in timeline} == {"a"}
+
+
+def test_windows_group_by_user_and_day():
+    groups = _groups(WindowGrouper(timedelta(hours=24)), iter_timeline(_data()))
+    assert [g["group"] for g in groups] == [
+        "a|2024-01-01T00:00:00", "b|2024-01-01T00:00:00", "a|2024-01-02T00:00:00", "b|2024-01-03T00:00:00",
+    ]
+    assert (len(groups[0]["chats"]), len(groups[0]["emotions"])) == (2, 1)
+
+
+def test_whole_history_window():
+    groups = _groups(WindowGrouper(None), iter_timeline(_data()))
+    assert sorted(g["group"] for g in groups) == ["a|all", "b|all"]
+
+
+def test_records_older_than_a_window_are_late():
+    grouper = WindowGrouper(timedelta(hours=24))
+    groups = _groups(grouper, [("chat", _chat("a", 5, 0)), ("chat", _chat("a", 1, 0)), ("chat", {"timestamp": "坏"})])
+    assert [g["group"] for g in groups] == ["a|2024-01-05T00:00:00"]
+    assert (grouper.late, grouper.invalid) == (1, 1)
+
+
+def _job(tmp_path, **kwargs):
+    kwargs.setdefault("workers", 0)
+    kwargs.setdefault("progress_interval", 0)
+    return BatchScoringJob(_data(), SCORER, str(tmp_path / "scores.jsonl"), **kwargs)
+
+
+def _lines(tmp_path):
+    with open(tmp_path / "scores.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_run_writes_one_line_per_group(tmp_path):
+    job = _job(tmp_path)
+    job.prepare()
+    stats = job.run()
+    assert (stats["groups"], stats["failed"], stats["records"]) == (4, 0, 6)
+    lines = _lines(tmp_path)
+    assert len(lines) == 4
+    first = lines[0]
+    assert first["group"] == "a|2024-01-01T00:00:00"
+    assert first["score"] > 0 and "想死" in first["features"]
+
+
+def test_resume_skips_done_groups_and_drops_partial_line(tmp_path):
+    job = _job(tmp_path, checkpoint_every=1)
+    job.prepare()
+    job.run()
+    # 模拟检查点之后写了半行就中断
+    with open(tmp_path / "scores.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"group": "半截')
+    resumed = _job(tmp_path)
+    resumed.prepare()
+    stats = resumed.run()
+    assert (stats["groups"], stats["skipped"]) == (0, 4)
+    assert len(_lines(tmp_path)) == 4
+
+
+def test_checkpoint_with_other_params_is_rejected(tmp_path):
+    job = _job(tmp_path)
+    job.prepare()
+    job.run()
+    with pytest.raises(ValueError):
+        _job(tmp_path, window_hours=12).prepare()
+    _job(tmp_path, window_hours=12).prepare(restart=True)
+    assert _lines(tmp_path) == []
+
+
+def test_failed_groups_are_retried(tmp_path):
+    FAIL_USERS.add("b")
+    job = _job(tmp_path)
+    job.prepare()
+    stats = job.run()
+    assert (stats["groups"], stats["failed"]) == (2, 2)
+    FAIL_USERS.clear()
+    retry = _job(tmp_path)
+    retry.prepare()
+    stats = retry.run()
+    assert (stats["groups"], stats["skipped"], stats["failed"]) == (2, 2, 0)
+    assert sorted(line["user_id"] for line in _lines(tmp_path)) == ["a", "a", "b", "b"]
+
+
+def test_process_pool_matches_inline_run(tmp_path):
+    inline = _job(tmp_path / "inline")
+    inline.prepare()
+    inline.run()
+    pooled = _job(tmp_path / "pool", workers=2)
+    pooled.prepare()
+    stats = pooled.run()
+    assert stats["groups"] == 4
+    pooled_scores = sorted((line["group"], line["score"]) for line in _lines(tmp_path / "pool"))
+    assert pooled_scores == sorted((line["group"], line["score"]) for line in _lines(tmp_path / "inline"))
+
+
+def test_rotated_records_are_scored():
+    data = FakeData([_chat("a", 2, 3)], rotated_chats=[_chat("a", 1, 1)])
+    assert [r["timestamp"][:10] for _, r in iter_timeline(data)] == ["2024-01-01", "2024-01-02"]
+    assert len(list(iter_timeline(data, include_rotated=False))) == 1
+
+
+def test_iter_rotated_reads_archives_then_segments(tmp_path):
+    data_dir = str(tmp_path)
+    store = JsonlStore(str(tmp_path / "chats.jsonl"))
+    store.extend([_chat("a", 1, 1), _chat("a", 2, 1), _chat("a", 20, 1)])
+    store.close()
+    service = RetentionService(data_dir, RetentionPolicy(max_segment_bytes=1, min_active_days=0))
+    assert service.rotate("chats", now=datetime(2024, 1, 2)) is not None
+    assert service.compact(now=datetime(2025, 1, 1)) == 1
+    assert service.rotate("chats", now=datetime(2024, 1, 3)) is not None
+    assert [r["timestamp"][:10] for r in iter_rotated(data_dir, "chats")] == ["2024-01-01", "2024-01-02"]
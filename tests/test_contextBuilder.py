@@ -0,0 +1,28 @@
+from src.services.contextBuilder import ContextBuilder
+from src.services.sessionManager import ChatSession
+
+
+def _builder(**kwargs):
+    return ContextBuilder(lambda role, text: (role, text), **kwargs)
+
+
+def _turn(role, message):
+    return {"role": role, "message": message, "timestamp": "2024-01-01T00:00:00"}
+
+
+def test_exclude_drops_only_the_given_message():
+    session = ChatSession("u", [_turn("user", "早"), _turn("assistant", "早上好")], max_messages=10)
+    current = _turn("user", "今天怎么样")
+    session.append(current)
+    # 同一会话的并发请求在本轮之后追加了消息，本轮的消息不再是最后一条
+    session.append(_turn("user", "还在吗"))
+    builder = _builder()
+    assert builder.build(session, exclude=current) == [("user", "早"), ("assistant", "早上好"), ("user", "还在吗")]
+    assert builder.build(session)[-2:] == [("user", "今天怎么样"), ("user", "还在吗")]
+
+
+def test_exclude_keeps_context_when_message_was_skipped():
+    session = ChatSession("u", [_turn("user", "早")], max_messages=10)
+    empty = _turn("user", "")
+    session.append(empty)
+    assert _builder().build(session, exclude=empty) == [("user", "早")]
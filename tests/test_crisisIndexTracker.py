@@ -0,0 +1,103 @@
+from src.services.analysisService import CRISIS_UNSTRUCTURED
+from src.services.crisisIndexTracker import CrisisIndexTracker
+from src.services.recordStore import JsonlStore
+
+
+def _chat(second, message="今天很累", user_id="u1"):
+    return {"user_id": user_id, "role": "user", "message": message, "timestamp": f"2024-01-01T00:00:{second:02d}"}
+
+
+class FakeChats:
+    def __init__(self, records=()):
+        self.records = list(records)
+
+    def get_chats(self, user_id=None, since=None):
+        return [r for r in self.records if user_id is None or r["user_id"] == user_id]
+
+
+class FakeService:
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def _format_history(self, history):
+        return "\n".join(f"用户: {m['message']}" for m in history)
+
+    def analyze_crisis_index_delta(self, state, chats, emotions, summary_chars=600):
+        self.calls.append((dict(state), list(chats), list(emotions)))
+        if self.fail:
+            return {"score": 0, "interpretation": CRISIS_UNSTRUCTURED, "explanation": ""}
+        score = state.get("score", 0) + len(chats)
+        return {"score": score, "interpretation": "低风险", "features": [], "explanation": "说明",
+                "summary": f"摘要{score}"}
+
+
+def test_only_new_records_are_sent():
+    chats = FakeChats([_chat(1), _chat(2)])
+    service = FakeService()
+    tracker = CrisisIndexTracker(service, chats, None)
+    assert tracker.compute("u1")["score"] == 2
+    chats.records.append(_chat(3))
+    assert tracker.compute("u1")["score"] == 3
+    assert [m["timestamp"] for m in service.calls[-1][1]] == ["2024-01-01T00:00:03"]
+    assert service.calls[-1][0]["summary"] == "摘要2"
+
+
+def test_no_new_records_skips_the_model():
+    service = FakeService()
+    tracker = CrisisIndexTracker(service, FakeChats([_chat(1)]), None)
+    first = tracker.compute("u1")
+    assert tracker.compute("u1") == first
+    assert len(service.calls) == 1
+
+
+def test_backlog_is_split_into_batches():
+    service = FakeService()
+    size = len(service._format_history([_chat(1)]))
+    tracker = CrisisIndexTracker(service, FakeChats([_chat(i) for i in range(5)]), None, delta_chars=size * 2)
+    tracker.compute("u1")
+    assert [len(call[1]) for call in service.calls] == [2, 2, 1]
+    assert tracker.get_state("u1")["processed_chats"] == 5
+
+
+def test_unstructured_result_does_not_advance():
+    chats = FakeChats([_chat(1)])
+    service = FakeService()
+    tracker = CrisisIndexTracker(service, chats, None)
+    tracker.compute("u1")
+    chats.records.append(_chat(2))
+    service.fail = True
+    assert tracker.compute("u1")["score"] == 1
+    assert tracker.get_state("u1")["last_timestamp"] == "2024-01-01T00:00:01"
+    service.fail = False
+    assert tracker.compute("u1")["score"] == 2
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "crisis_state.jsonl")
+    chats = FakeChats([_chat(1)])
+    CrisisIndexTracker(FakeService(), chats, None, store=JsonlStore(path)).compute("u1")
+
+    service = FakeService()
+    tracker = CrisisIndexTracker(service, chats, None, store=JsonlStore(path))
+    assert tracker.compute("u1")["score"] == 1
+    assert service.calls == []
+
+
+def test_clearing_records_resets_state(tmp_path):
+    path = str(tmp_path / "crisis_state.jsonl")
+    chats = FakeChats([_chat(1)])
+    tracker = CrisisIndexTracker(FakeService(), chats, None, store=JsonlStore(path))
+    tracker.compute("u1")
+    tracker.compute(None)
+    tracker.on_record("chat", None)
+    assert tracker.get_state("u1") is None
+    assert tracker.get_state() is None
+    assert CrisisIndexTracker(FakeService(), chats, None, store=JsonlStore(path)).get_state("u1") is None
+
+
+def test_empty_scope():
+    service = FakeService()
+    result = CrisisIndexTracker(service, FakeChats(), None).compute("u1")
+    assert result["score"] == 0
+    assert service.calls == []
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+import pytest
+
+webapp = pytest.importorskip("src.webapp")
+from src.services.analysisService import DANGER_FAILED
+
+
+class FakeSignals:
+    def __init__(self, ids):
+        self.signals = {i: {"id": i} for i in ids}
+
+    def update_signal(self, signal_id, fields):
+        signal = self.signals.get(signal_id)
+        if signal is None:
+            return None
+        signal.update(fields)
+        return dict(signal)
+
+
+class FakeAnalysis:
+    def __init__(self, analysis="分析结果", validation_error=None):
+        self.analysis = analysis
+        self.validation_error = validation_error
+
+    def analyze_danger(self, history, validate=True):
+        return self.analysis
+
+    def cross_validation(self, text, **kwargs):
+        if self.validation_error:
+            raise RuntimeError(self.validation_error)
+        return "验证通过"
+
+
+def _app(signals, analysis):
+    # 危机分析不经过编排线程池，WebApp 只需提供信号与分析服务
+    return SimpleNamespace(signalService=signals, analysisService=analysis)
+
+
+def test_analysis_is_written_back():
+    signals = FakeSignals(["s1"])
+    result = webapp.WebApp._runDangerAnalysis(_app(signals, FakeAnalysis()), {"signal_id": "s1", "history": []})
+    assert result == {"signal_id": "s1"}
+    assert signals.signals["s1"]["analysis_status"] == "done"
+    assert "验证通过" in signals.signals["s1"]["analyze"]
+
+
+def test_missing_signal_fails_the_job():
+    with pytest.raises(RuntimeError):
+        webapp.WebApp._runDangerAnalysis(_app(FakeSignals([]), FakeAnalysis()), {"signal_id": "gone", "history": []})
+
+
+def test_upstream_failure_string_fails_the_job():
+    signals = FakeSignals(["s1"])
+    with pytest.raises(RuntimeError):
+        webapp.WebApp._runDangerAnalysis(_app(signals, FakeAnalysis(DANGER_FAILED)), {"signal_id": "s1", "history": []})
+    assert signals.signals["s1"]["analysis_status"] == "failed"
+
+
+def test_validation_failure_still_completes_the_job():
+    signals = FakeSignals(["s1"])
+    webapp.WebApp._runDangerAnalysis(_app(signals, FakeAnalysis(validation_error="超时")), {"signal_id": "s1", "history": []})
+    assert signals.signals["s1"]["analysis_status"] == "done"
+    assert "分析结果" in signals.signals["s1"]["analyze"]
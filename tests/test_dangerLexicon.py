@@ -0,0 +1,70 @@
+import json
+import random
+import pytest
+
+from src.services.dangerLexicon import AhoCorasick, DangerLexicon, load_lexicon
+
+
+@pytest.fixture(scope="module")
+def lexicon():
+    return DangerLexicon()
+
+
+@pytest.mark.parametrize("text", [
+    "我忍不住想自杀",
+    "我受不了了想死",
+    "我撑不住了想死",
+    "我每天都不开心想死",
+    "我不知道为什么想死",
+    "他说不，我想死",
+    "不想活了",
+])
+def test_negation_of_another_word_still_scores(lexicon, text):
+    assert lexicon.scan(text)["score"] > 0
+
+
+@pytest.mark.parametrize("text", [
+    "我不想自杀",
+    "我不会自杀的",
+    "没有想死",
+    "我没有想过要自杀",
+    "我从来没想过自杀",
+    "我绝不会伤害自己",
+])
+def test_direct_negation_does_not_score(lexicon, text):
+    result = lexicon.scan(text)
+    assert result["score"] == 0
+    assert result["matches"] and all(m["negated"] for m in result["matches"])
+
+
+def test_score_combines_distinct_terms(lexicon):
+    assert lexicon.scan("")["score"] == 0
+    assert lexicon.scan("今天天气不错")["matches"] == []
+    once = lexicon.scan("好绝望")["score"]
+    assert lexicon.scan("好绝望，真的绝望")["score"] == once
+    assert lexicon.scan("好绝望，好孤独")["score"] > once
+    assert lexicon.has_match(["你好", "我想死"])
+    assert not lexicon.has_match(["你好", "我不想死"])
+
+
+def _naive(patterns, text):
+    return sorted((i, index) for index, p in enumerate(patterns) for i in range(len(text)) if text.startswith(p, i))
+
+
+@pytest.mark.parametrize("dfa_limit", [0, 500000])
+def test_matcher_agrees_with_naive_search(dfa_limit):
+    rng = random.Random(7)
+    patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(30)]
+    matcher = AhoCorasick(patterns, dfa_limit=dfa_limit)
+    for _ in range(50):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 40)))
+        assert sorted(matcher.iter_matches(text)) == _naive(matcher.patterns, text)
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"terms": {"危险词": 0.5}, "negations": ["并非"]}, ensure_ascii=False), encoding="utf-8")
+    lexicon = DangerLexicon.from_file(str(path))
+    assert lexicon.scan("这是危险词")["score"] == 0.5
+    assert lexicon.scan("这并非危险词")["score"] == 0
+    assert load_lexicon(str(tmp_path / "missing.json")).terms == DangerLexicon().terms
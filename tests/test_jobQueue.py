@@ -0,0 +1,102 @@
+import queue
+import threading
+import pytest
+from src.services.jobQueue import JobQueue, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED
+from src.services.recordStore import JsonlStore
+
+
+def _wait_for(job_queue, job_id, statuses=(STATUS_DONE, STATUS_FAILED), timeout=5):
+    done = threading.Event()
+
+    def listener(job):
+        if job["id"] == job_id and job["status"] in statuses:
+            done.set()
+
+    job_queue.add_listener(listener)
+    current = job_queue.get(job_id)
+    if current is None or current["status"] not in statuses:
+        assert done.wait(timeout)
+    return job_queue.get(job_id)
+
+
+def test_job_runs_and_records_result(tmp_path):
+    jobs = JobQueue(JsonlStore(str(tmp_path / "jobs.jsonl")), workers=1)
+    jobs.register("echo", lambda payload: {"value": payload["value"] * 2})
+    jobs.start()
+    job = jobs.submit("echo", {"value": 21}, user_id="u")
+    finished = _wait_for(jobs, job["id"])
+    assert finished["status"] == STATUS_DONE
+    assert finished["result"] == {"value": 42}
+    assert "payload" not in finished
+    jobs.shutdown(wait=True)
+
+
+def test_handler_exception_marks_job_failed(tmp_path):
+    jobs = JobQueue(JsonlStore(str(tmp_path / "jobs.jsonl")), workers=1)
+
+    def boom(payload):
+        raise RuntimeError("上游失败")
+
+    jobs.register("boom", boom)
+    jobs.start()
+    finished = _wait_for(jobs, jobs.submit("boom", {})["id"])
+    assert finished["status"] == STATUS_FAILED
+    assert finished["error"] == "上游失败"
+    jobs.shutdown(wait=True)
+
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.jsonl")
+    first = JobQueue(JsonlStore(path), workers=1)
+    first.register("echo", lambda payload: payload)
+    # 未启动工作线程：任务停留在 queued 状态，模拟进程在执行前退出
+    job = first.submit("echo", {"n": 1})
+    assert first.get(job["id"])["status"] == STATUS_QUEUED
+
+    second = JobQueue(JsonlStore(path), workers=1)
+    seen = []
+    second.register("echo", lambda payload: seen.append(payload) or payload)
+    second.start()
+    finished = _wait_for(second, job["id"])
+    assert finished["status"] == STATUS_DONE
+    assert seen == [{"n": 1}]
+    second.shutdown(wait=True)
+
+
+def test_submit_rejects_when_full(tmp_path):
+    jobs = JobQueue(JsonlStore(str(tmp_path / "jobs.jsonl")), workers=1, max_pending=1)
+    jobs.register("echo", lambda payload: payload)
+    jobs.submit("echo", {})
+    with pytest.raises(queue.Full):
+        jobs.submit("echo", {})
+    assert jobs.stats()["jobs"][STATUS_FAILED] == 1
+
+
+def test_unknown_kind_is_rejected(tmp_path):
+    jobs = JobQueue(JsonlStore(str(tmp_path / "jobs.jsonl")))
+    with pytest.raises(ValueError):
+        jobs.submit("missing", {})
+
+
+def test_payload_is_written_once(tmp_path):
+    path = str(tmp_path / "jobs.jsonl")
+    jobs = JobQueue(JsonlStore(path), workers=1)
+    jobs.register("echo", lambda payload: len(payload["history"]))
+    jobs.start()
+    job = jobs.submit("echo", {"history": ["很长的历史"] * 100}, user_id="u")
+    _wait_for(jobs, job["id"])
+    jobs.shutdown(wait=True)
+    records = JsonlStore(path).read_all()
+    assert [r for r in records if "payload" in r] == [records[0]]
+    assert all(set(r) == {"id", "status", "result", "error", "started_at", "finished_at", "timestamp"}
+               for r in records[1:])
+
+    # 重启后合并提交记录与最新状态，并压缩为每个任务两条记录
+    reloaded = JobQueue(JsonlStore(path), workers=1)
+    reloaded.register("echo", lambda payload: payload)
+    reloaded.start()
+    restored = reloaded.get(job["id"])
+    assert (restored["status"], restored["result"], restored["user_id"], restored["type"]) == (STATUS_DONE, 100, "u", "echo")
+    assert restored["timestamp"] == job["timestamp"]
+    assert len(JsonlStore(path).read_all()) == 2
+    reloaded.shutdown(wait=True)
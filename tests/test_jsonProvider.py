@@ -0,0 +1,32 @@
+import json
+import pytest
+
+webapp = pytest.importorskip("src.webapp")
+from flask import Flask, jsonify
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = webapp.FastJSONProvider(app)
+    return app
+
+
+def test_jsonify_is_compact_and_keeps_non_ascii(app):
+    with app.app_context():
+        body = jsonify({"b": 1, "a": "中文"}).get_data(as_text=True)
+    assert json.loads(body) == {"b": 1, "a": "中文"}
+    assert "中文" in body and ", " not in body
+
+
+def test_dump_arguments_are_honoured(app):
+    data = {"b": 1, "a": "中文"}
+    assert app.json.dumps(data, sort_keys=True, indent=2) == json.dumps(data, sort_keys=True, indent=2, ensure_ascii=False)
+    app.debug = True
+    with app.app_context():
+        body = jsonify(data).get_data(as_text=True)
+    assert "\n" in body
+
+
+def test_loads(app):
+    assert app.json.loads('{"a": 1}') == {"a": 1}
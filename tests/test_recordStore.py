@@ -0,0 +1,101 @@
+import pytest
+
+from src.services.recordStore import JsonArrayStore, JsonlStore
+
+
+def _rec(i, second):
+    return {"id": i, "timestamp": f"2024-01-01T00:00:{second:02d}"}
+
+
+def _ids(records):
+    return [r["id"] for r in records]
+
+
+def test_iter_ordered_streams_when_in_order(tmp_path):
+    store = JsonlStore(str(tmp_path / "a.jsonl"))
+    store.extend([_rec(1, 1), _rec(2, 2)])
+    store.append(_rec(3, 3))
+    assert _ids(store.iter_ordered()) == [1, 2, 3]
+    assert store._order.ordered
+
+
+def test_iter_ordered_sorts_out_of_order_appends(tmp_path):
+    store = JsonlStore(str(tmp_path / "a.jsonl"))
+    store.append(_rec(1, 5))
+    assert _ids(store.iter_ordered()) == [1]
+    # 先取时间后追加的并发写入
+    store.append(_rec(2, 3))
+    store.append(_rec(3, 6))
+    assert _ids(store.iter_ordered()) == [2, 1, 3]
+
+
+def test_iter_ordered_checks_existing_file(tmp_path):
+    path = str(tmp_path / "a.jsonl")
+    JsonlStore(path).extend([_rec(1, 9), _rec(2, 1), _rec(3, 5)])
+    assert _ids(JsonlStore(path).iter_ordered()) == [2, 3, 1]
+
+
+def test_replace_with_unsorted_input(tmp_path):
+    store = JsonlStore(str(tmp_path / "a.jsonl"))
+    store.append(_rec(1, 1))
+    store.replace([_rec(2, 8), _rec(3, 2)])
+    assert _ids(store.iter_ordered()) == [3, 2]
+    store.replace([_rec(4, 1), _rec(5, 2)])
+    assert _ids(store.iter_ordered()) == [4, 5]
+
+
+def test_equal_timestamps_keep_write_order(tmp_path):
+    store = JsonlStore(str(tmp_path / "a.jsonl"))
+    store.extend([_rec(1, 5), _rec(2, 1), _rec(3, 1)])
+    assert _ids(store.iter_ordered()) == [2, 3, 1]
+
+
+def test_json_array_store(tmp_path):
+    store = JsonArrayStore(str(tmp_path / "a.json"))
+    store.extend([_rec(1, 4), _rec(2, 2), _rec(3, 3)])
+    assert _ids(store.iter_ordered()) == [2, 3, 1]
+
+
+def test_msgpack_store(tmp_path):
+    # msgpack 是可选依赖
+    pytest.importorskip("msgpack")
+    from src.services.msgpackRecordStore import MsgpackRecordStore
+    store = MsgpackRecordStore(str(tmp_path / "a.msgpack"))
+    store.extend([_rec(1, 4), _rec(2, 2), _rec(3, 3)])
+    assert _ids(store.iter_ordered()) == [2, 3, 1]
+
+
+def test_sharded_merge_with_unsorted_shard(tmp_path):
+    from src.services.shardedRecordStore import ShardIndex, ShardedRecordStore
+    store = ShardedRecordStore(ShardIndex(str(tmp_path / "users")), "chats",
+                               lambda shard_dir, name: JsonlStore(f"{shard_dir}/{name}.jsonl"))
+    store.extend([dict(_rec(1, 9), user_id="a"), dict(_rec(2, 1), user_id="a"), dict(_rec(3, 5), user_id="b")])
+    assert _ids(store.iter_ordered()) == [2, 3, 1]
+
+
+def test_sqlite_upsert_matches_records_without_type(tmp_path):
+    from src.services.sqliteRecordStore import SqliteRecordStore
+    store = SqliteRecordStore(str(tmp_path / "data.db"), "signals")
+    store.upsert({"id": "s1", "user_id": "u", "timestamp": "2024-01-01T00:00:00", "status": "new"})
+    store.upsert({"id": "s1", "user_id": "u", "timestamp": "2024-01-01T00:00:00", "status": "done"})
+    assert [r["status"] for r in store.iter_records()] == ["done"]
+    store.close()
+
+
+def test_sqlite_close_closes_connections_of_all_threads(tmp_path):
+    import sqlite3
+    import threading
+    from src.services.sqliteRecordStore import SqliteRecordStore
+    store = SqliteRecordStore(str(tmp_path / "data.db"), "chats")
+    conns = [store._conn()]
+    worker = threading.Thread(target=lambda: (store.append(_rec(1, 1)), conns.append(store._conn())))
+    worker.start()
+    worker.join()
+    assert len({id(c) for c in conns}) == 2
+    store.close()
+    for conn in conns:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # 关闭后仍可重新连接
+    assert store.count() == 1
+    store.close()
@@ -0,0 +1,47 @@
+import os
+from datetime import datetime, timedelta
+from src.services.recordStore import JsonlStore, create_record_store
+from src.services.retentionService import RetentionPolicy, RetentionService
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def _write(path, ages_days):
+    store = JsonlStore(path)
+    store.extend({"id": i, "user_id": "u", "timestamp": (NOW - timedelta(days=age)).isoformat()}
+                 for i, age in enumerate(ages_days))
+    store.close()
+
+
+def test_age_rotation_keeps_recent_records(tmp_path):
+    data_dir = str(tmp_path)
+    _write(os.path.join(data_dir, "chats.jsonl"), [45, 40, 31, 10, 1, 0])
+    service = RetentionService(data_dir, RetentionPolicy(max_segment_age_days=30), backend="jsonl")
+    segment = service.rotate("chats", now=NOW)
+    assert segment is not None
+    assert [r["id"] for r in JsonlStore(segment).read_all()] == [0, 1, 2]
+    active = create_record_store("jsonl", data_dir, "chats")
+    assert [r["id"] for r in active.read_all()] == [3, 4, 5]
+    # 新写入仍追加到活动文件
+    active.append({"id": 6, "user_id": "u", "timestamp": NOW.isoformat()})
+    assert [r["id"] for r in active.read_all()] == [3, 4, 5, 6]
+    # 剩余记录都未超期，不再轮转
+    assert service.rotate("chats", now=NOW) is None
+
+
+def test_size_rotation_keeps_min_active_days(tmp_path):
+    data_dir = str(tmp_path)
+    _write(os.path.join(data_dir, "emotions.jsonl"), [20, 8, 3, 0])
+    policy = RetentionPolicy(max_segment_bytes=1, max_segment_age_days=30, min_active_days=7)
+    segment = RetentionService(data_dir, policy, backend="jsonl").rotate("emotions", now=NOW)
+    assert [r["id"] for r in JsonlStore(segment).read_all()] == [0, 1]
+    assert [r["id"] for r in JsonlStore(os.path.join(data_dir, "emotions.jsonl")).read_all()] == [2, 3]
+
+
+def test_signals_are_not_rotated(tmp_path):
+    data_dir = str(tmp_path)
+    _write(os.path.join(data_dir, "signals.jsonl"), [60, 0])
+    service = RetentionService(data_dir, RetentionPolicy(max_segment_age_days=30), backend="jsonl")
+    service.run_once(now=NOW)
+    assert len(JsonlStore(os.path.join(data_dir, "signals.jsonl")).read_all()) == 2
+    assert not os.path.isdir(service.segments_dir) or not os.listdir(service.segments_dir)
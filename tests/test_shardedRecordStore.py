@@ -0,0 +1,58 @@
+from src.services.recordStore import JsonlStore
+from src.services.shardedRecordStore import ANONYMOUS_DIR, ShardIndex, ShardedRecordStore, shard_dir_name
+
+
+def test_shard_dir_names_are_case_insensitive_unique():
+    names = {shard_dir_name(u) for u in ("alice", "Alice", "ALICE", "aLice")}
+    assert len({n.lower() for n in names}) == 4
+    assert shard_dir_name("alice") == "alice"
+    assert shard_dir_name("Alice").startswith("_alice.")
+
+
+def test_special_and_empty_ids():
+    assert shard_dir_name("") == ANONYMOUS_DIR
+    assert shard_dir_name("张三").startswith("_h")
+    assert shard_dir_name("../etc").startswith("_h")
+
+
+def test_users_differing_in_case_keep_separate_shards(tmp_path):
+    store = ShardedRecordStore(ShardIndex(str(tmp_path / "users")), "chats",
+                               lambda shard_dir, name: JsonlStore(f"{shard_dir}/{name}.jsonl"))
+    store.append({"user_id": "Alice", "timestamp": "2024-01-01T00:00:01", "message": "A"})
+    store.append({"user_id": "alice", "timestamp": "2024-01-01T00:00:02", "message": "a"})
+    assert [r["message"] for r in store.query(user_id="Alice")] == ["A"]
+    assert [r["message"] for r in store.query(user_id="alice")] == ["a"]
+
+
+def _store(tmp_path):
+    return ShardedRecordStore(ShardIndex(str(tmp_path / "users")), "chats",
+                              lambda shard_dir, name: JsonlStore(f"{shard_dir}/{name}.jsonl"))
+
+
+def test_cursor_is_stable_when_a_shard_appears_between_pages(tmp_path):
+    store = _store(tmp_path)
+    for user_id in ("a", "c"):
+        for second in (1, 2, 3):
+            store.append({"user_id": user_id, "timestamp": f"2024-01-01T00:00:0{second}", "message": f"{user_id}{second}"})
+    page, cursor = store.query_page(limit=3)
+    assert [r["message"] for r in page] == ["a1", "c1", "a2"]
+    # 翻页之间出现新用户的分片，排在已返回记录之前的新记录不影响后续页
+    store.append({"user_id": "b", "timestamp": "2024-01-01T00:00:01", "message": "b1"})
+    store.append({"user_id": "b", "timestamp": "2024-01-01T00:00:03", "message": "b3"})
+    page, cursor = store.query_page(limit=3, cursor=cursor)
+    assert [r["message"] for r in page] == ["c2", "a3", "b3"]
+    page, cursor = store.query_page(limit=3, cursor=cursor)
+    assert ([r["message"] for r in page], cursor) == (["c3"], None)
+
+
+def test_descending_pages_cover_every_record(tmp_path):
+    store = _store(tmp_path)
+    for i, user_id in enumerate(("x", "y", "x", "y", "x")):
+        store.append({"user_id": user_id, "timestamp": "2024-01-01T00:00:00", "message": str(i)})
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.query_page(limit=2, cursor=cursor, descending=True)
+        seen.extend(r["message"] for r in page)
+        if cursor is None:
+            break
+    assert sorted(seen) == ["0", "1", "2", "3", "4"] and len(seen) == 5
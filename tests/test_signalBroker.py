@@ -0,0 +1,52 @@
+from src.services.signalBroker import SignalBroker, EVENT_SIGNAL, EVENT_RESET
+
+
+def test_reconnect_replays_events_after_last_id():
+    broker = SignalBroker()
+    first = broker.publish(EVENT_SIGNAL, {"id": 1})
+    broker.publish(EVENT_SIGNAL, {"id": 2})
+    subscription, backlog = broker.subscribe(first)
+    assert [data["id"] for _, _, data in backlog] == [2]
+    subscription.close()
+    assert broker.subscriber_count() == 0
+
+
+def test_new_events_reach_subscribers():
+    broker = SignalBroker()
+    subscription, backlog = broker.subscribe()
+    assert backlog == []
+    event_id = broker.publish(EVENT_SIGNAL, {"id": 1})
+    assert subscription.get(timeout=1.0) == (event_id, EVENT_SIGNAL, {"id": 1})
+    assert subscription.get(timeout=0.01) is None
+
+
+def test_id_from_previous_process_is_not_resumed():
+    before = SignalBroker()
+    for i in range(3):
+        stale = before.publish(EVENT_SIGNAL, {"id": i})
+    # 重启后的序号与重启前的ID重合，也不能据此补发
+    after = SignalBroker()
+    for i in range(5):
+        after.publish(EVENT_SIGNAL, {"id": i})
+    assert stale.endswith("-3") and stale != after.format_id(3)
+    _, backlog = after.subscribe(stale)
+    assert [event_type for _, event_type, _ in backlog] == [EVENT_RESET]
+    _, backlog = after.subscribe("57")
+    assert [event_type for _, event_type, _ in backlog] == [EVENT_RESET]
+
+
+def test_id_older_than_buffer_gets_reset():
+    broker = SignalBroker(buffer_size=2)
+    first = broker.publish(EVENT_SIGNAL, {"id": 1})
+    for i in range(2, 5):
+        broker.publish(EVENT_SIGNAL, {"id": i})
+    _, backlog = broker.subscribe(first)
+    assert [event_type for _, event_type, _ in backlog] == [EVENT_RESET]
+
+
+def test_overflow_turns_into_reset():
+    broker = SignalBroker(max_pending=1)
+    subscription, _ = broker.subscribe()
+    broker.publish(EVENT_SIGNAL, {"id": 1})
+    broker.publish(EVENT_SIGNAL, {"id": 2})
+    assert subscription.get(timeout=0.01)[1] == EVENT_RESET
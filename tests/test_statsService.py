@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+import pytest
+
+from src.services.dataService import DataService
+from src.services.statsService import StatsService
+
+
+def _chat(i, role="user"):
+    return {"type": "chat", "user_id": "u", "role": role, "message": str(i), "timestamp": f"2024-01-01T00:00:{i:02d}"}
+
+
+def test_write_during_rebuild_is_counted_once():
+    stored = [_chat(1), _chat(2)]
+    stats = StatsService({"chat": lambda: scan()})
+
+    def scan():
+        # 扫描到一半时有新记录写入：已写入存储、稍后会被扫描读到
+        yield stored[0]
+        late = _chat(3)
+        stored.append(late)
+        stats.on_record("chat", late)
+        yield from stored[1:]
+
+    stats.rebuild("chat")
+    assert stats.snapshot()["totals"]["chat"] == 3
+
+
+def test_write_missed_by_snapshot_scan_is_kept():
+    stored = [_chat(1), _chat(2)]
+    stats = StatsService({"chat": lambda: scan()})
+
+    def scan():
+        # 来源是扫描开始时的快照，读不到扫描期间的写入
+        snapshot = list(stored)
+        late = _chat(3, role="assistant")
+        stored.append(late)
+        stats.on_record("chat", late)
+        yield from snapshot
+
+    stats.rebuild("chat")
+    snapshot = stats.snapshot()
+    assert snapshot["totals"]["chat"] == 3
+    assert snapshot["chat_roles"] == {"user": 2, "assistant": 1}
+    stats.rebuild("chat")
+    assert stats.snapshot()["totals"]["chat"] == 3
+
+
+def test_counts_follow_saves_and_clears(tmp_path):
+    data = DataService(str(tmp_path), backend="jsonl")
+    stats = StatsService({"chat": data.iter_chats, "emotion": data.iter_emotions})
+    data.add_listener(stats.on_record)
+    stats.rebuild()
+    data.save_chat("a", "你好")
+    data.save_chat("a", "在吗", role="assistant")
+    data.save_chat("b", "嗨")
+    data.save_emotion({"user_id": "a", "dominant_emotion": "sad", "emotions": {"sad": 0.9}})
+    snapshot = stats.snapshot()
+    assert snapshot["totals"] == {"chat": 3, "emotion": 1, "signal": 0}
+    assert snapshot["depression_count"] == 1
+
+    data.clear_chats("a")
+    snapshot = stats.snapshot()
+    assert snapshot["totals"]["chat"] == 1
+    assert snapshot["chat_roles"] == {"user": 1}
+    data.clear_emotions()
+    assert stats.snapshot()["totals"]["emotion"] == 0
+    assert stats.snapshot()["dominant_emotions"] == {}
+
+
+def test_api_stats_reflects_clear(tmp_path):
+    webapp = pytest.importorskip("src.webapp")
+    from flask import Flask
+    data = DataService(str(tmp_path), backend="jsonl")
+    stats = StatsService({"chat": data.iter_chats})
+    data.add_listener(stats.on_record)
+    app = SimpleNamespace(statsService=stats)
+    data.save_chat("a", "你好")
+    data.save_chat("b", "嗨")
+    with Flask(__name__).test_request_context("/api/stats?hours=1"):
+        assert webapp.WebApp.getStats(app).get_json()["totals"]["chat"] == 2
+        data.clear_chats()
+        body = webapp.WebApp.getStats(app).get_json()
+    assert body["totals"]["chat"] == 0 and body["hourly"] == {}
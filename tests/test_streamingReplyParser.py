@@ -0,0 +1,102 @@
+import json
+import random
+from src.services.streamingReplyParser import StreamingReplyParser
+
+
+def _parse(chunks):
+    parser = StreamingReplyParser()
+    out = "".join(parser.feed(c) for c in chunks) + parser.finish()
+    return out, parser
+
+
+def _chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_plain_text_is_streamed_unchanged():
+    parser = StreamingReplyParser()
+    assert parser.feed("你好，") == "你好，"
+    assert parser.feed("今天怎么样？") == "今天怎么样？"
+    assert parser.finish() == ""
+    assert parser.type is None
+
+
+def test_plain_text_with_braces_and_backticks():
+    text = "集合写作 {1, 2}，代码用 `x` 表示。"
+    for size in (1, 2, 5, len(text)):
+        out, parser = _parse(_chunked(text, size))
+        assert out == text
+        assert parser.type is None
+
+
+def test_json_reply_message_and_type():
+    reply = json.dumps({"type": "dangerous", "message": "请联系身边的人"}, ensure_ascii=False)
+    for size in range(1, 8):
+        out, parser = _parse(_chunked(reply, size))
+        assert out == "请联系身边的人"
+        assert parser.dangerous
+
+
+def test_type_known_before_message_finishes():
+    parser = StreamingReplyParser()
+    parser.feed('{"type": "dangerous", "message": "第一')
+    assert parser.dangerous
+
+
+def test_split_unicode_escapes():
+    reply = '{"type": "normal", "message": "\\u4f60\\u597d\\n"}'
+    for size in range(1, 10):
+        out, parser = _parse(_chunked(reply, size))
+        assert out == "你好\n"
+        assert parser.type == "normal"
+
+
+def test_surrogate_pairs():
+    reply = json.dumps({"type": "normal", "message": "加油😀!"})  # ensure_ascii 输出 \ud83d\ude00
+    assert "\\ud83d" in reply
+    for size in range(1, 10):
+        out, _ = _parse(_chunked(reply, size))
+        assert out == "加油😀!"
+
+
+def test_fenced_json():
+    reply = '```json\n{"type": "dangerous", "message": "别怕"}\n```'
+    for size in range(1, 6):
+        out, parser = _parse(_chunked(reply, size))
+        assert out == "别怕"
+        assert parser.dangerous
+
+
+def test_prefixed_json():
+    reply = '好的 {"type":"dangerous","message":"我在这里陪你"}'
+    for size in range(1, 6):
+        out, parser = _parse(_chunked(reply, size))
+        assert out == "好的 我在这里陪你"
+        assert parser.dangerous
+
+
+def test_prefixed_fenced_json():
+    reply = '收到。\n```json\n{"type": "dangerous", "message": "先深呼吸"}\n```'
+    out, parser = _parse(_chunked(reply, 3))
+    assert out == "收到。\n先深呼吸"
+    assert parser.dangerous
+
+
+def test_json_without_message_falls_back_to_raw():
+    out, parser = _parse(['{"type": "normal", ', '"text": "x"}'])
+    assert out == '{"type": "normal", "text": "x"}'
+    assert parser.type == "normal"
+
+
+def test_random_chunking_matches_whole():
+    rng = random.Random(0)
+    reply = '前言 ' + json.dumps({"message": "第一行\n第二行 \"引号\" \\ 😀", "type": "normal"})
+    expected, _ = _parse([reply])
+    for _ in range(50):
+        chunks, pos = [], 0
+        while pos < len(reply):
+            step = rng.randint(1, 7)
+            chunks.append(reply[pos:pos + step])
+            pos += step
+        assert _parse(chunks)[0] == expected
+    assert expected == '前言 第一行\n第二行 "引号" \\ 😀'
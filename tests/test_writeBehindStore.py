@@ -0,0 +1,70 @@
+import threading
+import time
+from src.services.recordStore import JsonlStore
+from src.services.writeBehindStore import WriteBehindStore
+
+
+def _store(tmp_path, **kwargs):
+    kwargs.setdefault("flush_interval", 0.05)
+    return WriteBehindStore(JsonlStore(str(tmp_path / "records.jsonl")), **kwargs)
+
+
+def test_read_sees_own_writes(tmp_path):
+    store = _store(tmp_path)
+    for i in range(10):
+        store.append({"id": i, "timestamp": f"2024-01-01T00:00:{i:02d}"})
+    assert [r["id"] for r in store.read_all()] == list(range(10))
+    store.close()
+
+
+def test_flush_not_blocked_by_steady_writes(tmp_path):
+    store = _store(tmp_path)
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            store.append({"id": i, "timestamp": "2024-01-01T00:00:00"})
+            i += 1
+            time.sleep(0.0005)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        time.sleep(0.1)
+        start = time.monotonic()
+        for _ in range(5):
+            store.read_all()
+        assert time.monotonic() - start < 3
+    finally:
+        stop.set()
+        thread.join()
+        store.close()
+
+
+def test_writes_after_close_are_not_lost(tmp_path):
+    store = _store(tmp_path)
+    store.append({"id": 1, "timestamp": "2024-01-01T00:00:01"})
+    store.close()
+    store.append({"id": 2, "timestamp": "2024-01-01T00:00:02"})
+    store.upsert({"id": 3, "timestamp": "2024-01-01T00:00:03"})
+    assert sorted(r["id"] for r in JsonlStore(str(tmp_path / "records.jsonl")).read_all()) == [1, 2, 3]
+
+
+def test_close_drains_concurrent_appends(tmp_path):
+    store = _store(tmp_path)
+    barrier = threading.Barrier(5)
+
+    def writer(base):
+        barrier.wait()
+        for i in range(200):
+            store.append({"id": base + i, "timestamp": "2024-01-01T00:00:00"})
+
+    threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    store.close()
+    for thread in threads:
+        thread.join()
+    assert len(JsonlStore(str(tmp_path / "records.jsonl")).read_all()) == 800